@@ -1,3 +1,24 @@
 from django.contrib import admin
 
-# Register your models here.
+from . import chamadas_llm
+from .models import ChamadaLLM
+
+
+@admin.register(ChamadaLLM)
+class ChamadaLLMAdmin(admin.ModelAdmin):
+    list_display = ["criado_em", "modelo", "acerto_cache", "tokens_entrada", "tokens_saida", "latencia_ms", "custo_usd", "user"]
+    list_filter = ["acerto_cache", "modelo", "criado_em"]
+    date_hierarchy = "criado_em"
+    list_select_related = ["user"]
+    readonly_fields = [f.name for f in ChamadaLLM._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        """Lista normal com o resumo por dia (custo, acertos, p95) dos filtros aplicados."""
+        resposta = super().changelist_view(request, extra_context)
+        changelist = getattr(resposta, "context_data", {}).get("cl")
+        if changelist is not None:
+            resposta.context_data["resumo_diario"] = chamadas_llm.resumo_diario(changelist.queryset)
+        return resposta
@@ -0,0 +1,282 @@
+"""
+Teste de carga das views principais contra o TMDb e a IA falsos
+(``core.benchmarks.upstream``), usado pelo comando ``benchmark``.
+
+Cada cenário é uma requisição completa pelo ``django.test.Client`` (todos os
+middlewares, inclusive ``core.metricas``). Para cada nível de concorrência,
+N threads disparam as requisições do cenário até completar o total; as
+contagens de SQL, TMDb e IA de cada requisição saem do cabeçalho
+``Server-Timing``. O relatório é um dict pronto para JSON, com o commit e
+os parâmetros, para comparar rodadas entre commits (``comparar``).
+"""
+import itertools
+import json
+import math
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from core.models import FilmeAssistido
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TERMOS = ["matrix", "alien", "amelie", "batman", "toy story", "up", "her", "parasita"]
+DADOS_PERSONA = {"nome": "Carga", "humor": "feliz", "tempo_disponivel": "medio", "anos": "todos"}
+GENEROS = ["ação", "drama", "comédia", "terror", "romance", "ficção científica"]
+
+CENARIOS = {}
+
+
+def cenario(nome):
+    def registrar(funcao):
+        CENARIOS[nome] = funcao
+        return funcao
+    return registrar
+
+
+@cenario("buscar_filme")
+def _buscar_filme(cliente, i):
+    return cliente.get("/buscar_filme/", {"q": TERMOS[i % len(TERMOS)]})
+
+
+@cenario("movie_details")
+def _movie_details(cliente, i):
+    return cliente.get("/movie_details/", {"tmdb_id": i % 50 + 1})
+
+
+@cenario("persona_view")
+def _persona_view(cliente, i):
+    return cliente.post("/persona/", {**DADOS_PERSONA, "genero_favorito": GENEROS[i % len(GENEROS)]})
+
+
+@cenario("marcar_assistido_api")
+def _marcar_assistido(cliente, i):
+    corpo = {"titulo": f"Filme {i % 200 + 1}", "nota": i % 5 + 1, "tmdb_id": i % 200 + 1}
+    return cliente.post("/marcar_assistido/", json.dumps(corpo), content_type="application/json")
+
+
+@cenario("dashboard_view")
+def _dashboard_view(cliente, i):
+    return cliente.get("/meu-perfil/")
+
+
+def percentil(valores, p):
+    """Percentil por posição mais próxima (valores já ordenados)."""
+    if not valores:
+        return 0.0
+    return valores[min(len(valores), max(1, math.ceil(p / 100 * len(valores)))) - 1]
+
+
+def ler_server_timing(cabecalho):
+    """'sql;dur=3.1;desc="4x", total;dur=9' -> {"sql": (4, 3.1), "total": (1, 9.0)}."""
+    fases = {}
+    for parte in filter(None, (p.strip() for p in (cabecalho or "").split(","))):
+        nome, *atributos = parte.split(";")
+        valores = dict(a.split("=", 1) for a in atributos if "=" in a)
+        vezes = valores.get("desc", '"1x"').strip('"').split("x")[0]
+        fases[nome] = (int(vezes) if vezes.isdigit() else 1, float(valores.get("dur", 0)))
+    return fases
+
+
+def _rss_mb():
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KiB, macOS em bytes.
+    return round(pico / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+
+
+def preparar_usuarios(quantidade, filmes_por_usuario=20):
+    """Usuários de carga, cada um com um histórico próprio (prompts distintos)."""
+    senha = make_password(None)
+    usuarios = User.objects.bulk_create([
+        User(username=f"carga{i}", password=senha) for i in range(quantidade)
+    ])
+    FilmeAssistido.objects.bulk_create([
+        FilmeAssistido(user=u, titulo=f"Filme {(i * 7 + j) % 300 + 1}", tmdb_id=(i * 7 + j) % 300 + 1, nota=j % 5 + 1)
+        for i, u in enumerate(usuarios)
+        for j in range(filmes_por_usuario)
+    ])
+    return usuarios
+
+
+def medir(nome, requisicoes, concorrencia, usuarios, memoria=False):
+    """Roda ``requisicoes`` chamadas do cenário com ``concorrencia`` threads."""
+    executar = CENARIOS[nome]
+    contador = itertools.count()
+    medidas, erros = [], []
+    lock = threading.Lock()
+
+    def trabalhador(numero):
+        cliente = Client()
+        cliente.force_login(usuarios[numero % len(usuarios)])
+        try:
+            while (i := next(contador)) < requisicoes:
+                inicio = time.perf_counter()
+                try:
+                    resposta = executar(cliente, i)
+                except Exception as e:
+                    with lock:
+                        erros.append(repr(e))
+                    continue
+                duracao = time.perf_counter() - inicio
+                with lock:
+                    if resposta.status_code >= 400:
+                        erros.append(resposta.status_code)
+                    medidas.append((duracao, ler_server_timing(resposta.get("Server-Timing"))))
+        finally:
+            connections.close_all()
+
+    if memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=trabalhador, args=(n,)) for n in range(concorrencia)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+    pico = tracemalloc.get_traced_memory()[1] if memoria else None
+    if memoria:
+        tracemalloc.stop()
+
+    latencias = sorted(m[0] * 1000 for m in medidas)
+    feitas = max(1, len(medidas))
+
+    def media(fase, indice):
+        return round(sum(m[1].get(fase, (0, 0.0))[indice] for m in medidas) / feitas, 2)
+
+    return {
+        "concorrencia": concorrencia,
+        "requisicoes": len(medidas),
+        "erros": len(erros),
+        "exemplos_de_erro": [str(e) for e in erros[:3]],
+        "rps": round(len(medidas) / duracao, 1),
+        "p50_ms": round(percentil(latencias, 50), 1),
+        "p95_ms": round(percentil(latencias, 95), 1),
+        "p99_ms": round(percentil(latencias, 99), 1),
+        "max_ms": round(latencias[-1], 1) if latencias else 0.0,
+        "sql_por_requisicao": media("sql", 0),
+        "sql_ms_por_requisicao": media("sql", 1),
+        "tmdb_por_requisicao": media("tmdb", 0),
+        "llm_por_requisicao": media("llm", 0),
+        "pico_tracemalloc_mb": round(pico / 2**20, 1) if pico is not None else None,
+        "rss_maximo_mb": _rss_mb(),
+    }
+
+
+@contextmanager
+def banco_temporario():
+    """
+    Banco de teste em arquivo (não em memória), para que as threads
+    escrevam de verdade. No SQLite, as transações já começam com a trava de
+    escrita (IMMEDIATE) e esperam por ela, em vez de falhar com
+    "database is locked" ao disputar a promoção de leitura para escrita.
+    """
+    configuracao = connection.settings_dict
+    nome_original = configuracao["NAME"]
+    teste_original = dict(configuracao.get("TEST") or {})
+    opcoes_originais = dict(configuracao.get("OPTIONS") or {})
+    arquivo = tempfile.NamedTemporaryFile(prefix="benchmark-", suffix=".sqlite3", delete=False).name
+    if connection.vendor == "sqlite":
+        configuracao["TEST"] = {**teste_original, "NAME": arquivo}
+        configuracao["OPTIONS"] = {**opcoes_originais, "timeout": 30, "transaction_mode": "IMMEDIATE"}
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(nome_original, verbosity=0)
+        configuracao["TEST"], configuracao["OPTIONS"] = teste_original, opcoes_originais
+        if os.path.exists(arquivo):
+            os.remove(arquivo)
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def executar(cenarios, niveis, requisicoes, tmdb, ia, usuarios=20, memoria=False, aviso=None):
+    """
+    Roda os cenários em cada nível de concorrência contra ``tmdb`` e ``ia``
+    (servidores falsos já iniciados) e devolve o relatório.
+    """
+    relatorio = {
+        "commit": _commit(),
+        "data": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "parametros": {
+            "niveis": list(niveis), "requisicoes": requisicoes, "usuarios": usuarios,
+            "tmdb": {"latencia": tmdb.latencia, "taxa_falhas": tmdb.taxa_falhas},
+            "ia": {"latencia": ia.latencia, "taxa_falhas": ia.taxa_falhas},
+        },
+        "cenarios": {},
+    }
+    # Cache em arquivo próprio: nada de rodadas anteriores nem do servidor de desenvolvimento.
+    arquivo_cache = tempfile.NamedTemporaryFile(prefix="benchmark-cache-", suffix=".sqlite3", delete=False).name
+    ajustes = override_settings(
+        CACHES={"default": {**settings.CACHES["default"], "LOCATION": arquivo_cache}},
+        DEBUG=False,
+        ALLOWED_HOSTS=["*"],
+        TMDB_URL=tmdb.url,
+        TMDB_API_KEY="benchmark",
+        OPENROUTER_API_KEY="benchmark",
+        OPENROUTER_BASE_URL=f"{ia.url}/v1",
+        RECOMENDACOES_EM_SEGUNDO_PLANO=False,
+        CATALOGO_PATH="",
+        COLABORATIVO_DIR="",
+    )
+    try:
+        with banco_temporario(), ajustes:
+            contas = preparar_usuarios(usuarios)
+            for nome in cenarios:
+                relatorio["cenarios"][nome] = []
+                for nivel in niveis:
+                    resultado = medir(nome, requisicoes, nivel, contas, memoria=memoria)
+                    relatorio["cenarios"][nome].append(resultado)
+                    if aviso:
+                        aviso(nome, resultado)
+    finally:
+        for sufixo in ("", "-wal", "-shm"):
+            if os.path.exists(arquivo_cache + sufixo):
+                os.remove(arquivo_cache + sufixo)
+    relatorio["upstream"] = {"tmdb_chamadas": tmdb.chamadas, "ia_chamadas": ia.chamadas}
+    return relatorio
+
+
+def comparar(atual, anterior):
+    """Linhas com a variação de p95 e req/s entre dois relatórios."""
+    linhas = []
+    for nome, resultados in atual["cenarios"].items():
+        antes = {r["concorrencia"]: r for r in anterior.get("cenarios", {}).get(nome, [])}
+        for r in resultados:
+            a = antes.get(r["concorrencia"])
+            if not a:
+                continue
+            delta_p95 = (r["p95_ms"] - a["p95_ms"]) / a["p95_ms"] * 100 if a["p95_ms"] else 0.0
+            delta_rps = (r["rps"] - a["rps"]) / a["rps"] * 100 if a["rps"] else 0.0
+            linhas.append(
+                f"{nome:>22} c={r['concorrencia']:<3} p95 {a['p95_ms']:.0f}->{r['p95_ms']:.0f}ms "
+                f"({delta_p95:+.0f}%)  req/s {a['rps']:.0f}->{r['rps']:.0f} ({delta_rps:+.0f}%)"
+            )
+    return linhas
@@ -0,0 +1,213 @@
+"""
+Servidores HTTP falsos, em processo, que imitam as APIs externas usadas pelo
+app. Servem para medir as views sem depender (nem gastar cota) do TMDb ou
+da IA. Cada um tem latência fixa e uma taxa de falhas (HTTP 500) opcional,
+sorteada com semente para que as rodadas sejam reproduzíveis.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _Servidor(ThreadingHTTPServer):
+    daemon_threads = True
+    # O padrão (5) recusa conexões sob alta concorrência.
+    request_queue_size = 1024
+
+
+class _Falso:
+    """Base: servidor em thread própria, contador de chamadas, latência e falhas."""
+
+    def __init__(self, latencia=0.1, taxa_falhas=0.0, semente=0):
+        self.latencia = latencia
+        self.taxa_falhas = taxa_falhas
+        self.chamadas = 0
+        self.falhas = 0
+        self._sorteio = random.Random(semente)
+        self._lock = threading.Lock()
+        self._servidor = _Servidor(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, porta = self._servidor.server_address
+        return f"http://{host}:{porta}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    def _falhar(self):
+        with self._lock:
+            self.chamadas += 1
+            falhou = self._sorteio.random() < self.taxa_falhas
+            self.falhas += falhou
+        return falhou
+
+    def responder(self, metodo, caminho, params, corpo):
+        """(status, dados) ou (status, gerador de bytes) para respostas em streaming."""
+        raise NotImplementedError
+
+    def _handler(self):
+        falso = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _atender(self, metodo):
+                tamanho = int(self.headers.get("Content-Length") or 0)
+                corpo = json.loads(self.rfile.read(tamanho) or b"{}") if tamanho else {}
+                time.sleep(falso.latencia)
+                url = urlparse(self.path)
+                if falso._falhar():
+                    status, dados = 500, {"error": {"message": "falha simulada"}}
+                else:
+                    status, dados = falso.responder(metodo, url.path, parse_qs(url.query), corpo)
+
+                if isinstance(dados, (dict, list)):
+                    conteudo = json.dumps(dados).encode()
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(conteudo)))
+                    self.end_headers()
+                    self.wfile.write(conteudo)
+                    return
+
+                self.send_response(status)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for pedaco in dados:
+                    self.wfile.write(f"{len(pedaco):x}\r\n".encode() + pedaco + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                self._atender("GET")
+
+            def do_POST(self):
+                self._atender("POST")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class TMDbFalso(_Falso):
+    """
+    Imita /search/movie, /movie/{id} e /find/{imdb_id} do TMDb.
+
+    Uso:
+        with TMDbFalso(latencia=0.1) as tmdb:
+            settings.TMDB_URL = tmdb.url
+    """
+
+    def __init__(self, latencia=0.1, resultados_por_busca=8, taxa_falhas=0.0, semente=0):
+        super().__init__(latencia, taxa_falhas, semente)
+        self.resultados_por_busca = resultados_por_busca
+
+    def responder(self, metodo, caminho, params, corpo):
+        if caminho.endswith("/search/movie"):
+            termo = params.get("query", [""])[0]
+            return 200, {"results": [
+                {
+                    "id": i,
+                    "title": f"{termo} {i}",
+                    "release_date": "2001-01-01",
+                    "poster_path": f"/poster{i}.jpg",
+                    "popularity": 100 - i,
+                }
+                for i in range(1, self.resultados_por_busca + 1)
+            ]}
+        if "/find/" in caminho:
+            imdb_id = caminho.rsplit("/", 1)[1]
+            numero = int(imdb_id[2:]) if imdb_id[2:].isdigit() else 0
+            return 200, {"movie_results": [{"id": numero}] if numero else []}
+        if "/movie/" in caminho:
+            tmdb_id = int(caminho.rsplit("/", 1)[1])
+            return 200, {
+                "id": tmdb_id,
+                "title": f"Filme {tmdb_id}",
+                "original_title": f"Movie {tmdb_id}",
+                "release_date": "2001-01-01",
+                "runtime": 100 + tmdb_id % 60,
+                "genres": [{"name": "Drama"}],
+                "overview": "Sinopse de teste.",
+                "external_ids": {"imdb_id": f"tt{tmdb_id:07d}"},
+                "credits": {"cast": [], "crew": []},
+                "videos": {"results": []},
+            }
+        return 404, {"status_message": "not found"}
+
+
+class OpenAIFalso(_Falso):
+    """
+    Imita POST /v1/chat/completions de uma API compatível com a OpenAI
+    (OpenRouter), com e sem ``stream``. O conteúdo é sempre uma
+    ``ListaRecomendacoes`` em JSON com ``filmes`` títulos.
+
+    Uso:
+        with OpenAIFalso(latencia=0.5) as ia:
+            settings.OPENROUTER_BASE_URL = f"{ia.url}/v1"
+    """
+
+    def __init__(self, latencia=0.5, taxa_falhas=0.0, semente=0, filmes=5, modelo=None):
+        super().__init__(latencia, taxa_falhas, semente)
+        self.filmes = filmes
+        self.modelo = modelo
+        self.pedidos = []
+
+    def conteudo(self):
+        return json.dumps({"filmes": [
+            {"titulo": f"Filme {i}", "ano": 2001, "genero": "Drama", "duracao": 100 + i,
+             "motivo": "Combina com o seu perfil."}
+            for i in range(1, self.filmes + 1)
+        ]}, ensure_ascii=False)
+
+    def responder(self, metodo, caminho, params, corpo):
+        if not caminho.endswith("/chat/completions"):
+            return 404, {"error": {"message": "not found"}}
+        with self._lock:
+            self.pedidos.append(corpo)
+
+        modelo = self.modelo or corpo.get("model", "falso")
+        texto = self.conteudo()
+        prompt = sum(len(m.get("content") or "") for m in corpo.get("messages", [])) // 4
+        uso = {"prompt_tokens": prompt, "completion_tokens": len(texto) // 4,
+               "total_tokens": prompt + len(texto) // 4}
+        base = {"id": "chatcmpl-falso", "created": int(time.time()), "model": modelo}
+
+        if not corpo.get("stream"):
+            return 200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": texto}}],
+                "usage": uso,
+            }
+
+        def eventos():
+            passo = max(1, len(texto) // 20)
+            for i in range(0, len(texto), passo):
+                delta = {"content": texto[i:i + passo]}
+                if i == 0:
+                    delta["role"] = "assistant"
+                pedaco = {**base, "object": "chat.completion.chunk", "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": None},
+                ]}
+                yield f"data: {json.dumps(pedaco)}\n\n".encode()
+            fim = {**base, "object": "chat.completion.chunk",
+                   "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(fim)}\n\n".encode()
+            if (corpo.get("stream_options") or {}).get("include_usage"):
+                yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': uso})}\n\n".encode()
+            yield b"data: [DONE]\n\n"
+
+        return 200, eventos()
@@ -0,0 +1,312 @@
+"""
+Backend de cache do Django em duas camadas, compartilhado entre processos.
+
+- L1: LRU em memória, um por processo (``L1_MAX_ENTRADAS`` entradas, cada
+  uma vale no máximo ``L1_TTL`` segundos);
+- L2: um arquivo SQLite em modo WAL (``LOCATION``), visto por todos os
+  workers da máquina, sem serviço externo.
+
+Leitura: L1, depois L2 (o que vem do L2 sobe para o L1). Escrita: L2 e L1
+do próprio processo. Toda escrita ou remoção também entra na tabela
+``invalidacoes``; cada processo lê as linhas novas dela a cada ``SINCRONIA``
+segundos e tira essas chaves do seu L1, de modo que um valor trocado por
+outro worker some do L1 dos demais em no máximo esse intervalo.
+
+Acertos por camada e falhas aparecem em ``/metrics``
+(``findmyfilm_cache_consultas_total``) e em ``estatisticas()``.
+
+Configuração (ver ``CACHES`` nas settings)::
+
+    "BACKEND": "core.cache_camadas.CacheDuasCamadas",
+    "LOCATION": "/tmp/findmyfilm-cache.sqlite3",
+    "OPTIONS": {"MAX_ENTRIES": 10000, "L1_MAX_ENTRADAS": 500, "L1_TTL": 30, "SINCRONIA": 0.5},
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metricas
+
+CONSULTAS = metricas.Contador(
+    "findmyfilm_cache_consultas_total", "Leituras do cache em duas camadas, por resultado.",
+    ("resultado",),
+)
+metricas.METRICAS.append(CONSULTAS)
+
+# Linhas mantidas em ``invalidacoes``; quem ficou mais atrás que isso limpa o L1 inteiro.
+RETENCAO = 10000
+# A cada quantas escritas o processo apaga vencidos e excedentes do L2.
+INTERVALO_LIMPEZA = 50
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS cache (chave TEXT PRIMARY KEY, valor BLOB NOT NULL, expira REAL);
+CREATE INDEX IF NOT EXISTS cache_expira ON cache (expira);
+CREATE TABLE IF NOT EXISTS invalidacoes (id INTEGER PRIMARY KEY AUTOINCREMENT, chave TEXT);
+"""
+
+
+class _Processo:
+    """Estado do processo para um LOCATION: o L1, a conexão por thread e os contadores."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.l1 = OrderedDict()  # chave -> (valor serializado, expira)
+        self.lock = threading.Lock()
+        self.sincronia_lock = threading.Lock()
+        self.local = threading.local()
+        self.ultima_invalidacao = None
+        self.proxima_sincronia = 0.0
+        self.escritas = 0
+        self.contagem = {"l1": 0, "l2": 0, "falha": 0}
+
+
+_processos = {}
+_processos_lock = threading.Lock()
+
+
+def _processo(caminho):
+    # O Django cria um backend por thread; o L1 precisa ser um só por processo.
+    # Depois de um fork, o filho começa do zero.
+    with _processos_lock:
+        estado = _processos.get(caminho)
+        if estado is None or estado.pid != os.getpid():
+            estado = _processos[caminho] = _Processo()
+        return estado
+
+
+class CacheDuasCamadas(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        opcoes = params.get("OPTIONS", {})
+        self.caminho = location
+        self.l1_max = int(opcoes.get("L1_MAX_ENTRADAS", 500))
+        self.l1_ttl = float(opcoes.get("L1_TTL", 30))
+        self.sincronia = float(opcoes.get("SINCRONIA", 0.5))
+
+    @property
+    def _estado(self):
+        return _processo(self.caminho)
+
+    def _conexao(self):
+        estado = self._estado
+        conexao = getattr(estado.local, "conexao", None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=30, isolation_level=None, check_same_thread=False)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            conexao.executescript(ESQUEMA)
+            estado.local.conexao = conexao
+        return conexao
+
+    # L1 ---------------------------------------------------------------
+
+    def _l1_obter(self, chave, agora):
+        estado = self._estado
+        with estado.lock:
+            item = estado.l1.get(chave)
+            if item is None:
+                return None
+            if item[1] <= agora:
+                del estado.l1[chave]
+                return None
+            estado.l1.move_to_end(chave)
+            return item[0]
+
+    def _l1_guardar(self, chave, dados, expira):
+        limite = time.time() + self.l1_ttl
+        estado = self._estado
+        with estado.lock:
+            estado.l1[chave] = (dados, limite if expira is None else min(expira, limite))
+            estado.l1.move_to_end(chave)
+            while len(estado.l1) > self.l1_max:
+                estado.l1.popitem(last=False)
+
+    def _l1_remover(self, chave=None):
+        estado = self._estado
+        with estado.lock:
+            if chave is None:
+                estado.l1.clear()
+            else:
+                estado.l1.pop(chave, None)
+
+    def _sincronizar(self):
+        """Tira do L1 as chaves que algum processo alterou desde a última leitura."""
+        estado = self._estado
+        if time.monotonic() < estado.proxima_sincronia or not estado.sincronia_lock.acquire(blocking=False):
+            return
+        try:
+            conexao = self._conexao()
+            if estado.ultima_invalidacao is None:
+                estado.ultima_invalidacao = conexao.execute("SELECT COALESCE(MAX(id), 0) FROM invalidacoes").fetchone()[0]
+                self._l1_remover()
+            else:
+                linhas = conexao.execute(
+                    "SELECT id, chave FROM invalidacoes WHERE id > ? ORDER BY id", (estado.ultima_invalidacao,),
+                ).fetchall()
+                # Os ids são contínuos; um buraco quer dizer que a limpeza passou por cima.
+                if linhas and (linhas[0][0] != estado.ultima_invalidacao + 1 or any(c is None for _, c in linhas)):
+                    self._l1_remover()
+                else:
+                    for _, chave in linhas:
+                        self._l1_remover(chave)
+                if linhas:
+                    estado.ultima_invalidacao = linhas[-1][0]
+            estado.proxima_sincronia = time.monotonic() + self.sincronia
+        finally:
+            estado.sincronia_lock.release()
+
+    # L2 ---------------------------------------------------------------
+
+    def _invalidar(self, conexao, chave=None):
+        cursor = conexao.execute("INSERT INTO invalidacoes (chave) VALUES (?)", (chave,))
+        if cursor.lastrowid % RETENCAO == 0:
+            conexao.execute("DELETE FROM invalidacoes WHERE id <= ?", (cursor.lastrowid - RETENCAO,))
+
+    def _limpar(self, conexao, agora):
+        """Apaga vencidos e, acima de MAX_ENTRIES, 1/CULL_FREQUENCY das que vencem primeiro."""
+        conexao.execute("DELETE FROM cache WHERE expira <= ?", (agora,))
+        total = conexao.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if total > self._max_entries:
+            excedentes = total // self._cull_frequency if self._cull_frequency else total
+            conexao.execute(
+                "DELETE FROM cache WHERE chave IN "
+                "(SELECT chave FROM cache ORDER BY expira IS NULL, expira LIMIT ?)",
+                (excedentes,),
+            )
+
+    def _gravar(self, chave, value, timeout, somente_se_ausente=False):
+        expira = self.get_backend_timeout(timeout)
+        dados = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        agora = time.time()
+        conexao = self._conexao()
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            if somente_se_ausente:
+                atual = conexao.execute("SELECT expira FROM cache WHERE chave = ?", (chave,)).fetchone()
+                if atual is not None and (atual[0] is None or atual[0] > agora):
+                    conexao.execute("COMMIT")
+                    return False
+            conexao.execute(
+                "INSERT OR REPLACE INTO cache (chave, valor, expira) VALUES (?, ?, ?)", (chave, dados, expira),
+            )
+            self._invalidar(conexao, chave)
+            estado = self._estado
+            estado.escritas += 1
+            if estado.escritas % INTERVALO_LIMPEZA == 0:
+                self._limpar(conexao, agora)
+            conexao.execute("COMMIT")
+        except BaseException:
+            conexao.execute("ROLLBACK")
+            raise
+        self._l1_guardar(chave, dados, expira)
+        return True
+
+    def _contar(self, resultado):
+        estado = self._estado
+        with estado.lock:
+            estado.contagem[resultado] += 1
+        CONSULTAS.somar(1, resultado)
+
+    # API do BaseCache -----------------------------------------------------
+
+    def get(self, key, default=None, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        self._sincronizar()
+        agora = time.time()
+        dados = self._l1_obter(chave, agora)
+        if dados is not None:
+            self._contar("l1")
+            return pickle.loads(dados)
+
+        linha = self._conexao().execute(
+            "SELECT valor, expira FROM cache WHERE chave = ? AND (expira IS NULL OR expira > ?)", (chave, agora),
+        ).fetchone()
+        if linha is None:
+            self._contar("falha")
+            return default
+        self._contar("l2")
+        self._l1_guardar(chave, linha[0], linha[1])
+        return pickle.loads(linha[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._gravar(self.make_and_validate_key(key, version=version), value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._gravar(self.make_and_validate_key(key, version=version), value, timeout, somente_se_ausente=True)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        agora = time.time()
+        conexao = self._conexao()
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            alteradas = conexao.execute(
+                "UPDATE cache SET expira = ? WHERE chave = ? AND (expira IS NULL OR expira > ?)",
+                (self.get_backend_timeout(timeout), chave, agora),
+            ).rowcount
+            if alteradas:
+                self._invalidar(conexao, chave)
+            conexao.execute("COMMIT")
+        except BaseException:
+            conexao.execute("ROLLBACK")
+            raise
+        self._l1_remover(chave)
+        return bool(alteradas)
+
+    def delete(self, key, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        conexao = self._conexao()
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            removidas = conexao.execute("DELETE FROM cache WHERE chave = ?", (chave,)).rowcount
+            self._invalidar(conexao, chave)
+            conexao.execute("COMMIT")
+        except BaseException:
+            conexao.execute("ROLLBACK")
+            raise
+        self._l1_remover(chave)
+        return bool(removidas)
+
+    def has_key(self, key, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        self._sincronizar()
+        agora = time.time()
+        if self._l1_obter(chave, agora) is not None:
+            return True
+        return self._conexao().execute(
+            "SELECT 1 FROM cache WHERE chave = ? AND (expira IS NULL OR expira > ?)", (chave, agora),
+        ).fetchone() is not None
+
+    def clear(self):
+        conexao = self._conexao()
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            conexao.execute("DELETE FROM cache")
+            self._invalidar(conexao)
+            conexao.execute("COMMIT")
+        except BaseException:
+            conexao.execute("ROLLBACK")
+            raise
+        self._l1_remover()
+
+    def close(self, **kwargs):
+        # Chamado ao fim de cada requisição: as conexões ficam abertas para a próxima.
+        pass
+
+    def estatisticas(self):
+        """Acertos por camada e falhas deste processo, e a ocupação do L1."""
+        estado = self._estado
+        consultas = sum(estado.contagem.values())
+        return {
+            "acertos_l1": estado.contagem["l1"],
+            "acertos_l2": estado.contagem["l2"],
+            "falhas": estado.contagem["falha"],
+            "taxa_acerto": round((consultas - estado.contagem["falha"]) / consultas, 4) if consultas else None,
+            "entradas_l1": len(estado.l1),
+            "limite_l1": self.l1_max,
+        }
@@ -0,0 +1,141 @@
+"""
+Cache persistente das respostas da IA.
+
+A chave é o sha256 do prompt já renderizado (persona, período, tempo e
+histórico do usuário) junto com os parâmetros do modelo, então duas entradas
+só compartilham resposta quando o pedido feito à IA é idêntico. Os
+candidatos do catálogo local ficam de fora (ver ``recommender._chave``). As respostas
+ficam na tabela ``RespostaLLM``, limitada a ``LLM_CACHE_MAX_ENTRADAS`` linhas:
+ao passar do limite, as menos acessadas recentemente saem (LRU). Alterar o
+histórico de filmes assistidos apaga as respostas do usuário (ver signals).
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EstatisticaCacheLLM, RespostaLLM
+
+
+def chave(chain, entrada):
+    """Hash canônico do prompt renderizado e dos parâmetros do modelo."""
+    prompt = chain.first
+    # O modelo pode vir ligado a parâmetros extras (ex.: response_format).
+    llm = getattr(chain.last, "bound", chain.last)
+    conteudo = json.dumps({
+        "prompt": prompt.format(**entrada),
+        "modelo": llm.model_name,
+        "temperatura": llm.temperature,
+        "max_tokens": llm.max_tokens,
+        "base_url": llm.openai_api_base,
+        "parametros": getattr(chain.last, "kwargs", {}),
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+
+def _contar(**incrementos):
+    atualizados = EstatisticaCacheLLM.objects.filter(pk=1).update(
+        **{campo: F(campo) + valor for campo, valor in incrementos.items()}
+    )
+    if not atualizados:
+        EstatisticaCacheLLM.objects.get_or_create(pk=1, defaults=incrementos)
+
+
+async def _acontar(**incrementos):
+    atualizados = await EstatisticaCacheLLM.objects.filter(pk=1).aupdate(
+        **{campo: F(campo) + valor for campo, valor in incrementos.items()}
+    )
+    if not atualizados:
+        await EstatisticaCacheLLM.objects.aget_or_create(pk=1, defaults=incrementos)
+
+
+def obter(chave_prompt):
+    """Resposta guardada para a chave, ou None. Atualiza o LRU e os contadores."""
+    resposta = RespostaLLM.objects.filter(chave=chave_prompt).values_list("resposta", flat=True).first()
+    if resposta is None:
+        _contar(falhas=1)
+        return None
+
+    RespostaLLM.objects.filter(chave=chave_prompt).update(
+        ultimo_acesso=timezone.now(), acessos=F("acessos") + 1,
+    )
+    _contar(acertos=1)
+    return resposta
+
+
+def contem(chave_prompt):
+    """Se há resposta guardada para a chave (sem contar acerto nem mexer no LRU)."""
+    return RespostaLLM.objects.filter(chave=chave_prompt).exists()
+
+
+def ultima_resposta(user):
+    """Resposta guardada mais recente do usuário (qualquer prompt), ou None."""
+    return (
+        RespostaLLM.objects.filter(user=user)
+        .order_by("-ultimo_acesso")
+        .values_list("resposta", flat=True)
+        .first()
+    )
+
+
+async def aobter(chave_prompt):
+    """Versão assíncrona de ``obter``."""
+    resposta = await RespostaLLM.objects.filter(chave=chave_prompt).values_list("resposta", flat=True).afirst()
+    if resposta is None:
+        await _acontar(falhas=1)
+        return None
+
+    await RespostaLLM.objects.filter(chave=chave_prompt).aupdate(
+        ultimo_acesso=timezone.now(), acessos=F("acessos") + 1,
+    )
+    await _acontar(acertos=1)
+    return resposta
+
+
+def _excedentes():
+    limite = getattr(settings, "LLM_CACHE_MAX_ENTRADAS", 1000)
+    return RespostaLLM.objects.order_by("-ultimo_acesso", "-id").values_list("id", flat=True)[limite:]
+
+
+def guardar(chave_prompt, resposta, user=None):
+    """Guarda a resposta e remove as entradas menos usadas acima do limite."""
+    RespostaLLM.objects.update_or_create(
+        chave=chave_prompt,
+        defaults={"resposta": resposta, "user": user, "ultimo_acesso": timezone.now()},
+    )
+    removidas, _ = RespostaLLM.objects.filter(id__in=list(_excedentes())).delete()
+    if removidas:
+        _contar(remocoes=removidas)
+
+
+async def aguardar(chave_prompt, resposta, user=None):
+    """Versão assíncrona de ``guardar``."""
+    await RespostaLLM.objects.aupdate_or_create(
+        chave=chave_prompt,
+        defaults={"resposta": resposta, "user": user, "ultimo_acesso": timezone.now()},
+    )
+    ids = [i async for i in _excedentes()]
+    removidas, _ = await RespostaLLM.objects.filter(id__in=ids).adelete()
+    if removidas:
+        await _acontar(remocoes=removidas)
+
+
+def invalidar_usuario(user_id):
+    """Apaga as respostas do usuário (o histórico dele mudou)."""
+    RespostaLLM.objects.filter(user_id=user_id).delete()
+
+
+def estatisticas():
+    """Contadores acumulados e ocupação atual do cache."""
+    contadores = EstatisticaCacheLLM.objects.filter(pk=1).first() or EstatisticaCacheLLM()
+    consultas = contadores.acertos + contadores.falhas
+    return {
+        "acertos": contadores.acertos,
+        "falhas": contadores.falhas,
+        "remocoes": contadores.remocoes,
+        "taxa_acerto": round(contadores.acertos / consultas, 4) if consultas else None,
+        "entradas": RespostaLLM.objects.count(),
+        "limite": getattr(settings, "LLM_CACHE_MAX_ENTRADAS", 1000),
+    }
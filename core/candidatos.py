@@ -0,0 +1,234 @@
+"""
+Geração local de candidatos por conteúdo (NumPy).
+
+A partir dos metadados já guardados (``FilmeMetadados``) monta uma matriz de
+atributos por filme: gêneros (multi-hot), década (one-hot) e faixa de
+duração (one-hot). O gosto do usuário é um vetor no mesmo espaço: a soma das
+notas (centradas em 3) por gênero, lida do ``PerfilGosto`` em vez de todo o
+histórico, mais um reforço para os gêneros escritos na persona. Todo o
+catálogo é pontuado com um produto matriz-vetor; ``tempo_disponivel`` e
+``anos`` viram máscaras booleanas. Os já assistidos saem depois, consultando
+no histórico só os melhores colocados.
+
+A IA recebe só os melhores candidatos para reordenar e explicar, e, se ela
+falhar, ``lista_sem_llm`` devolve os candidatos no mesmo formato JSON.
+"""
+import threading
+import time
+
+import numpy as np
+from django.db.models import Count, Max, Q
+
+from .models import FilmeAssistido, FilmeMetadados
+from .perfil import perfil_de
+from .textos import normalizar
+
+FAIXAS_DURACAO = {"curto": (0, 90), "medio": (90, 120), "longo": (120, 10_000)}
+PERIODOS = {"antigos": (0, 1999), "recentes": (2000, 2020), "atuais": (2020, 10_000)}
+
+PESO_PERSONA = 2.0
+PESO_POPULARIDADE = 0.3
+PESO_NOTA = 0.3
+
+# Mesmo sem linhas novas, o catálogo é remontado de tempos em tempos para pegar
+# registros atualizados (gêneros e duração chegam depois do bloco básico).
+IDADE_MAXIMA = 10 * 60
+
+
+class Catalogo:
+    """Matrizes de atributos de todos os filmes com metadados guardados."""
+
+    def __init__(self, filmes):
+        self.tmdb_ids = np.array([f["tmdb_id"] for f in filmes], dtype=np.int64)
+        self.titulos = [f["titulo"] for f in filmes]
+        self.posicao = {tmdb_id: i for i, tmdb_id in enumerate(self.tmdb_ids.tolist())}
+        self.por_imdb = {f["imdb_id"]: i for i, f in enumerate(filmes) if f["imdb_id"]}
+        self.por_titulo = {normalizar(f["titulo"]): i for i, f in enumerate(filmes)}
+
+        self.generos = sorted({g for f in filmes for g in f["generos"] or []})
+        indice_genero = {g: j for j, g in enumerate(self.generos)}
+        self.generos_normalizados = [normalizar(g) for g in self.generos]
+
+        n = len(filmes)
+        self.anos = np.array([int(f["ano"]) if (f["ano"] or "").isdigit() else 0 for f in filmes])
+        self.duracoes = np.array([f["duracao"] or 0 for f in filmes])
+        decadas = np.where(self.anos > 0, self.anos // 10 * 10, 0)
+        self.decadas = sorted(set(decadas[decadas > 0].tolist()))
+        indice_decada = {d: j for j, d in enumerate(self.decadas)}
+
+        genero = np.zeros((n, len(self.generos)), dtype=np.float32)
+        for i, f in enumerate(filmes):
+            for g in f["generos"] or []:
+                genero[i, indice_genero[g]] = 1.0
+        decada = np.zeros((n, len(self.decadas)), dtype=np.float32)
+        for i, d in enumerate(decadas.tolist()):
+            if d:
+                decada[i, indice_decada[d]] = 1.0
+        faixa = np.zeros((n, len(FAIXAS_DURACAO)), dtype=np.float32)
+        for j, (minimo, maximo) in enumerate(FAIXAS_DURACAO.values()):
+            faixa[:, j] = (self.duracoes > minimo) & (self.duracoes <= maximo)
+
+        self.atributos = np.hstack([genero, decada, faixa])
+
+        popularidade = np.log1p(np.array([f["popularidade"] or 0 for f in filmes], dtype=np.float32))
+        nota = np.array([f["nota_media"] or 0 for f in filmes], dtype=np.float32) / 10
+        self.base = PESO_POPULARIDADE * popularidade / max(popularidade.max(initial=0), 1e-6) + PESO_NOTA * nota
+        self.metadados = filmes
+
+    def __len__(self):
+        return len(self.tmdb_ids)
+
+    def linha(self, tmdb_id=None, imdb_id=None, titulo=None):
+        """Posição do filme no catálogo (por tmdb, imdb ou título), ou None."""
+        if tmdb_id in self.posicao:
+            return self.posicao[tmdb_id]
+        if imdb_id in self.por_imdb:
+            return self.por_imdb[imdb_id]
+        return self.por_titulo.get(normalizar(titulo))
+
+    def vetor_persona(self, genero_favorito):
+        """Gêneros citados no texto livre da persona ("ação, drama")."""
+        vetor = np.zeros(self.atributos.shape[1], dtype=np.float32)
+        texto = normalizar(genero_favorito)
+        for j, nome in enumerate(self.generos_normalizados):
+            if nome and nome in texto:
+                vetor[j] = PESO_PERSONA
+        return vetor
+
+    def vetor_generos(self, pesos):
+        """Gêneros com o peso dado (gênero -> peso), no espaço dos atributos."""
+        vetor = np.zeros(self.atributos.shape[1], dtype=np.float32)
+        for j, nome in enumerate(self.generos):
+            vetor[j] = pesos.get(nome, 0)
+        return vetor
+
+    def mascara(self, tempo=None, anos=None):
+        ok = np.ones(len(self), dtype=bool)
+        if tempo in FAIXAS_DURACAO:
+            minimo, maximo = FAIXAS_DURACAO[tempo]
+            # Duração desconhecida não elimina o filme.
+            ok &= (self.duracoes == 0) | ((self.duracoes > minimo) & (self.duracoes <= maximo))
+        if anos in PERIODOS:
+            inicio, fim = PERIODOS[anos]
+            ok &= (self.anos >= inicio) & (self.anos <= fim)
+        return ok
+
+    def pontuar(self, gosto, mascara, limite):
+        """Índices dos ``limite`` melhores filmes permitidos pela máscara."""
+        norma = np.linalg.norm(gosto)
+        afinidade = self.atributos @ (gosto / norma) if norma else np.zeros(len(self), dtype=np.float32)
+        pontos = np.where(mascara, afinidade + self.base, -np.inf)
+
+        validos = int(mascara.sum())
+        limite = min(limite, validos)
+        if not limite:
+            return []
+        melhores = np.argpartition(-pontos, limite - 1)[:limite]
+        return melhores[np.argsort(-pontos[melhores])].tolist()
+
+
+_catalogo = None
+_versao = None
+_montado_em = 0.0
+_lock = threading.Lock()
+
+
+def catalogo():
+    """
+    Catálogo em memória, reconstruído quando entram filmes novos na tabela de
+    metadados (uma consulta de contagem por chamada) ou a cada IDADE_MAXIMA.
+    """
+    global _catalogo, _versao, _montado_em
+    versao = tuple(FilmeMetadados.objects.aggregate(n=Count("id"), ultimo=Max("id")).values())
+    with _lock:
+        if versao != _versao or time.monotonic() - _montado_em > IDADE_MAXIMA:
+            filmes = list(FilmeMetadados.objects.values(
+                "tmdb_id", "imdb_id", "titulo", "ano", "generos", "duracao", "popularidade", "nota_media",
+            ))
+            _catalogo, _versao, _montado_em = Catalogo(filmes), versao, time.monotonic()
+        return _catalogo
+
+
+def _assistidos(user, cat, linhas):
+    """Quais das ``linhas`` do catálogo o usuário já avaliou (uma consulta só sobre elas)."""
+    filmes = [cat.metadados[i] for i in linhas]
+    vistos = FilmeAssistido.objects.filter(user=user).filter(
+        Q(tmdb_id__in=[f["tmdb_id"] for f in filmes])
+        | Q(imdb_id__in=[f["imdb_id"] for f in filmes if f["imdb_id"]])
+        | Q(titulo__in=[f["titulo"] for f in filmes])
+    ).values_list("tmdb_id", "imdb_id", "titulo")
+    return {cat.linha(tmdb_id, imdb_id, titulo) for tmdb_id, imdb_id, titulo in vistos}
+
+
+def gerar_candidatos(persona_dados, user=None, limite=20, perfil=None):
+    """
+    Melhores filmes do catálogo local para a persona e o perfil de gosto do
+    usuário (``perfil``, ou o guardado), já filtrados por tempo e período e
+    sem os que ele já avaliou. Cada item traz titulo, ano, generos, duracao e
+    tmdb_id.
+    """
+    cat = catalogo()
+    if not len(cat):
+        return []
+
+    gosto = cat.vetor_persona(persona_dados.get("genero_favorito", ""))
+    mascara = cat.mascara(persona_dados.get("tempo_disponivel"), persona_dados.get("anos"))
+    if user is None:
+        return _itens(cat, cat.pontuar(gosto, mascara, limite))
+
+    perfil = perfil or perfil_de(user)
+    gosto = gosto + cat.vetor_generos({genero: soma for genero, (soma, _) in perfil.generos.items()})
+
+    # Janela que dobra enquanto os já assistidos deixarem a lista curta.
+    janela = 2 * limite
+    while True:
+        melhores = cat.pontuar(gosto, mascara, janela)
+        vistos = _assistidos(user, cat, melhores)
+        escolhidos = [i for i in melhores if i not in vistos]
+        if len(escolhidos) >= limite or len(melhores) < janela:
+            return _itens(cat, escolhidos[:limite])
+        janela *= 2
+
+
+def _itens(cat, linhas):
+    return [
+        {
+            "tmdb_id": int(cat.tmdb_ids[i]),
+            "titulo": cat.titulos[i],
+            "ano": int(cat.anos[i]) or None,
+            "generos": cat.metadados[i]["generos"] or [],
+            "duracao": int(cat.duracoes[i]) or None,
+        }
+        for i in linhas
+    ]
+
+
+def descrever(candidatos):
+    """Lista compacta para o prompt: uma linha por candidato."""
+    return "\n".join(
+        f"- {c['titulo']} ({c['ano'] or '?'}; {', '.join(c['generos'][:3]) or '?'}; {c['duracao'] or '?'} min)"
+        for c in candidatos
+    )
+
+
+def lista_sem_llm(candidatos, persona_dados, quantidade=5):
+    """
+    Recomendações montadas só com os candidatos, no formato de
+    ``ListaRecomendacoes``, para quando a IA está fora do ar ou lenta demais.
+    """
+    gostos = normalizar(persona_dados.get("genero_favorito", ""))
+    filmes = []
+    for c in candidatos[:quantidade]:
+        em_comum = [g for g in c["generos"] if normalizar(g) in gostos]
+        motivo = (
+            f"Combina com seu gosto por {', '.join(em_comum).lower()}."
+            if em_comum else "Parecido com filmes que você avaliou bem."
+        )
+        filmes.append({
+            "titulo": c["titulo"],
+            "ano": c["ano"] or 0,
+            "genero": c["generos"][0] if c["generos"] else "",
+            "duracao": c["duracao"] or 0,
+            "motivo": motivo,
+        })
+    return {"filmes": filmes}
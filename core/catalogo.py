@@ -0,0 +1,181 @@
+"""
+Catálogo local de filmes com busca textual (SQLite FTS5).
+
+O comando ``importar_catalogo`` grava um dump JSONL no estilo do TMDb em um
+arquivo SQLite próprio (``CATALOGO_PATH``), fora do banco do Django. A busca
+aceita prefixos ("matr" acha "Matrix"), ignora acentos e procura tanto no
+título em português quanto no original; os resultados saem ordenados por
+popularidade e no mesmo formato de um resultado de ``/search/movie``.
+
+O rowid do índice é a posição do filme no ranking de popularidade, então a
+consulta lê os casamentos já em ordem e para no limite, sem ordenar milhares
+de linhas para prefixos curtos.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from django.conf import settings
+
+ESQUEMA = """
+CREATE TABLE carga (
+    tmdb_id INTEGER PRIMARY KEY,
+    titulo TEXT NOT NULL,
+    titulo_original TEXT NOT NULL,
+    data_lancamento TEXT NOT NULL,
+    poster_path TEXT NOT NULL,
+    imdb_id TEXT NOT NULL,
+    popularidade REAL NOT NULL
+);
+CREATE TABLE filmes (
+    posicao INTEGER PRIMARY KEY,
+    tmdb_id INTEGER NOT NULL UNIQUE,
+    titulo TEXT NOT NULL,
+    titulo_original TEXT NOT NULL DEFAULT '',
+    data_lancamento TEXT NOT NULL DEFAULT '',
+    poster_path TEXT NOT NULL DEFAULT '',
+    imdb_id TEXT NOT NULL DEFAULT '',
+    popularidade REAL NOT NULL DEFAULT 0
+);
+CREATE VIRTUAL TABLE busca USING fts5(
+    titulo, titulo_original,
+    content='filmes', content_rowid='posicao',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3 4'
+);
+"""
+
+_local = threading.local()
+_PALAVRA = re.compile(r"\w+")
+
+
+def _caminho():
+    return str(getattr(settings, "CATALOGO_PATH", ""))
+
+
+def _conexao():
+    """
+    Conexão somente leitura por thread. Reabre quando o arquivo é trocado por
+    uma nova importação; devolve None se ainda não houver catálogo.
+    """
+    caminho = _caminho()
+    try:
+        versao = (caminho, os.stat(caminho).st_mtime_ns)
+    except (OSError, ValueError):
+        return None
+
+    if getattr(_local, "versao", None) != versao:
+        if getattr(_local, "conexao", None):
+            _local.conexao.close()
+        _local.conexao = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True, check_same_thread=False)
+        _local.conexao.row_factory = sqlite3.Row
+        _local.versao = versao
+    return _local.conexao
+
+
+def _consulta_fts(termo):
+    """'o poderoso che' -> '"o"* "poderoso"* "che"*' (todas as palavras, com prefixo)."""
+    return " ".join(f'"{palavra}"*' for palavra in _PALAVRA.findall(termo))
+
+
+def buscar(termo, limite=8):
+    """
+    Filmes do catálogo que casam com ``termo``, mais populares primeiro, no
+    formato do TMDb (id, title, original_title, release_date, poster_path,
+    popularity) mais ``imdb_id`` quando o dump o traz. Lista vazia se não
+    houver catálogo ou nenhum resultado.
+    """
+    conexao = _conexao()
+    consulta = _consulta_fts(termo)
+    if conexao is None or not consulta:
+        return []
+
+    try:
+        linhas = conexao.execute(
+            """
+            SELECT f.* FROM filmes f
+            JOIN (SELECT rowid FROM busca WHERE busca MATCH ? ORDER BY rowid LIMIT ?) b
+                ON f.posicao = b.rowid
+            ORDER BY f.posicao
+            """,
+            (consulta, limite),
+        ).fetchall()
+    except sqlite3.Error:
+        return []
+
+    return [
+        {
+            "id": linha["tmdb_id"],
+            "title": linha["titulo"],
+            "original_title": linha["titulo_original"],
+            "release_date": linha["data_lancamento"],
+            "poster_path": linha["poster_path"] or None,
+            "popularity": linha["popularidade"],
+            "imdb_id": linha["imdb_id"] or None,
+        }
+        for linha in linhas
+    ]
+
+
+def _linha(registro):
+    """Linha da tabela a partir de um registro do dump (None se inválido)."""
+    tmdb_id = registro.get("id")
+    titulo = registro.get("title") or registro.get("original_title")
+    if not tmdb_id or not titulo or registro.get("adult"):
+        return None
+    return (
+        int(tmdb_id),
+        titulo,
+        registro.get("original_title") or "",
+        registro.get("release_date") or "",
+        registro.get("poster_path") or "",
+        registro.get("imdb_id") or "",
+        float(registro.get("popularity") or 0),
+    )
+
+
+def importar(linhas, destino=None, lote=5000):
+    """
+    Constrói o catálogo a partir de linhas JSONL. Grava em um arquivo
+    temporário e só então o troca pelo atual, para que as buscas em andamento
+    nunca vejam um índice pela metade. Devolve quantos filmes entraram.
+    """
+    destino = str(destino or _caminho())
+    temporario = f"{destino}.importando"
+    if os.path.exists(temporario):
+        os.remove(temporario)
+
+    conexao = sqlite3.connect(temporario)
+    conexao.executescript(ESQUEMA)
+    pendentes = []
+
+    def gravar():
+        conexao.executemany("INSERT OR REPLACE INTO carga VALUES (?, ?, ?, ?, ?, ?, ?)", pendentes)
+        pendentes.clear()
+
+    for texto in linhas:
+        if not texto.strip():
+            continue
+        linha = _linha(json.loads(texto))
+        if linha:
+            pendentes.append(linha)
+        if len(pendentes) >= lote:
+            gravar()
+    gravar()
+
+    conexao.execute("""
+        INSERT INTO filmes (tmdb_id, titulo, titulo_original, data_lancamento, poster_path, imdb_id, popularidade)
+        SELECT * FROM carga ORDER BY popularidade DESC, tmdb_id
+    """)
+    total = conexao.execute("SELECT count(*) FROM filmes").fetchone()[0]
+    conexao.execute("DROP TABLE carga")
+    conexao.execute("INSERT INTO busca(busca) VALUES ('rebuild')")
+    conexao.execute("INSERT INTO busca(busca) VALUES ('optimize')")
+    conexao.commit()
+    conexao.execute("VACUUM")
+    conexao.close()
+
+    os.replace(temporario, destino)
+    return total
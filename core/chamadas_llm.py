@@ -0,0 +1,120 @@
+"""
+Contabilidade dos pedidos à IA.
+
+Cada geração de recomendações grava uma linha em ``ChamadaLLM``: acerto do
+cache (``core.cache_llm``) ou chamada de fato, com modelo, tokens de entrada
+e de saída (``usage_metadata`` da resposta), latência só da chamada (sem a
+espera no governador), custo estimado por ``LLM_PRECOS`` e o erro, se houve.
+``resumo_diario`` agrega por dia para o admin: pedidos, taxa de acerto,
+tokens, custo e latência p95, os números para ajustar ``max_tokens``, modelo
+e TTLs do cache; ``latencia_recente`` dá o limiar do hedge em
+``core.recommender``.
+"""
+import math
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ChamadaLLM
+
+
+def modelo(chain):
+    return getattr(getattr(chain.last, "bound", chain.last), "model_name", "")
+
+
+def custo(nome_modelo, tokens_entrada, tokens_saida):
+    """Custo em dólares pelos preços por milhão de tokens de LLM_PRECOS; 0 se o modelo não está lá."""
+    precos = getattr(settings, "LLM_PRECOS", {}).get(nome_modelo)
+    if not precos:
+        return 0.0
+    return (tokens_entrada * precos["entrada"] + tokens_saida * precos["saida"]) / 1_000_000
+
+
+def _registro(chain, user, inicio=None, resposta=None, erro=None, acerto=False):
+    uso = getattr(resposta, "usage_metadata", None) or {}
+    entrada, saida = uso.get("input_tokens", 0), uso.get("output_tokens", 0)
+    nome = modelo(chain)
+    return ChamadaLLM(
+        user=user,
+        modelo=nome,
+        acerto_cache=acerto,
+        tokens_entrada=entrada,
+        tokens_saida=saida,
+        latencia_ms=(time.perf_counter() - inicio) * 1000 if inicio is not None else None,
+        custo_usd=custo(nome, entrada, saida),
+        erro=str(erro)[:1000] if erro is not None else "",
+    )
+
+
+def registrar(chain, user=None, **kwargs):
+    _registro(chain, user, **kwargs).save()
+
+
+async def aregistrar(chain, user=None, **kwargs):
+    await _registro(chain, user, **kwargs).asave()
+
+
+def _percentil(valores, percentil):
+    """Percentil por posição mais próxima (valores já ordenados)."""
+    if not valores:
+        return None
+    return valores[max(1, math.ceil(percentil / 100 * len(valores))) - 1]
+
+
+def _p95(valores):
+    return _percentil(valores, 95)
+
+
+def latencia_recente(nome_modelo, percentil=95, janela=200, minimo=20):
+    """
+    Percentil das latências (ms) das últimas ``janela`` chamadas bem-sucedidas
+    do modelo; None com menos de ``minimo`` delas.
+    """
+    latencias = list(
+        ChamadaLLM.objects.filter(modelo=nome_modelo, acerto_cache=False, erro="", latencia_ms__isnull=False)
+        .order_by("-criado_em")
+        .values_list("latencia_ms", flat=True)[:janela]
+    )
+    if len(latencias) < minimo:
+        return None
+    return _percentil(sorted(latencias), percentil)
+
+
+def resumo_diario(chamadas=None, dias=30):
+    """
+    Uma linha por dia (mais recente primeiro) com pedidos, acertos, erros,
+    tokens, custo e latência p95 das chamadas de fato, nos últimos ``dias``.
+    """
+    chamadas = ChamadaLLM.objects.all() if chamadas is None else chamadas
+    chamadas = chamadas.filter(criado_em__gte=timezone.now() - timedelta(days=dias)).annotate(
+        dia=TruncDate("criado_em"),
+    )
+    linhas = list(
+        chamadas.values("dia")
+        .annotate(
+            pedidos=Count("id"),
+            acertos=Count("id", filter=Q(acerto_cache=True)),
+            erros=Count("id", filter=~Q(erro="")),
+            tokens_entrada=Sum("tokens_entrada"),
+            tokens_saida=Sum("tokens_saida"),
+            custo_usd=Sum("custo_usd"),
+        )
+        .order_by("-dia")
+    )
+
+    latencias = defaultdict(list)
+    for dia, ms in (
+        chamadas.filter(acerto_cache=False, latencia_ms__isnull=False)
+        .order_by("latencia_ms")
+        .values_list("dia", "latencia_ms")
+    ):
+        latencias[dia].append(ms)
+    for linha in linhas:
+        linha["taxa_acerto"] = linha["acertos"] / linha["pedidos"]
+        linha["p95_ms"] = _p95(latencias[linha["dia"]])
+    return linhas
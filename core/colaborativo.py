@@ -0,0 +1,235 @@
+"""
+Filtragem colaborativa a partir das notas de todos os usuários.
+
+``treinar`` fatora a matriz esparsa usuário x filme de ``FilmeAssistido``
+com ALS (mínimos quadrados alternados, explícito, regularização ponderada
+pelo número de notas). Cada passo resolve os sistemas k x k de um bloco de
+usuários (ou filmes) de uma vez, com somas por segmento sobre as notas em
+ordem CSR, então memória e tempo crescem com o número de notas e não com o
+tamanho da matriz densa.
+
+O resultado guardado em ``COLABORATIVO_DIR`` é só o top-K de cada usuário:
+
+- ``usuarios.npy``: linha de cada user_id (índice direto, -1 sem modelo);
+- ``topk_itens.npy`` / ``topk_notas.npy``: índices dos filmes e notas previstas;
+- ``itens.json``: título e tmdb_id de cada índice.
+
+``recomendados(user_id)`` abre os arrays com mmap e responde em O(1).
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .models import FilmeAssistido
+
+NOTAS_POR_BLOCO = 20_000
+
+
+def _diretorio():
+    return str(getattr(settings, "COLABORATIVO_DIR", ""))
+
+
+def _chave_item(tmdb_id, imdb_id, titulo):
+    if tmdb_id:
+        return f"tmdb:{tmdb_id}"
+    if imdb_id:
+        return f"imdb:{imdb_id}"
+    return f"titulo:{titulo.strip().lower()}"
+
+
+def carregar_notas(lote=10_000):
+    """
+    Lê todas as notas em arrays compactos. Devolve (usuarios, itens, notas,
+    user_ids, info_itens): os dois primeiros são índices densos (int32).
+    """
+    indice_usuario, indice_item, info_itens = {}, {}, []
+    usuarios, itens, notas = [], [], []
+
+    linhas = FilmeAssistido.objects.filter(nota__isnull=False).values_list(
+        "user_id", "tmdb_id", "imdb_id", "titulo", "nota",
+    ).iterator(chunk_size=lote)
+    for user_id, tmdb_id, imdb_id, titulo, nota in linhas:
+        chave = _chave_item(tmdb_id, imdb_id, titulo)
+        if chave not in indice_item:
+            indice_item[chave] = len(info_itens)
+            info_itens.append({"titulo": titulo, "tmdb_id": tmdb_id})
+        usuarios.append(indice_usuario.setdefault(user_id, len(indice_usuario)))
+        itens.append(indice_item[chave])
+        notas.append(nota)
+
+    return (
+        np.asarray(usuarios, dtype=np.int32),
+        np.asarray(itens, dtype=np.int32),
+        np.asarray(notas, dtype=np.float32),
+        np.fromiter(indice_usuario, dtype=np.int64, count=len(indice_usuario)),
+        info_itens,
+    )
+
+
+def _csr(linhas, colunas, valores, n_linhas):
+    ordem = np.argsort(linhas, kind="stable")
+    indptr = np.zeros(n_linhas + 1, dtype=np.int64)
+    np.cumsum(np.bincount(linhas, minlength=n_linhas), out=indptr[1:])
+    return indptr, colunas[ordem], valores[ordem]
+
+
+def _blocos(indptr):
+    """Fatias de linhas com cerca de NOTAS_POR_BLOCO notas cada."""
+    n = len(indptr) - 1
+    inicio = 0
+    while inicio < n:
+        fim = int(np.searchsorted(indptr, indptr[inicio] + NOTAS_POR_BLOCO, side="right")) - 1
+        fim = min(max(fim, inicio + 1), n)
+        yield inicio, fim
+        inicio = fim
+
+
+def _resolver(indptr, colunas, valores, fixos, regularizacao):
+    """Um meio-passo do ALS: fatores das linhas com os das colunas fixos."""
+    n, k = len(indptr) - 1, fixos.shape[1]
+    saida = np.zeros((n, k), dtype=np.float32)
+    identidade = np.eye(k, dtype=np.float32)
+
+    for inicio, fim in _blocos(indptr):
+        a, b = indptr[inicio], indptr[fim]
+        v = fixos[colunas[a:b]]
+        inicios = indptr[inicio:fim] - a
+        contagens = np.diff(indptr[inicio:fim + 1]).astype(np.float32)
+
+        sistemas = np.add.reduceat(v[:, :, None] * v[:, None, :], inicios, axis=0)
+        sistemas += regularizacao * contagens[:, None, None] * identidade
+        lados = np.add.reduceat(v * valores[a:b, None], inicios, axis=0)
+        saida[inicio:fim] = np.linalg.solve(sistemas, lados[:, :, None])[:, :, 0]
+    return saida
+
+
+def fatorar(usuarios, itens, notas, n_usuarios, n_itens, fatores=16, iteracoes=10,
+            regularizacao=0.1, semente=0):
+    """
+    ALS explícito sobre notas centradas na média. Devolve (media, U, V,
+    indptr, itens) — os dois últimos são a matriz por usuário em CSR, usada
+    para tirar do top-K o que cada um já avaliou.
+    """
+    media = float(notas.mean()) if len(notas) else 0.0
+    centradas = notas - media
+    por_usuario = _csr(usuarios, itens, centradas, n_usuarios)
+    por_item = _csr(itens, usuarios, centradas, n_itens)
+
+    aleatorio = np.random.default_rng(semente)
+    u = np.zeros((n_usuarios, fatores), dtype=np.float32)
+    v = (aleatorio.standard_normal((n_itens, fatores)) * 0.1).astype(np.float32)
+    for _ in range(iteracoes):
+        u = _resolver(*por_usuario, v, regularizacao)
+        v = _resolver(*por_item, u, regularizacao)
+    return media, u, v, por_usuario[0], por_usuario[1]
+
+
+def top_k(media, u, v, indptr, vistos, k=20, bloco=1024):
+    """Top-K de cada usuário (sem os filmes que ele já avaliou)."""
+    n, k = len(u), min(k, len(v))
+    itens = np.zeros((n, k), dtype=np.int32)
+    previstas = np.zeros((n, k), dtype=np.float16)
+
+    for inicio in range(0, n, bloco):
+        fim = min(n, inicio + bloco)
+        pontos = u[inicio:fim] @ v.T + media
+        a, b = indptr[inicio], indptr[fim]
+        linhas = np.repeat(np.arange(fim - inicio), np.diff(indptr[inicio:fim + 1]))
+        pontos[linhas, vistos[a:b]] = -np.inf
+
+        melhores = np.argpartition(-pontos, k - 1, axis=1)[:, :k]
+        ordem = np.argsort(-np.take_along_axis(pontos, melhores, axis=1), axis=1)
+        melhores = np.take_along_axis(melhores, ordem, axis=1)
+        itens[inicio:fim] = melhores
+        previstas[inicio:fim] = np.take_along_axis(pontos, melhores, axis=1)
+    return itens, previstas
+
+
+def salvar(destino, user_ids, itens, previstas, info_itens):
+    """Grava os arrays em um diretório novo e troca pelo atual."""
+    pai = os.path.dirname(os.path.abspath(destino))
+    os.makedirs(pai, exist_ok=True)
+    temporario = tempfile.mkdtemp(dir=pai, prefix=".colaborativo-")
+
+    usuarios = np.full(int(user_ids.max(initial=-1)) + 1, -1, dtype=np.int32)
+    usuarios[user_ids] = np.arange(len(user_ids), dtype=np.int32)
+    np.save(os.path.join(temporario, "usuarios.npy"), usuarios)
+    np.save(os.path.join(temporario, "topk_itens.npy"), itens)
+    np.save(os.path.join(temporario, "topk_notas.npy"), previstas)
+    with open(os.path.join(temporario, "itens.json"), "w", encoding="utf-8") as f:
+        json.dump(info_itens, f, ensure_ascii=False)
+
+    antigo = f"{destino}.antigo"
+    if os.path.exists(destino):
+        os.replace(destino, antigo)
+    os.replace(temporario, destino)
+    shutil.rmtree(antigo, ignore_errors=True)
+
+
+def treinar(fatores=16, iteracoes=10, regularizacao=0.1, k=20, destino=None):
+    """Treina e grava o modelo. Devolve (usuários, filmes, notas)."""
+    usuarios, itens, notas, user_ids, info_itens = carregar_notas()
+    if not len(notas):
+        return 0, 0, 0
+
+    media, u, v, indptr, vistos = fatorar(
+        usuarios, itens, notas, len(user_ids), len(info_itens),
+        fatores=fatores, iteracoes=iteracoes, regularizacao=regularizacao,
+    )
+    topo, previstas = top_k(media, u, v, indptr, vistos, k=k)
+    salvar(destino or _diretorio(), user_ids, topo, previstas, info_itens)
+    return len(user_ids), len(info_itens), len(notas)
+
+
+class _Modelo:
+    def __init__(self, diretorio):
+        self.usuarios = np.load(os.path.join(diretorio, "usuarios.npy"), mmap_mode="r")
+        self.itens = np.load(os.path.join(diretorio, "topk_itens.npy"), mmap_mode="r")
+        self.notas = np.load(os.path.join(diretorio, "topk_notas.npy"), mmap_mode="r")
+        with open(os.path.join(diretorio, "itens.json"), encoding="utf-8") as f:
+            self.info = json.load(f)
+
+
+_modelo = None
+_versao = None
+_lock = threading.Lock()
+
+
+def _carregar():
+    """Modelo em mmap, reaberto quando um novo treino troca o diretório."""
+    global _modelo, _versao
+    diretorio = _diretorio()
+    try:
+        versao = (diretorio, os.stat(os.path.join(diretorio, "topk_itens.npy")).st_mtime_ns)
+    except (OSError, ValueError):
+        return None
+    with _lock:
+        if versao != _versao:
+            _modelo, _versao = _Modelo(diretorio), versao
+        return _modelo
+
+
+def recomendados(user_id, limite=10, nota_minima=3.5):
+    """
+    Filmes que usuários parecidos avaliaram bem e este ainda não viu:
+    lista de {titulo, tmdb_id, nota_prevista}. Vazia sem modelo treinado ou
+    para usuários que não estavam no último treino.
+    """
+    modelo = _carregar()
+    if modelo is None or user_id is None or not 0 <= user_id < len(modelo.usuarios):
+        return []
+    linha = int(modelo.usuarios[user_id])
+    if linha < 0:
+        return []
+
+    resultado = []
+    for item, nota in zip(modelo.itens[linha][:limite], modelo.notas[linha][:limite]):
+        if nota < nota_minima:
+            break
+        resultado.append({**modelo.info[int(item)], "nota_prevista": round(float(nota), 2)})
+    return resultado
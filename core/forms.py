@@ -37,4 +37,4 @@ class PersonaForm(forms.ModelForm):
     
     class Meta:
         model = Persona
-        fields = ['nome', 'genero_favorito', 'humor', 'tempo_disponivel']
+        fields = ['nome', 'genero_favorito', 'humor', 'tempo_disponivel', 'anos']
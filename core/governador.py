@@ -0,0 +1,156 @@
+"""
+Limite de chamadas simultâneas à IA no processo.
+
+Cada geração que realmente vai à IA (o cache e a coalescência vêm antes)
+pede uma vaga ao ``governador``:
+
+- até ``LLM_MAX_CONCORRENTES`` chamadas rodam ao mesmo tempo;
+- as seguintes esperam em fila (ordem de chegada) por até
+  ``LLM_PRAZO_FILA`` segundos;
+- com ``LLM_FILA_MAXIMA`` pedidos já esperando, o novo é recusado na hora.
+
+Recusa e prazo esgotado levantam ``LLMSobrecarregado``; quem chama devolve
+uma resposta degradada (ver ``core.recommender``). Threads e corrotinas
+dividem a mesma fila: ao liberar, a vaga passa direto para o primeiro da fila.
+Ocupação, fila, espera e recusas aparecem em ``/metrics``.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+
+from . import metricas
+
+ESPERA = metricas.Histograma(
+    "findmyfilm_llm_fila_espera_segundos", "Tempo até conseguir vaga para chamar a IA.",
+)
+RECUSAS = metricas.Contador(
+    "findmyfilm_llm_recusas_total", "Pedidos à IA recusados pelo governador.", ("motivo",),
+)
+
+
+class LLMSobrecarregado(Exception):
+    """Sem vaga para chamar a IA: fila cheia ou prazo de espera esgotado."""
+
+    def __init__(self, motivo):
+        super().__init__(f"IA sobrecarregada ({motivo})")
+        self.motivo = motivo
+
+
+class _Espera:
+    __slots__ = ("acordar", "liberada")
+
+    def __init__(self, acordar):
+        self.acordar = acordar
+        self.liberada = False
+
+
+class GovernadorLLM:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fila = deque()
+        self.ativos = 0
+
+    @property
+    def na_fila(self):
+        return len(self._fila)
+
+    def _recusar(self, motivo):
+        RECUSAS.somar(1, motivo)
+        raise LLMSobrecarregado(motivo)
+
+    def _reservar(self, espera):
+        """Com o lock: True se pegou vaga já; False se entrou na fila."""
+        if self.ativos < getattr(settings, "LLM_MAX_CONCORRENTES", 4) and not self._fila:
+            self.ativos += 1
+            return True
+        if len(self._fila) >= getattr(settings, "LLM_FILA_MAXIMA", 16):
+            self._recusar("fila_cheia")
+        self._fila.append(espera)
+        return False
+
+    def _desistir(self, espera):
+        """Com o lock: tira da fila quem não vai mais esperar. False se a vaga já chegou."""
+        if espera.liberada:
+            return False
+        self._fila.remove(espera)
+        return True
+
+    def liberar(self):
+        with self._lock:
+            if self._fila:
+                espera = self._fila.popleft()
+                espera.liberada = True
+                espera.acordar()
+            else:
+                self.ativos -= 1
+
+    def _prazo(self, prazo):
+        return getattr(settings, "LLM_PRAZO_FILA", 10) if prazo is None else prazo
+
+    def entrar(self, prazo=None):
+        inicio = time.monotonic()
+        evento = threading.Event()
+        espera = _Espera(evento.set)
+        with self._lock:
+            pronta = self._reservar(espera)
+        if not pronta and not evento.wait(self._prazo(prazo)):
+            with self._lock:
+                if self._desistir(espera):
+                    self._recusar("prazo")
+        ESPERA.observar(time.monotonic() - inicio)
+
+    async def aentrar(self, prazo=None):
+        inicio = time.monotonic()
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+
+        def acordar():
+            loop.call_soon_threadsafe(lambda: futuro.done() or futuro.set_result(None))
+
+        espera = _Espera(acordar)
+        with self._lock:
+            pronta = self._reservar(espera)
+        if not pronta:
+            try:
+                await asyncio.wait_for(asyncio.shield(futuro), self._prazo(prazo))
+            except asyncio.TimeoutError:
+                with self._lock:
+                    if self._desistir(espera):
+                        self._recusar("prazo")
+            except asyncio.CancelledError:
+                with self._lock:
+                    desistiu = self._desistir(espera)
+                if not desistiu:
+                    self.liberar()
+                raise
+        ESPERA.observar(time.monotonic() - inicio)
+
+    @contextmanager
+    def vaga(self, prazo=None):
+        self.entrar(prazo)
+        try:
+            yield
+        finally:
+            self.liberar()
+
+    @asynccontextmanager
+    async def avaga(self, prazo=None):
+        await self.aentrar(prazo)
+        try:
+            yield
+        finally:
+            self.liberar()
+
+
+governador = GovernadorLLM()
+
+metricas.METRICAS.extend([
+    metricas.Medidor("findmyfilm_llm_ativas", "Chamadas à IA em andamento.", lambda: governador.ativos),
+    metricas.Medidor("findmyfilm_llm_fila", "Pedidos esperando vaga para a IA.", lambda: governador.na_fila),
+    ESPERA,
+    RECUSAS,
+])
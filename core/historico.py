@@ -0,0 +1,281 @@
+"""
+Importação e exportação do histórico de filmes assistidos em lote.
+
+``importar`` lê CSV (exportações do Letterboxd e do IMDb, ou colunas
+titulo/nota) ou JSONL linha a linha, sem carregar o arquivo inteiro. A cada
+``lote`` linhas os títulos sem id são resolvidos de uma vez (metadados
+locais, catálogo FTS e, por último, buscas concorrentes no TMDb) e gravados
+com um único ``bulk_create`` com upsert em (user, titulo), dentro de uma
+transação por lote. O perfil de gosto é recalculado uma vez no fim.
+
+Pelo upload (``views.importar_historico``) só os primeiros
+``HISTORICO_LOTES_TMDB`` lotes vão ao TMDb, para a requisição caber no
+timeout do worker; o comando ``importar_historico`` não tem esse limite.
+
+``exportar_csv`` / ``exportar_jsonl`` devolvem geradores de linhas para um
+``StreamingHttpResponse``; o histórico é lido do banco em blocos.
+"""
+import csv
+import io
+import json
+import math
+from datetime import datetime, time as hora
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import cache_llm, catalogo, textos
+from .metadados import ids_por_titulo, obter_por_titulos
+from .models import FilmeAssistido, FilmeMetadados
+from .painel import invalidar_grafico
+from .perfil import reconstruir
+
+LOTE = 500
+CAMPOS_EXPORTACAO = ["titulo", "nota", "data", "imdb_id", "tmdb_id"]
+
+# Nomes de coluna aceitos: nossos, do Letterboxd e do IMDb.
+COLUNAS = {
+    "titulo": ("titulo", "title", "name"),
+    "nota": ("nota", "rating"),
+    "nota_10": ("your rating",),
+    "ano": ("ano", "year"),
+    "data": ("data", "watched date", "date rated", "date"),
+    "imdb_id": ("imdb_id", "const", "imdbid"),
+    "tmdb_id": ("tmdb_id", "tmdbid"),
+}
+
+
+def _campo(linha, nome):
+    for coluna in COLUNAS[nome]:
+        valor = linha.get(coluna)
+        if valor not in (None, ""):
+            return str(valor).strip()
+    return ""
+
+
+def _nota(linha):
+    """Nota de 1 a 5: meias estrelas sobem, escalas de 10 são divididas por 2."""
+    try:
+        if _campo(linha, "nota_10"):
+            valor = float(_campo(linha, "nota_10")) / 2
+        else:
+            valor = float(_campo(linha, "nota"))
+    except ValueError:
+        return None
+    if valor > 5:
+        valor /= 2
+    return min(5, max(1, math.floor(valor + 0.5))) if valor > 0 else None
+
+
+def _data(texto):
+    if not texto:
+        return None
+    data = parse_datetime(texto)
+    if data is None:
+        dia = parse_date(texto[:10])
+        data = datetime.combine(dia, hora(12)) if dia else None
+    if data is not None and timezone.is_naive(data):
+        data = timezone.make_aware(data)
+    return data
+
+
+def normalizar(registro):
+    """
+    Registro bruto (linha do CSV ou objeto JSON) -> dict com titulo, nota,
+    ano, data, imdb_id e tmdb_id; None se faltar título ou nota válida.
+    """
+    linha = {str(k).strip().lower(): v for k, v in registro.items() if k is not None}
+    titulo = _campo(linha, "titulo")[:200]
+    nota = _nota(linha)
+    if not titulo or nota is None:
+        return None
+    imdb_id = _campo(linha, "imdb_id")
+    tmdb_id = _campo(linha, "tmdb_id")
+    return {
+        "titulo": titulo,
+        "nota": nota,
+        "ano": _campo(linha, "ano")[:4],
+        "data": _data(_campo(linha, "data")),
+        "imdb_id": imdb_id if imdb_id.startswith("tt") else None,
+        "tmdb_id": int(tmdb_id) if tmdb_id.isdigit() else None,
+    }
+
+
+def ler_registros(arquivo, formato=None):
+    """
+    Registros brutos de um arquivo de texto já aberto. Sem ``formato``, é
+    JSONL se a primeira linha não vazia começar com '{', senão CSV.
+    """
+    if formato is None:
+        primeira = ""
+        for primeira in arquivo:
+            if primeira.strip():
+                break
+        formato = "jsonl" if primeira.lstrip().startswith("{") else "csv"
+        arquivo = _recolocar(primeira, arquivo)
+
+    if formato == "jsonl":
+        for texto in arquivo:
+            if texto.strip():
+                yield json.loads(texto)
+    else:
+        yield from csv.DictReader(arquivo)
+
+
+def _recolocar(primeira, arquivo):
+    yield primeira
+    yield from arquivo
+
+
+def _lotes(itens, tamanho):
+    lote = []
+    for item in itens:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _pelo_catalogo(item):
+    """Resultado do catálogo local com exatamente esse título (e ano, se houver)."""
+    alvo = textos.normalizar(item["titulo"])
+    for filme in catalogo.buscar(item["titulo"], limite=5):
+        titulos = {textos.normalizar(filme["title"]), textos.normalizar(filme["original_title"])}
+        if alvo in titulos and (not item["ano"] or (filme["release_date"] or "").startswith(item["ano"])):
+            return filme
+    return None
+
+
+def resolver_ids(itens, buscar_tmdb=True, concorrencia=5, prazo=None):
+    """
+    Completa tmdb_id/imdb_id dos itens, do mais barato para o mais caro: uma
+    consulta a ``FilmeMetadados`` pelos imdb_ids e outra pelos títulos, o
+    catálogo local e, para o que sobrar, ``obter_por_titulos`` (buscas
+    concorrentes no TMDb).
+    """
+    por_imdb = [i for i in itens if not i["tmdb_id"] and i["imdb_id"]]
+    if por_imdb:
+        conhecidos = dict(FilmeMetadados.objects.filter(
+            imdb_id__in=[i["imdb_id"] for i in por_imdb],
+        ).values_list("imdb_id", "tmdb_id"))
+        for item in por_imdb:
+            item["tmdb_id"] = conhecidos.get(item["imdb_id"])
+
+    sem_id = [i for i in itens if not i["tmdb_id"]]
+    faltando = []
+    for item, tmdb_id in zip(sem_id, ids_por_titulo([i["titulo"] for i in sem_id])):
+        if tmdb_id:
+            item["tmdb_id"] = tmdb_id
+            continue
+        filme = _pelo_catalogo(item)
+        if filme:
+            item["tmdb_id"] = filme["id"]
+            item["imdb_id"] = item["imdb_id"] or filme["imdb_id"]
+        else:
+            faltando.append(item)
+
+    if buscar_tmdb and faltando:
+        filmes = obter_por_titulos(
+            [i["titulo"] for i in faltando], concorrencia=concorrencia, prazo=prazo,
+        )
+        for item, filme in zip(faltando, filmes):
+            if filme:
+                item["tmdb_id"] = filme.tmdb_id
+                item["imdb_id"] = item["imdb_id"] or filme.imdb_id
+
+
+def _gravar_lote(user, itens):
+    """Upsert do lote em (user, titulo); devolve quantas linhas foram gravadas."""
+    # O mesmo título duas vezes no lote: vale a última linha.
+    itens = list({i["titulo"]: i for i in itens}.values())
+    objetos = [
+        FilmeAssistido(
+            user=user, titulo=i["titulo"], nota=i["nota"], imdb_id=i["imdb_id"], tmdb_id=i["tmdb_id"],
+        )
+        for i in itens
+    ]
+    with transaction.atomic():
+        FilmeAssistido.objects.bulk_create(
+            objetos,
+            update_conflicts=True,
+            unique_fields=["user", "titulo"],
+            update_fields=["nota", "imdb_id", "tmdb_id"],
+        )
+        # data_assistido é auto_now_add: a data do arquivo entra num segundo passo.
+        datados = []
+        for objeto, item in zip(objetos, itens):
+            if item["data"] and objeto.pk:
+                objeto.data_assistido = item["data"]
+                datados.append(objeto)
+        if datados:
+            FilmeAssistido.objects.bulk_update(datados, ["data_assistido"])
+    return len(objetos)
+
+
+def importar(user, arquivo, formato=None, lote=LOTE, buscar_tmdb=True, concorrencia=5, prazo_lote=None,
+             lotes_tmdb=None):
+    """
+    Importa o histórico de ``arquivo`` (texto, CSV ou JSONL) para ``user``.
+    Só os primeiros ``lotes_tmdb`` lotes (todos, se None) buscam no TMDb os
+    títulos que o banco e o catálogo não resolvem; os demais ficam sem id.
+    Devolve {"lidos", "gravados", "ignorados", "sem_id"}.
+    """
+    resumo = {"lidos": 0, "gravados": 0, "ignorados": 0, "sem_id": 0}
+
+    def validos():
+        for registro in ler_registros(arquivo, formato):
+            resumo["lidos"] += 1
+            item = normalizar(registro)
+            if item is None:
+                resumo["ignorados"] += 1
+            else:
+                yield item
+
+    for numero, itens in enumerate(_lotes(validos(), lote)):
+        no_tmdb = buscar_tmdb and (lotes_tmdb is None or numero < lotes_tmdb)
+        resolver_ids(itens, buscar_tmdb=no_tmdb, concorrencia=concorrencia, prazo=prazo_lote)
+        resumo["sem_id"] += sum(1 for i in itens if not i["tmdb_id"])
+        resumo["gravados"] += _gravar_lote(user, itens)
+
+    if resumo["gravados"]:
+        # bulk_create não dispara os sinais de FilmeAssistido.
+        reconstruir(user)
+        cache_llm.invalidar_usuario(user.id)
+        invalidar_grafico(user.id)
+    return resumo
+
+
+def _historico(user, bloco=2000):
+    return (
+        FilmeAssistido.objects.filter(user=user)
+        .order_by("data_assistido", "id")
+        .values_list("titulo", "nota", "data_assistido", "imdb_id", "tmdb_id")
+        .iterator(chunk_size=bloco)
+    )
+
+
+def exportar_csv(user):
+    """Linhas CSV (com cabeçalho) do histórico, geradas sob demanda."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+
+    def linha(valores):
+        escritor.writerow(valores)
+        texto = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return texto
+
+    yield linha(CAMPOS_EXPORTACAO)
+    for titulo, nota, data, imdb_id, tmdb_id in _historico(user):
+        yield linha([titulo, nota, data.isoformat(), imdb_id or "", tmdb_id or ""])
+
+
+def exportar_jsonl(user):
+    for valores in _historico(user):
+        registro = dict(zip(CAMPOS_EXPORTACAO, valores))
+        registro["data"] = registro["data"].isoformat()
+        yield json.dumps(registro, ensure_ascii=False) + "\n"
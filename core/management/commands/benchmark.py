@@ -0,0 +1,68 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import carga
+from core.benchmarks.upstream import OpenAIFalso, TMDbFalso
+
+
+def _lista_inteiros(texto):
+    return [int(n) for n in texto.split(",") if n.strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede latência (p50/p95/p99), req/s, consultas SQL e memória das views principais "
+        "em concorrência crescente, contra TMDb e IA falsos, e grava o resultado em JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cenarios", default=",".join(carga.CENARIOS),
+                            help=f"Lista separada por vírgulas entre: {', '.join(carga.CENARIOS)}.")
+        parser.add_argument("--concorrencia", type=_lista_inteiros, default=[1, 4, 16],
+                            help="Níveis de concorrência (ex.: 1,4,16).")
+        parser.add_argument("--requisicoes", type=int, default=100, help="Requisições por nível.")
+        parser.add_argument("--usuarios", type=int, default=20, help="Usuários de carga com histórico próprio.")
+        parser.add_argument("--latencia-tmdb", type=float, default=0.05, help="Segundos por chamada ao TMDb falso.")
+        parser.add_argument("--latencia-ia", type=float, default=0.5, help="Segundos por chamada à IA falsa.")
+        parser.add_argument("--falhas-tmdb", type=float, default=0.0, help="Fração de respostas 500 do TMDb.")
+        parser.add_argument("--falhas-ia", type=float, default=0.0, help="Fração de respostas 500 da IA.")
+        parser.add_argument("--semente", type=int, default=0, help="Semente do sorteio de falhas.")
+        parser.add_argument("--memoria", action="store_true",
+                            help="Mede o pico com tracemalloc (deixa as requisições mais lentas).")
+        parser.add_argument("--saida", help="Arquivo JSON do relatório (padrão: benchmarks/<commit>-<data>.json).")
+        parser.add_argument("--comparar", help="Relatório JSON anterior para mostrar a variação.")
+
+    def handle(self, *args, **opts):
+        cenarios = [c.strip() for c in opts["cenarios"].split(",") if c.strip()]
+        desconhecidos = set(cenarios) - set(carga.CENARIOS)
+        if desconhecidos:
+            raise CommandError(f"Cenários desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+        def aviso(nome, r):
+            self.stdout.write(
+                f"{nome:>22} c={r['concorrencia']:<3} {r['rps']:7.1f} req/s  "
+                f"p50={r['p50_ms']:.0f} p95={r['p95_ms']:.0f} p99={r['p99_ms']:.0f}ms  "
+                f"sql={r['sql_por_requisicao']:.1f}  erros={r['erros']}"
+            )
+
+        with TMDbFalso(opts["latencia_tmdb"], taxa_falhas=opts["falhas_tmdb"], semente=opts["semente"]) as tmdb, \
+                OpenAIFalso(opts["latencia_ia"], taxa_falhas=opts["falhas_ia"], semente=opts["semente"]) as ia:
+            relatorio = carga.executar(
+                cenarios, opts["concorrencia"], opts["requisicoes"], tmdb, ia,
+                usuarios=opts["usuarios"], memoria=opts["memoria"], aviso=aviso,
+            )
+
+        saida = opts["saida"] or os.path.join(
+            "benchmarks", f"{relatorio['commit'] or 'sem-commit'}-{relatorio['data'][:19].replace(':', '')}.json",
+        )
+        os.makedirs(os.path.dirname(saida) or ".", exist_ok=True)
+        with open(saida, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f"Relatório gravado em {saida}"))
+
+        if opts["comparar"]:
+            with open(opts["comparar"], encoding="utf-8") as f:
+                for linha in carga.comparar(relatorio, json.load(f)):
+                    self.stdout.write(linha)
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncRequestFactory, RequestFactory
+from django.test.utils import override_settings
+
+from core import views, views_async
+from core.benchmarks.upstream import TMDbFalso
+
+
+async def _anonimo():
+    return AnonymousUser()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara requisições por segundo de buscar_filme síncrono (N workers) "
+        "e assíncrono (um event loop) contra um TMDb falso com latência fixa."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requisicoes", type=int, default=400)
+        parser.add_argument("--workers", type=int, default=4,
+                            help="Threads do modo síncrono (equivale a workers WSGI).")
+        parser.add_argument("--concorrencia", type=int, default=200,
+                            help="Requisições simultâneas no modo assíncrono.")
+        parser.add_argument("--latencia", type=float, default=0.1,
+                            help="Latência do TMDb falso, em segundos.")
+        parser.add_argument("--saida", help="Grava o resultado em JSON neste arquivo.")
+
+    def handle(self, *args, **opts):
+        nome_original = connection.settings_dict["NAME"]
+        # Cache em arquivo próprio, como em core.benchmarks.carga.
+        arquivo_cache = tempfile.NamedTemporaryFile(prefix="benchmark-cache-", suffix=".sqlite3", delete=False).name
+        cache_proprio = {"default": {**settings.CACHES["default"], "LOCATION": arquivo_cache}}
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with TMDbFalso(latencia=opts["latencia"]) as tmdb, \
+                    override_settings(TMDB_URL=tmdb.url, TMDB_API_KEY="benchmark", CACHES=cache_proprio):
+                # Aquece os metadados (os ids da busca falsa são sempre os mesmos). Cada
+                # requisição medida busca um termo inédito: custa uma chamada ao TMDb,
+                # em vez de sair do cache de buscas.
+                views.buscar_filme(self._requisicao_sync("aquecimento"))
+
+                resultados = {"parametros": {k: opts[k] for k in ("requisicoes", "workers", "concorrencia", "latencia")}}
+                for modo, medir in (
+                    ("sync", lambda: self._medir_sync(opts["requisicoes"], opts["workers"])),
+                    ("async", lambda: asyncio.run(self._medir_async(opts["requisicoes"], opts["concorrencia"]))),
+                ):
+                    antes = tmdb.chamadas
+                    resultados[modo] = {**medir(), "tmdb_chamadas": tmdb.chamadas - antes}
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+            for sufixo in ("", "-wal", "-shm"):
+                if os.path.exists(arquivo_cache + sufixo):
+                    os.remove(arquivo_cache + sufixo)
+
+        for modo in ("sync", "async"):
+            r = resultados[modo]
+            self.stdout.write(
+                f"{modo:>5}: {r['rps']:8.1f} req/s  "
+                f"p50={r['p50_ms']:.0f}ms  p95={r['p95_ms']:.0f}ms  erros={r['erros']}  "
+                f"tmdb={r['tmdb_chamadas']}"
+            )
+        if opts["saida"]:
+            with open(opts["saida"], "w") as f:
+                json.dump(resultados, f, indent=2)
+
+    def _requisicao_sync(self, termo):
+        request = RequestFactory().get("/buscar_filme/", {"q": termo})
+        request.user = AnonymousUser()
+        return request
+
+    def _requisicao_async(self, termo):
+        request = AsyncRequestFactory().get("/buscar_filme/", {"q": termo})
+        request.user = AnonymousUser()
+        request.auser = _anonimo
+        return request
+
+    def _resumo(self, latencias, erros, duracao):
+        ordenadas = sorted(latencias)
+        return {
+            "rps": len(latencias) / duracao,
+            "p50_ms": statistics.median(ordenadas) * 1000,
+            "p95_ms": ordenadas[int(len(ordenadas) * 0.95) - 1] * 1000,
+            "erros": erros,
+        }
+
+    def _medir_sync(self, total, workers):
+        def uma(i):
+            inicio = time.perf_counter()
+            resposta = views.buscar_filme(self._requisicao_sync(f"sync {i}"))
+            connection.close()
+            return time.perf_counter() - inicio, b'"error"' in resposta.content
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            medidas = list(executor.map(uma, range(total)))
+        duracao = time.perf_counter() - inicio
+        return self._resumo([m[0] for m in medidas], sum(m[1] for m in medidas), duracao)
+
+    async def _medir_async(self, total, concorrencia):
+        semaforo = asyncio.Semaphore(concorrencia)
+
+        async def uma(i):
+            async with semaforo:
+                inicio = time.perf_counter()
+                resposta = await views_async.buscar_filme(self._requisicao_async(f"async {i}"))
+                return time.perf_counter() - inicio, b'"error"' in resposta.content
+
+        inicio = time.perf_counter()
+        medidas = await asyncio.gather(*(uma(i) for i in range(total)))
+        duracao = time.perf_counter() - inicio
+        return self._resumo([m[0] for m in medidas], sum(m[1] for m in medidas), duracao)
@@ -0,0 +1,27 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import catalogo
+
+
+class Command(BaseCommand):
+    help = "Importa um dump JSONL de filmes (formato TMDb, .gz aceito) para o catálogo local de busca."
+
+    def add_arguments(self, parser):
+        parser.add_argument("arquivo", help="Arquivo .jsonl ou .jsonl.gz, um filme por linha.")
+        parser.add_argument("--destino", default=None,
+                            help="Arquivo SQLite do catálogo (padrão: settings.CATALOGO_PATH).")
+        parser.add_argument("--lote", type=int, default=5000,
+                            help="Filmes por INSERT em lote.")
+
+    def handle(self, *args, **opts):
+        abrir = gzip.open if opts["arquivo"].endswith(".gz") else open
+        inicio = time.perf_counter()
+        with abrir(opts["arquivo"], "rt", encoding="utf-8") as linhas:
+            total = catalogo.importar(linhas, destino=opts["destino"], lote=opts["lote"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} filmes importados em {time.perf_counter() - inicio:.1f}s."
+        ))
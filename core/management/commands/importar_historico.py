@@ -0,0 +1,47 @@
+import gzip
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core import historico
+
+
+class Command(BaseCommand):
+    help = "Importa o histórico de filmes assistidos de um usuário (CSV do Letterboxd/IMDb ou JSONL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("usuario", help="username do dono do histórico.")
+        parser.add_argument("arquivo", help="Arquivo .csv ou .jsonl (.gz aceito).")
+        parser.add_argument("--formato", choices=["csv", "jsonl"], default=None,
+                            help="Formato do arquivo (padrão: detectado pela primeira linha).")
+        parser.add_argument("--lote", type=int, default=historico.LOTE,
+                            help="Linhas por transação.")
+        parser.add_argument("--concorrencia", type=int, default=5,
+                            help="Buscas simultâneas no TMDb por lote.")
+        parser.add_argument("--sem-tmdb", action="store_true",
+                            help="Não consulta o TMDb; usa só os metadados locais e o catálogo.")
+
+    def handle(self, *args, **opts):
+        try:
+            user = User.objects.get(username=opts["usuario"])
+        except User.DoesNotExist:
+            raise CommandError(f"Usuário {opts['usuario']!r} não existe.")
+
+        abrir = gzip.open if opts["arquivo"].endswith(".gz") else open
+        inicio = time.perf_counter()
+        with abrir(opts["arquivo"], "rt", encoding="utf-8-sig", newline="") as arquivo:
+            resumo = historico.importar(
+                user,
+                arquivo,
+                formato=opts["formato"],
+                lote=opts["lote"],
+                buscar_tmdb=not opts["sem_tmdb"],
+                concorrencia=opts["concorrencia"],
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumo['gravados']} filmes gravados de {resumo['lidos']} linhas "
+            f"({resumo['ignorados']} ignoradas, {resumo['sem_id']} sem id do TMDb) "
+            f"em {time.perf_counter() - inicio:.1f}s."
+        ))
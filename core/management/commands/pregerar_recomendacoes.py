@@ -0,0 +1,58 @@
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import pregeracao
+
+
+class Command(BaseCommand):
+    help = "Pré-gera as recomendações dos usuários ativos fora do horário de pico."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-usuarios", type=int, default=None,
+                            help="Usuários examinados por rodada (padrão: PREGERACAO_MAX_USUARIOS).")
+        parser.add_argument("--max-chamadas", type=int, default=None,
+                            help="Chamadas à IA por rodada (padrão: PREGERACAO_MAX_CHAMADAS).")
+        parser.add_argument("--concorrencia", type=int, default=None,
+                            help="Chamadas simultâneas no batch (padrão: PREGERACAO_CONCORRENCIA).")
+        parser.add_argument("--dias", type=int, default=None,
+                            help="Usuários ativos nos últimos N dias (padrão: PREGERACAO_DIAS).")
+        parser.add_argument("--sem-enriquecer", action="store_true",
+                            help="Só a IA; não busca os filmes no TMDb.")
+        parser.add_argument("--agora", action="store_true",
+                            help="Roda mesmo fora da janela PREGERACAO_JANELA.")
+        parser.add_argument("--continuo", action="store_true",
+                            help="Não sai: repete a rodada a cada --intervalo segundos dentro da janela.")
+        parser.add_argument("--intervalo", type=float, default=900,
+                            help="Espera entre rodadas no modo contínuo.")
+
+    def handle(self, *args, **opts):
+        self.parar = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *a: self.parar.set())
+        signal.signal(signal.SIGINT, lambda *a: self.parar.set())
+
+        while True:
+            if opts["agora"] or pregeracao.fora_de_pico():
+                self._rodada(opts)
+            elif not opts["continuo"]:
+                self.stdout.write("Fora da janela de pré-geração (use --agora para forçar).")
+            if not opts["continuo"] or self.parar.wait(opts["intervalo"]):
+                break
+
+    def _rodada(self, opts):
+        close_old_connections()
+        inicio = time.perf_counter()
+        resumo = pregeracao.pregerar(
+            max_usuarios=opts["max_usuarios"],
+            max_chamadas=opts["max_chamadas"],
+            concorrencia=opts["concorrencia"],
+            dias=opts["dias"],
+            enriquecer=not opts["sem_enriquecer"],
+        )
+        self.stdout.write(
+            f"{resumo['usuarios']} usuários: {resumo['geradas']} geradas, {resumo['em_cache']} já em cache, "
+            f"{resumo['adiadas']} adiadas, {resumo['erros']} erros em {time.perf_counter() - inicio:.1f}s."
+        )
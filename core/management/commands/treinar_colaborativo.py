@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import colaborativo
+
+
+class Command(BaseCommand):
+    help = "Treina a filtragem colaborativa (ALS) com as notas de FilmeAssistido e grava o top-K por usuário."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fatores", type=int, default=16, help="Dimensão dos fatores latentes.")
+        parser.add_argument("--iteracoes", type=int, default=10, help="Passos completos do ALS.")
+        parser.add_argument("--regularizacao", type=float, default=0.1, help="Lambda (multiplicado pelo nº de notas).")
+        parser.add_argument("--top", type=int, default=20, help="Filmes guardados por usuário.")
+        parser.add_argument("--destino", default=None, help="Diretório do modelo (padrão: settings.COLABORATIVO_DIR).")
+
+    def handle(self, *args, **opts):
+        inicio = time.perf_counter()
+        usuarios, filmes, notas = colaborativo.treinar(
+            fatores=opts["fatores"],
+            iteracoes=opts["iteracoes"],
+            regularizacao=opts["regularizacao"],
+            k=opts["top"],
+            destino=opts["destino"],
+        )
+        if not notas:
+            self.stdout.write(self.style.WARNING("Nenhuma nota para treinar."))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{notas} notas de {usuarios} usuários em {filmes} filmes; "
+            f"modelo gravado em {time.perf_counter() - inicio:.1f}s."
+        ))
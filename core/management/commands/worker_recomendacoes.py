@@ -0,0 +1,61 @@
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import tarefas
+
+
+class Command(BaseCommand):
+    help = "Processa a fila de recomendações (TarefaRecomendacao) com um pool de threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4,
+                            help="Quantas tarefas rodam ao mesmo tempo.")
+        parser.add_argument("--intervalo", type=float, default=1.0,
+                            help="Espera, em segundos, quando a fila está vazia.")
+        parser.add_argument("--uma-vez", action="store_true",
+                            help="Esvazia a fila e sai (útil em cron e testes).")
+
+    def handle(self, *args, **opts):
+        self.parar = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *a: self.parar.set())
+        signal.signal(signal.SIGINT, lambda *a: self.parar.set())
+
+        nome = f"{socket.gethostname()}:{os.getpid()}"
+        if opts["threads"] <= 1:
+            # Sem pool: roda na thread principal (mais simples de depurar).
+            self.stdout.write(f"Worker {nome} em uma thread.")
+            self._laco(f"{nome}/0", opts)
+            return
+
+        threads = [
+            threading.Thread(target=self._laco, args=(f"{nome}/{i}", opts), daemon=True)
+            for i in range(opts["threads"])
+        ]
+        self.stdout.write(f"Worker {nome} com {len(threads)} threads.")
+        for t in threads:
+            t.start()
+        for t in threads:
+            while t.is_alive():
+                t.join(timeout=0.5)
+
+    def _laco(self, worker, opts):
+        while not self.parar.is_set():
+            close_old_connections()
+            tarefa = tarefas.reservar_proxima(worker)
+            if tarefa is None:
+                if opts["uma_vez"]:
+                    break
+                self.parar.wait(opts["intervalo"])
+                continue
+
+            tarefa = tarefas.executar(tarefa)
+            self.stdout.write(f"[{worker}] tarefa {tarefa.id}: {tarefa.status}")
+            if tarefa.status == tarefa.PENDENTE:
+                # Devolvida por falta de vaga na IA: dá um respiro antes de tentar de novo.
+                self.parar.wait(opts["intervalo"])
+        close_old_connections()
@@ -0,0 +1,541 @@
+"""
+Armazenamento persistente dos metadados do TMDb.
+
+Todas as consultas de filme (enriquecimento das recomendações, busca da
+index e detalhes do modal) passam por aqui. Os dados ficam na tabela
+``FilmeMetadados`` e cada bloco de campos tem seu próprio TTL:
+
+- dentro do TTL o registro local é usado direto;
+- vencido, mas dentro da janela ``TMDB_METADADOS_STALE``, o registro local
+  é devolvido e uma atualização é disparada em segundo plano
+  (stale-while-revalidate);
+- ausente ou vencido além da janela, o TMDb é consultado na hora.
+
+Cada função pública tem uma versão assíncrona com prefixo ``a`` (como no ORM
+do Django), usada pelas views de ``core.views_async``.
+
+As buscas por título no TMDb (``buscar_tmdb``) ficam no cache padrão do
+Django (``core.cache_camadas``) por ``TMDB_BUSCA_TTL``, visíveis a todos os
+workers.
+"""
+import asyncio
+import contextvars
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Q
+
+from .models import FilmeMetadados
+from .textos import normalizar
+from .tmdb import cliente_tmdb
+
+logger = logging.getLogger(__name__)
+
+DIA = 24 * 60 * 60
+
+# Bloco -> item de append_to_response necessário para obtê-lo (None = resposta base).
+BLOCOS = {
+    "basico": None,
+    "detalhes": None,
+    "creditos": "credits",
+    "external_ids": "external_ids",
+    "videos": "videos",
+}
+
+TTL_PADRAO = {
+    "basico": 7 * DIA,
+    "detalhes": 7 * DIA,
+    "creditos": 30 * DIA,
+    "external_ids": 90 * DIA,
+    "videos": 7 * DIA,
+}
+
+# Conexões, ritmo, novas tentativas e coalescência ficam no cliente único
+# (core.tmdb); os nomes abaixo são atalhos para ele.
+sessao_tmdb = cliente_tmdb.sessao
+
+_em_atualizacao = set()
+_em_atualizacao_lock = threading.Lock()
+
+
+def tmdb_url(caminho):
+    return cliente_tmdb.url(caminho)
+
+
+def tmdb_get(url, params=None, timeout=6, prazo=None):
+    """GET no TMDb pelo cliente compartilhado (ver core.tmdb.TMDbClient.get)."""
+    return cliente_tmdb.get(url, params=params, timeout=timeout, prazo=prazo)
+
+
+async def atmdb_get(url, params=None, timeout=6, prazo=None):
+    """Versão assíncrona de ``tmdb_get`` (httpx)."""
+    return await cliente_tmdb.aget(url, params=params, timeout=timeout, prazo=prazo)
+
+
+def _ttl(bloco):
+    ttls = {**TTL_PADRAO, **getattr(settings, "TMDB_METADADOS_TTL", {})}
+    return ttls[bloco]
+
+
+def _janela_stale():
+    return getattr(settings, "TMDB_METADADOS_STALE", 30 * DIA)
+
+
+def _situacao(filme, blocos, agora=None):
+    """Separa os blocos pedidos em (ausentes, velhos) para o registro dado."""
+    agora = agora or time.time()
+    ausentes, velhos = [], []
+    for bloco in blocos:
+        atualizado = (filme.atualizado_em or {}).get(bloco) if filme else None
+        if atualizado is None:
+            ausentes.append(bloco)
+            continue
+        idade = agora - atualizado
+        if idade > _ttl(bloco) + _janela_stale():
+            ausentes.append(bloco)
+        elif idade > _ttl(bloco):
+            velhos.append(bloco)
+    return ausentes, velhos
+
+
+def _campos_detalhes(detalhes, blocos):
+    """Converte a resposta de /movie/{id} nos campos do modelo para os blocos dados."""
+    campos = {
+        "titulo": detalhes.get("title") or "",
+        "ano": (detalhes.get("release_date") or "")[:4],
+        "poster_path": detalhes.get("poster_path") or "",
+        "sinopse": detalhes.get("overview") or "",
+        "popularidade": detalhes.get("popularity") or 0,
+        "titulo_original": detalhes.get("original_title") or "",
+        "backdrop_path": detalhes.get("backdrop_path") or "",
+        "generos": [g.get("name") for g in detalhes.get("genres", [])],
+        "duracao": detalhes.get("runtime") or None,
+        "nota_media": detalhes.get("vote_average"),
+        "total_votos": detalhes.get("vote_count"),
+    }
+    campos["titulo_normalizado"] = normalizar(campos["titulo"])
+    campos["titulo_original_normalizado"] = normalizar(campos["titulo_original"])
+    if "creditos" in blocos:
+        campos["creditos"] = detalhes.get("credits", {})
+    if "external_ids" in blocos:
+        campos["external_ids"] = detalhes.get("external_ids", {})
+        campos["imdb_id"] = campos["external_ids"].get("imdb_id") or detalhes.get("imdb_id")
+    elif detalhes.get("imdb_id"):
+        campos["imdb_id"] = detalhes["imdb_id"]
+    if "videos" in blocos:
+        campos["videos"] = detalhes.get("videos", {})
+    return campos
+
+
+def executar_em_paralelo(funcao, itens, concorrencia=5, prazo=None):
+    """
+    Aplica ``funcao`` a cada item em um pool de threads e devolve os
+    resultados na mesma ordem dos itens. Itens que falharem ou não terminarem
+    dentro de ``prazo`` segundos ficam como None.
+
+    Use apenas para E/S de rede: as threads não devem tocar no banco.
+    """
+    itens = list(itens)
+    if len(itens) <= 1 or concorrencia <= 1:
+        resultados = []
+        for item in itens:
+            try:
+                resultados.append(funcao(item))
+            except Exception as e:
+                logger.warning("Erro ao processar %s: %s", item, e)
+                resultados.append(None)
+        return resultados
+
+    executor = ThreadPoolExecutor(max_workers=min(concorrencia, len(itens)))
+    try:
+        # Cada thread leva uma cópia do contexto (medição da requisição atual).
+        futures = [executor.submit(contextvars.copy_context().run, funcao, item) for item in itens]
+        wait(futures, timeout=prazo)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    resultados = []
+    for item, future in zip(itens, futures):
+        if not future.done():
+            logger.warning("Prazo esgotado para: %s", item)
+            resultados.append(None)
+        elif future.exception():
+            logger.warning("Erro ao processar %s: %s", item, future.exception())
+            resultados.append(None)
+        else:
+            resultados.append(future.result())
+    return resultados
+
+
+async def aexecutar_em_paralelo(funcao, itens, concorrencia=5, prazo=None):
+    """Como ``executar_em_paralelo``, para uma corrotina ``funcao``."""
+    itens = list(itens)
+    if not itens:
+        return []
+    semaforo = asyncio.Semaphore(max(1, concorrencia))
+
+    async def executar(item):
+        async with semaforo:
+            return await funcao(item)
+
+    tarefas = [asyncio.ensure_future(executar(item)) for item in itens]
+    await asyncio.wait(tarefas, timeout=prazo)
+
+    resultados = []
+    for item, tarefa in zip(itens, tarefas):
+        if not tarefa.done():
+            tarefa.cancel()
+            logger.warning("Prazo esgotado para: %s", item)
+            resultados.append(None)
+        elif tarefa.exception():
+            logger.warning("Erro ao processar %s: %s", item, tarefa.exception())
+            resultados.append(None)
+        else:
+            resultados.append(tarefa.result())
+    return resultados
+
+
+def _requisicao_detalhes(tmdb_id, blocos):
+    extras = sorted(BLOCOS[b] for b in blocos if BLOCOS[b])
+    params = {"language": "pt-BR"}
+    if extras:
+        params["append_to_response"] = ",".join(extras)
+    return tmdb_url(f"/movie/{tmdb_id}"), params
+
+
+def _requisicao_busca(titulo):
+    return tmdb_url("/search/movie"), {"query": titulo, "language": "pt-BR", "include_adult": "false"}
+
+
+def _chave_busca(titulo):
+    return "tmdb:busca:" + hashlib.sha1(titulo.strip().lower().encode()).hexdigest()
+
+
+def _requisicao_imdb(imdb_id):
+    return tmdb_url(f"/find/{imdb_id}"), {
+        "external_source": "imdb_id", "language": "pt-BR",
+    }
+
+
+def _primeiro_id(resultados):
+    return resultados[0]["id"] if resultados else None
+
+
+def _baixar_detalhes(tmdb_id, blocos):
+    """Baixa /movie/{id} com os blocos pedidos. Só rede, não toca no banco."""
+    url, params = _requisicao_detalhes(tmdb_id, blocos)
+    r = tmdb_get(url, params=params, timeout=6)
+    if r.status_code == 404:
+        return None
+    r.raise_for_status()
+    return r.json()
+
+
+async def _abaixar_detalhes(tmdb_id, blocos):
+    url, params = _requisicao_detalhes(tmdb_id, blocos)
+    r = await atmdb_get(url, params=params, timeout=6)
+    if r.status_code == 404:
+        return None
+    r.raise_for_status()
+    return r.json()
+
+
+def buscar_tmdb(titulo, timeout=6):
+    """Resultados da busca por título no TMDb (primeira página), com cache compartilhado."""
+    chave = _chave_busca(titulo)
+    resultados = cache.get(chave)
+    if resultados is None:
+        url, params = _requisicao_busca(titulo)
+        r = tmdb_get(url, params=params, timeout=timeout)
+        r.raise_for_status()
+        resultados = r.json().get("results", [])
+        cache.set(chave, resultados, getattr(settings, "TMDB_BUSCA_TTL", 6 * 3600))
+    return resultados
+
+
+async def abuscar_tmdb(titulo, timeout=6):
+    chave = _chave_busca(titulo)
+    resultados = await cache.aget(chave)
+    if resultados is None:
+        url, params = _requisicao_busca(titulo)
+        r = await atmdb_get(url, params=params, timeout=timeout)
+        r.raise_for_status()
+        resultados = r.json().get("results", [])
+        await cache.aset(chave, resultados, getattr(settings, "TMDB_BUSCA_TTL", 6 * 3600))
+    return resultados
+
+
+def _pesquisar(titulo):
+    """Devolve o tmdb_id do primeiro resultado da busca por título, ou None."""
+    return _primeiro_id(buscar_tmdb(titulo))
+
+
+async def _apesquisar(titulo):
+    return _primeiro_id(await abuscar_tmdb(titulo))
+
+
+def _montar_lote(baixados):
+    """
+    Agrupa uma lista de (tmdb_id, detalhes, blocos, existente) em objetos
+    prontos para upsert, um grupo por conjunto de campos (normalmente um só).
+    """
+    agora = time.time()
+    grupos = {}
+    for tmdb_id, detalhes, blocos, existente in baixados:
+        atualizado_em = dict(existente.atualizado_em) if existente else {}
+        atualizado_em.update({bloco: agora for bloco in blocos})
+        campos = {**_campos_detalhes(detalhes, blocos), "atualizado_em": atualizado_em}
+        grupos.setdefault(tuple(sorted(campos)), []).append(
+            FilmeMetadados(tmdb_id=tmdb_id, **campos)
+        )
+    return grupos
+
+
+def _gravar_lote(baixados):
+    """Grava os filmes baixados com um upsert por grupo, em vez de um por filme."""
+    gravados = {}
+    for campos, filmes in _montar_lote(baixados).items():
+        FilmeMetadados.objects.bulk_create(
+            filmes,
+            update_conflicts=True,
+            unique_fields=["tmdb_id"],
+            update_fields=list(campos),
+        )
+        gravados.update((f.tmdb_id, f) for f in filmes)
+    return gravados
+
+
+async def _agravar_lote(baixados):
+    gravados = {}
+    for campos, filmes in _montar_lote(baixados).items():
+        await FilmeMetadados.objects.abulk_create(
+            filmes,
+            update_conflicts=True,
+            unique_fields=["tmdb_id"],
+            update_fields=list(campos),
+        )
+        gravados.update((f.tmdb_id, f) for f in filmes)
+    return gravados
+
+
+def _blocos_a_baixar(blocos):
+    # A resposta base de /movie/{id} sempre traz os blocos básico e detalhes.
+    return set(blocos) | {"basico", "detalhes"}
+
+
+def _atualizar_em_segundo_plano(tmdb_id, blocos):
+    with _em_atualizacao_lock:
+        if tmdb_id in _em_atualizacao:
+            return
+        _em_atualizacao.add(tmdb_id)
+
+    def tarefa():
+        try:
+            existente = FilmeMetadados.objects.filter(tmdb_id=tmdb_id).first()
+            blocos_baixados = _blocos_a_baixar(blocos)
+            detalhes = _baixar_detalhes(tmdb_id, blocos_baixados)
+            if detalhes:
+                _gravar_lote([(tmdb_id, detalhes, blocos_baixados, existente)])
+        except Exception as e:
+            logger.warning("Falha ao revalidar filme %s no TMDb: %s", tmdb_id, e)
+        finally:
+            with _em_atualizacao_lock:
+                _em_atualizacao.discard(tmdb_id)
+            close_old_connections()
+
+    threading.Thread(target=tarefa, daemon=True).start()
+
+
+def _restante(limite):
+    return None if limite is None else max(0, limite - time.monotonic())
+
+
+def _planejar(tmdb_ids, locais, blocos):
+    """Decide quais ids precisam ir ao TMDb agora e agenda a revalidação dos velhos."""
+    a_baixar = {}
+    for tmdb_id in tmdb_ids:
+        ausentes, velhos = _situacao(locais.get(tmdb_id), blocos)
+        if ausentes:
+            # Já que vamos ao TMDb, aproveitamos para renovar os blocos velhos.
+            a_baixar[tmdb_id] = _blocos_a_baixar(ausentes + velhos)
+        elif velhos:
+            _atualizar_em_segundo_plano(tmdb_id, velhos)
+    return a_baixar
+
+
+def obter_filmes(tmdb_ids, blocos=("basico",), concorrencia=5, prazo=None):
+    """
+    Versão em lote de ``obter_filme``: uma consulta ao banco para todos os ids,
+    downloads concorrentes só para os que faltam e um upsert para gravá-los.
+    Devolve um dict tmdb_id -> FilmeMetadados (ids inexistentes no TMDb ficam
+    de fora). Se o TMDb falhar, um registro local vencido ainda é devolvido.
+    """
+    tmdb_ids = list(dict.fromkeys(int(i) for i in tmdb_ids))
+    locais = {f.tmdb_id: f for f in FilmeMetadados.objects.filter(tmdb_id__in=tmdb_ids)}
+    a_baixar = _planejar(tmdb_ids, locais, blocos)
+
+    baixados = executar_em_paralelo(
+        lambda tmdb_id: _baixar_detalhes(tmdb_id, a_baixar[tmdb_id]),
+        a_baixar,
+        concorrencia=concorrencia,
+        prazo=prazo,
+    )
+    locais.update(_gravar_lote([
+        (tmdb_id, detalhes, a_baixar[tmdb_id], locais.get(tmdb_id))
+        for tmdb_id, detalhes in zip(a_baixar, baixados)
+        if detalhes
+    ]))
+
+    return {tmdb_id: locais[tmdb_id] for tmdb_id in tmdb_ids if tmdb_id in locais}
+
+
+async def aobter_filmes(tmdb_ids, blocos=("basico",), concorrencia=5, prazo=None):
+    tmdb_ids = list(dict.fromkeys(int(i) for i in tmdb_ids))
+    locais = {f.tmdb_id: f async for f in FilmeMetadados.objects.filter(tmdb_id__in=tmdb_ids)}
+    a_baixar = _planejar(tmdb_ids, locais, blocos)
+
+    baixados = await aexecutar_em_paralelo(
+        lambda tmdb_id: _abaixar_detalhes(tmdb_id, a_baixar[tmdb_id]),
+        a_baixar,
+        concorrencia=concorrencia,
+        prazo=prazo,
+    )
+    locais.update(await _agravar_lote([
+        (tmdb_id, detalhes, a_baixar[tmdb_id], locais.get(tmdb_id))
+        for tmdb_id, detalhes in zip(a_baixar, baixados)
+        if detalhes
+    ]))
+
+    return {tmdb_id: locais[tmdb_id] for tmdb_id in tmdb_ids if tmdb_id in locais}
+
+
+def obter_filme(tmdb_id, blocos=("basico",)):
+    """
+    Retorna o ``FilmeMetadados`` do tmdb_id com os blocos pedidos preenchidos,
+    consultando o TMDb apenas quando necessário. Retorna None se o filme não
+    existir no TMDb.
+    """
+    return obter_filmes([tmdb_id], blocos).get(int(tmdb_id))
+
+
+async def aobter_filme(tmdb_id, blocos=("basico",)):
+    return (await aobter_filmes([tmdb_id], blocos)).get(int(tmdb_id))
+
+
+def obter_por_imdb(imdb_id, blocos=("basico",)):
+    """Como ``obter_filme``, mas a partir do id do IMDb (tt1234567)."""
+    filme = FilmeMetadados.objects.filter(imdb_id=imdb_id).first()
+    if filme:
+        return obter_filme(filme.tmdb_id, blocos)
+
+    url, params = _requisicao_imdb(imdb_id)
+    r = tmdb_get(url, params=params, timeout=6)
+    r.raise_for_status()
+    tmdb_id = _primeiro_id(r.json().get("movie_results", []))
+    return obter_filme(tmdb_id, blocos) if tmdb_id else None
+
+
+def _consulta_titulos(chaves):
+    """Filmes guardados cujo título ou título original normalizado está em ``chaves``."""
+    return (
+        FilmeMetadados.objects
+        .filter(Q(titulo_normalizado__in=chaves) | Q(titulo_original_normalizado__in=chaves))
+        .order_by("popularidade")
+        .values_list("tmdb_id", "titulo_normalizado", "titulo_original_normalizado")
+    )
+
+
+def _indexar_titulos(conhecidos, chaves):
+    ids_por_titulo = {}
+    # Ordem crescente de popularidade: o mais popular sobrescreve os demais.
+    for tmdb_id, t, t_original in conhecidos:
+        for chave in (t, t_original):
+            if chave in chaves:
+                ids_por_titulo[chave] = tmdb_id
+    return ids_por_titulo
+
+
+def ids_por_titulo(titulos):
+    """
+    tmdb_id do filme mais popular já guardado com cada título (ou título
+    original), alinhado com ``titulos``; None onde não houver. Só o banco,
+    sem TMDb.
+    """
+    chaves = [normalizar(t) for t in titulos]
+    ids = _indexar_titulos(_consulta_titulos(chaves), set(chaves)) if chaves else {}
+    return [ids.get(c) for c in chaves]
+
+
+def obter_por_titulos(titulos, blocos=("basico",), concorrencia=5, prazo=None):
+    """
+    Resolve cada título para o filme mais popular com esse nome, devolvendo
+    uma lista alinhada com ``titulos`` (None onde não houver filme). Títulos
+    já conhecidos saem do banco em uma única consulta; os demais são buscados
+    no TMDb em paralelo, respeitando o prazo total.
+    """
+    limite = time.monotonic() + prazo if prazo is not None else None
+    titulos = list(titulos)
+    chaves = [normalizar(t) for t in titulos]
+    ids_por_titulo = _indexar_titulos(_consulta_titulos(chaves), chaves)
+
+    # No TMDb, a busca vai com o título como veio (com acentos).
+    originais = {}
+    for chave, titulo in zip(chaves, titulos):
+        originais.setdefault(chave, titulo)
+    desconhecidos = [c for c in originais if c not in ids_por_titulo]
+    pesquisados = executar_em_paralelo(
+        _pesquisar, [originais[c] for c in desconhecidos], concorrencia=concorrencia, prazo=_restante(limite)
+    )
+    ids_por_titulo.update(zip(desconhecidos, pesquisados))
+
+    filmes = obter_filmes(
+        [i for i in ids_por_titulo.values() if i],
+        blocos,
+        concorrencia=concorrencia,
+        prazo=_restante(limite),
+    )
+    return [filmes.get(ids_por_titulo.get(c)) for c in chaves]
+
+
+async def aobter_por_titulos(titulos, blocos=("basico",), concorrencia=5, prazo=None):
+    limite = time.monotonic() + prazo if prazo is not None else None
+    titulos = list(titulos)
+    chaves = [normalizar(t) for t in titulos]
+    conhecidos = [linha async for linha in _consulta_titulos(chaves)]
+    ids_por_titulo = _indexar_titulos(conhecidos, chaves)
+
+    # No TMDb, a busca vai com o título como veio (com acentos).
+    originais = {}
+    for chave, titulo in zip(chaves, titulos):
+        originais.setdefault(chave, titulo)
+    desconhecidos = [c for c in originais if c not in ids_por_titulo]
+    pesquisados = await aexecutar_em_paralelo(
+        _apesquisar, [originais[c] for c in desconhecidos], concorrencia=concorrencia, prazo=_restante(limite)
+    )
+    ids_por_titulo.update(zip(desconhecidos, pesquisados))
+
+    filmes = await aobter_filmes(
+        [i for i in ids_por_titulo.values() if i],
+        blocos,
+        concorrencia=concorrencia,
+        prazo=_restante(limite),
+    )
+    return [filmes.get(ids_por_titulo.get(c)) for c in chaves]
+
+
+def obter_por_titulo(titulo, blocos=("basico",)):
+    """
+    Resolve um título para o filme mais popular com esse nome. Usa o banco
+    local quando o título já é conhecido e cai na busca do TMDb caso contrário.
+    """
+    return obter_por_titulos([titulo], blocos)[0]
+
+
+async def aobter_por_titulo(titulo, blocos=("basico",)):
+    return (await aobter_por_titulos([titulo], blocos))[0]
@@ -0,0 +1,255 @@
+"""
+Medição de tempo por requisição e métricas no formato texto do Prometheus.
+
+``MetricasMiddleware`` abre uma ``Medicao`` para cada requisição (guardada
+em um ContextVar, que acompanha ``sync_to_async``, tarefas do asyncio e as
+threads de ``executar_em_paralelo``). Os ganchos somam nela o tempo de cada
+fase:
+
+- ``sql``: ``execute_wrapper`` instalado em toda conexão nova do banco;
+- ``tmdb``: ``core.tmdb.TMDbClient.get`` / ``aget``;
+- ``llm``: ``CallbackLLM``, ligado ao ``ChatOpenAI`` (também conta tokens).
+
+Ao fim, a resposta ganha um cabeçalho ``Server-Timing`` e os histogramas
+globais recebem a duração total (por view) e a de cada chamada (por fase).
+``exportar()`` gera o texto servido em ``/metrics``. Os valores são do
+processo: com vários workers, cada um expõe os seus.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import markcoroutinefunction
+from langchain_core.callbacks import BaseCallbackHandler
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _rotulos(nomes, valores):
+    if not nomes:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)) + "}"
+
+
+class Histograma:
+    """Histograma cumulativo com buckets fixos, por combinação de rótulos."""
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS):
+        self.nome, self.ajuda, self.rotulos, self.buckets = nome, ajuda, tuple(rotulos), buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *rotulos):
+        with self._lock:
+            serie = self._series.setdefault(rotulos, [0] * len(self.buckets) + [0, 0.0])
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[i] += 1
+            serie[-2] += 1
+            serie[-1] += valor
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for valores, serie in sorted(series.items()):
+            for limite, n in zip(self.buckets + ("+Inf",), serie[:-2] + [serie[-2]]):
+                rotulos = _rotulos(self.rotulos + ("le",), valores + (limite,))
+                linhas.append(f"{self.nome}_bucket{rotulos} {n}")
+            rotulos = _rotulos(self.rotulos, valores)
+            linhas.append(f"{self.nome}_count{rotulos} {serie[-2]}")
+            linhas.append(f"{self.nome}_sum{rotulos} {serie[-1]:.6f}")
+        return linhas
+
+
+class Contador:
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome, self.ajuda, self.rotulos = nome, ajuda, tuple(rotulos)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def somar(self, valor, *rotulos):
+        with self._lock:
+            self._series[rotulos] = self._series.get(rotulos, 0) + valor
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} counter"]
+        with self._lock:
+            series = dict(self._series)
+        for valores, total in sorted(series.items()):
+            linhas.append(f"{self.nome}{_rotulos(self.rotulos, valores)} {total}")
+        return linhas
+
+
+class Medidor:
+    """Valor instantâneo (gauge), lido de ``funcao()`` na hora da exportação."""
+
+    def __init__(self, nome, ajuda, funcao):
+        self.nome, self.ajuda, self.funcao = nome, ajuda, funcao
+
+    def exportar(self):
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} gauge", f"{self.nome} {self.funcao()}"]
+
+
+REQUISICOES = Histograma(
+    "findmyfilm_requisicao_segundos", "Duração das requisições por view.", ("view", "metodo", "status"),
+)
+FASES = Histograma(
+    "findmyfilm_fase_segundos", "Duração de cada chamada ao banco, ao TMDb ou à IA.", ("fase",),
+)
+TOKENS = Contador("findmyfilm_llm_tokens_total", "Tokens consumidos na IA.", ("tipo",))
+METRICAS = [REQUISICOES, FASES, TOKENS]
+
+
+class Medicao:
+    """Tempos e contagens de uma requisição, por fase."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.fases = {}
+        self.tokens = {"entrada": 0, "saida": 0}
+        self._lock = threading.Lock()
+
+    def somar(self, fase, segundos):
+        with self._lock:
+            n, total = self.fases.get(fase, (0, 0.0))
+            self.fases[fase] = (n + 1, total + segundos)
+
+    def server_timing(self):
+        partes = []
+        for fase, (n, total) in sorted(self.fases.items()):
+            descricao = f"{n}x"
+            if fase == "llm" and any(self.tokens.values()):
+                descricao += f" {self.tokens['entrada']}+{self.tokens['saida']} tokens"
+            partes.append(f'{fase};dur={total * 1000:.1f};desc="{descricao}"')
+        partes.append(f"total;dur={(time.perf_counter() - self.inicio) * 1000:.1f}")
+        return ", ".join(partes)
+
+
+_atual = contextvars.ContextVar("medicao", default=None)
+
+
+def registrar(fase, segundos):
+    FASES.observar(segundos, fase)
+    medicao = _atual.get()
+    if medicao is not None:
+        medicao.somar(fase, segundos)
+
+
+def registrar_tokens(entrada, saida):
+    TOKENS.somar(entrada, "entrada")
+    TOKENS.somar(saida, "saida")
+    medicao = _atual.get()
+    if medicao is not None:
+        with medicao._lock:
+            medicao.tokens["entrada"] += entrada
+            medicao.tokens["saida"] += saida
+
+
+@contextmanager
+def medir(fase):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(fase, time.perf_counter() - inicio)
+
+
+def envolver_sql(execute, sql, params, many, context):
+    with medir("sql"):
+        return execute(sql, params, many, context)
+
+
+def instalar_sql(sender, connection, **kwargs):
+    """Receptor de ``connection_created``: mede toda consulta da conexão."""
+    if envolver_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(envolver_sql)
+
+
+class CallbackLLM(BaseCallbackHandler):
+    """Mede cada chamada ao modelo (invoke, stream e versões assíncronas)."""
+
+    # Roda na mesma thread/tarefa da chamada, para enxergar a Medicao atual.
+    run_inline = True
+
+    def __init__(self):
+        self._inicios = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._inicios[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        inicio = self._inicios.pop(run_id, None)
+        if inicio is not None:
+            registrar("llm", time.perf_counter() - inicio)
+        uso = (response.llm_output or {}).get("token_usage") or {}
+        if not uso:
+            for geracoes in response.generations:
+                for geracao in geracoes:
+                    mensagem = getattr(geracao, "message", None)
+                    uso = getattr(mensagem, "usage_metadata", None) or uso
+            uso = {"prompt_tokens": uso.get("input_tokens", 0), "completion_tokens": uso.get("output_tokens", 0)}
+        if uso.get("prompt_tokens") or uso.get("completion_tokens"):
+            registrar_tokens(uso.get("prompt_tokens") or 0, uso.get("completion_tokens") or 0)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        inicio = self._inicios.pop(run_id, None)
+        if inicio is not None:
+            registrar("llm", time.perf_counter() - inicio)
+
+
+callback_llm = CallbackLLM()
+
+
+class MetricasMiddleware:
+    """Abre a Medicao da requisição e fecha com Server-Timing e histogramas."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.assincrono = asyncio.iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        medicao = Medicao()
+        token = _atual.set(medicao)
+        try:
+            resposta = self.get_response(request)
+        finally:
+            _atual.reset(token)
+        return self._concluir(request, resposta, medicao)
+
+    async def __acall__(self, request):
+        medicao = Medicao()
+        token = _atual.set(medicao)
+        try:
+            resposta = await self.get_response(request)
+        finally:
+            _atual.reset(token)
+        return self._concluir(request, resposta, medicao)
+
+    def _concluir(self, request, resposta, medicao):
+        rota = getattr(request, "resolver_match", None)
+        view = (rota.url_name or rota.view_name) if rota else "sem_rota"
+        REQUISICOES.observar(time.perf_counter() - medicao.inicio, view, request.method, resposta.status_code)
+        resposta["Server-Timing"] = medicao.server_timing()
+        return resposta
+
+
+def exportar():
+    """Todas as métricas no formato texto do Prometheus (0.0.4)."""
+    linhas = []
+    for metrica in METRICAS:
+        linhas.extend(metrica.exportar())
+    return "\n".join(linhas) + "\n"
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0002_persona_recomendacao_filmeassistido"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FilmeMetadados",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("tmdb_id", models.PositiveIntegerField(unique=True)),
+                (
+                    "imdb_id",
+                    models.CharField(
+                        blank=True, db_index=True, max_length=20, null=True
+                    ),
+                ),
+                ("titulo", models.CharField(db_index=True, max_length=300)),
+                (
+                    "titulo_original",
+                    models.CharField(blank=True, db_index=True, max_length=300),
+                ),
+                ("ano", models.CharField(blank=True, max_length=4)),
+                ("poster_path", models.CharField(blank=True, max_length=200)),
+                ("backdrop_path", models.CharField(blank=True, max_length=200)),
+                ("sinopse", models.TextField(blank=True)),
+                ("generos", models.JSONField(blank=True, default=list)),
+                ("duracao", models.PositiveIntegerField(blank=True, null=True)),
+                ("nota_media", models.FloatField(blank=True, null=True)),
+                ("total_votos", models.PositiveIntegerField(blank=True, null=True)),
+                ("popularidade", models.FloatField(default=0)),
+                ("creditos", models.JSONField(blank=True, default=dict)),
+                ("external_ids", models.JSONField(blank=True, default=dict)),
+                ("videos", models.JSONField(blank=True, default=dict)),
+                ("atualizado_em", models.JSONField(blank=True, default=dict)),
+            ],
+        ),
+    ]
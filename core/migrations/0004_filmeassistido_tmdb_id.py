@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_filmemetadados"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="filmeassistido",
+            name="tmdb_id",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_filmeassistido_tmdb_id"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TarefaRecomendacao",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("chave", models.CharField(db_index=True, max_length=64)),
+                ("dados", models.JSONField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pendente", "Pendente"),
+                            ("executando", "Executando"),
+                            ("concluida", "Concluída"),
+                            ("erro", "Erro"),
+                        ],
+                        db_index=True,
+                        default="pendente",
+                        max_length=20,
+                    ),
+                ),
+                ("resultado", models.JSONField(blank=True, null=True)),
+                ("erro", models.TextField(blank=True)),
+                ("tentativas", models.PositiveIntegerField(default=0)),
+                ("worker", models.CharField(blank=True, max_length=100)),
+                ("criado_em", models.DateTimeField(auto_now_add=True)),
+                ("iniciado_em", models.DateTimeField(blank=True, null=True)),
+                ("concluido_em", models.DateTimeField(blank=True, null=True)),
+                (
+                    "persona",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="core.persona"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_respostallm"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PerfilGosto",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("total", models.PositiveIntegerField(default=0)),
+                ("soma_notas", models.PositiveIntegerField(default=0)),
+                ("histograma", models.JSONField(blank=True, default=dict)),
+                ("favoritos", models.JSONField(blank=True, default=list)),
+                ("rejeitados", models.JSONField(blank=True, default=list)),
+                ("generos", models.JSONField(blank=True, default=dict)),
+                ("atualizado_em", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="perfil_gosto",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_perfilgosto"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="filmeassistido",
+            index=models.Index(
+                fields=["user", "-data_assistido", "-id"],
+                name="assistido_user_data_idx",
+            ),
+        ),
+    ]
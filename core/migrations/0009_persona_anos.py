@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_filmeassistido_indice_painel"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="persona",
+            name="anos",
+            field=models.CharField(default="todos", max_length=20),
+        ),
+    ]
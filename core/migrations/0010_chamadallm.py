@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_persona_anos"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChamadaLLM",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("criado_em", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("modelo", models.CharField(max_length=100)),
+                ("acerto_cache", models.BooleanField(default=False)),
+                ("tokens_entrada", models.PositiveIntegerField(default=0)),
+                ("tokens_saida", models.PositiveIntegerField(default=0)),
+                ("latencia_ms", models.FloatField(blank=True, null=True)),
+                ("custo_usd", models.FloatField(default=0)),
+                ("erro", models.TextField(blank=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "chamada à IA",
+                "verbose_name_plural": "chamadas à IA",
+            },
+        ),
+    ]
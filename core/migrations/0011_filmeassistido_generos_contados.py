@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_chamadallm"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="filmeassistido",
+            name="generos_contados",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def encerrar_duplicadas(apps, schema_editor):
+    """Antes da restrição: das tarefas em andamento com a mesma chave, fica a mais antiga."""
+    Tarefa = apps.get_model("core", "TarefaRecomendacao")
+    vistas = set()
+    for tarefa in Tarefa.objects.filter(status__in=["pendente", "executando"]).order_by(
+        "criado_em", "id"
+    ):
+        if tarefa.chave in vistas:
+            tarefa.status, tarefa.erro = "erro", "Tarefa duplicada."
+            tarefa.save(update_fields=["status", "erro"])
+        vistas.add(tarefa.chave)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_filmeassistido_generos_contados"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(encerrar_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="tarefarecomendacao",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status__in", ["pendente", "executando"])),
+                fields=("chave",),
+                name="tarefa_chave_em_andamento",
+            ),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:46
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _normalizar(texto):
+    # Cópia de core.textos.normalizar, congelada para esta migração.
+    texto = (
+        unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode()
+    )
+    return texto.lower().strip()
+
+
+def preencher(apps, schema_editor):
+    FilmeMetadados = apps.get_model("core", "FilmeMetadados")
+    filmes = list(FilmeMetadados.objects.only("titulo", "titulo_original"))
+    for filme in filmes:
+        filme.titulo_normalizado = _normalizar(filme.titulo)
+        filme.titulo_original_normalizado = _normalizar(filme.titulo_original)
+    FilmeMetadados.objects.bulk_update(
+        filmes, ["titulo_normalizado", "titulo_original_normalizado"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_tarefa_chave_em_andamento"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="filmemetadados",
+            name="titulo_normalizado",
+            field=models.CharField(blank=True, db_index=True, max_length=300),
+        ),
+        migrations.AddField(
+            model_name="filmemetadados",
+            name="titulo_original_normalizado",
+            field=models.CharField(blank=True, db_index=True, max_length=300),
+        ),
+        migrations.RunPython(preencher, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from . import posters
+from .textos import normalizar
+
 class Post(models.Model):
     titulo = models.CharField(max_length=100)
     conteudo = models.TextField()
@@ -15,12 +18,23 @@ class Persona(models.Model):
     genero_favorito = models.CharField(max_length=200)
     humor = models.CharField(max_length=50)
     tempo_disponivel = models.CharField(max_length=20)
+    anos = models.CharField(max_length=20, default="todos")
     ultima_atualizacao = models.DateTimeField(auto_now=True)
     
 
     def __str__(self):
         return f"{self.user.username} - {self.genero_favorito}"
 
+    def dados(self):
+        """Os mesmos dados que o PersonaForm entrega em cleaned_data."""
+        return {
+            "nome": self.nome,
+            "genero_favorito": self.genero_favorito,
+            "humor": self.humor,
+            "tempo_disponivel": self.tempo_disponivel,
+            "anos": self.anos,
+        }
+
 
 class Recomendacao(models.Model):
     persona = models.ForeignKey(Persona, on_delete=models.CASCADE)
@@ -35,11 +49,266 @@ class FilmeAssistido(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     titulo = models.CharField(max_length=200)
     imdb_id = models.CharField(max_length=20, blank=True, null=True)
+    tmdb_id = models.PositiveIntegerField(blank=True, null=True)
     nota = models.PositiveIntegerField(default=0)
     data_assistido = models.DateTimeField(auto_now_add=True)
+    # Gêneros somados ao PerfilGosto por esta nota, para tirar exatamente os
+    # mesmos quando ela mudar; None nas notas anteriores a este campo.
+    generos_contados = models.JSONField(null=True, blank=True)
 
     class Meta:
         unique_together = ('user', 'titulo')
+        indexes = [
+            # Histórico do painel, paginado por (data_assistido, id).
+            models.Index(fields=['user', '-data_assistido', '-id'], name='assistido_user_data_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.titulo} ({self.nota}/10)"
+
+class FilmeMetadados(models.Model):
+    """
+    Cópia local dos metadados de um filme no TMDb.
+
+    Cada bloco de campos (ver ``core.metadados.BLOCOS``) tem seu próprio
+    instante de atualização em ``atualizado_em``, o que permite TTLs
+    diferentes por bloco e revalidação em segundo plano.
+    """
+    tmdb_id = models.PositiveIntegerField(unique=True)
+    imdb_id = models.CharField(max_length=20, blank=True, null=True, db_index=True)
+    titulo = models.CharField(max_length=300, db_index=True)
+    titulo_original = models.CharField(max_length=300, blank=True, db_index=True)
+    # Títulos sem acento e em minúsculas (core.textos.normalizar), para a busca
+    # por título usar índice: o lower() do SQLite só converte ASCII.
+    titulo_normalizado = models.CharField(max_length=300, blank=True, db_index=True)
+    titulo_original_normalizado = models.CharField(max_length=300, blank=True, db_index=True)
+    ano = models.CharField(max_length=4, blank=True)
+    poster_path = models.CharField(max_length=200, blank=True)
+    backdrop_path = models.CharField(max_length=200, blank=True)
+    sinopse = models.TextField(blank=True)
+    generos = models.JSONField(default=list, blank=True)
+    duracao = models.PositiveIntegerField(blank=True, null=True)
+    nota_media = models.FloatField(blank=True, null=True)
+    total_votos = models.PositiveIntegerField(blank=True, null=True)
+    popularidade = models.FloatField(default=0)
+    creditos = models.JSONField(default=dict, blank=True)
+    external_ids = models.JSONField(default=dict, blank=True)
+    videos = models.JSONField(default=dict, blank=True)
+    atualizado_em = models.JSONField(default=dict, blank=True)
+
+    def __str__(self):
+        return f"{self.titulo} ({self.ano or '?'})"
+
+    def save(self, *args, **kwargs):
+        # Os upserts em lote de core.metadados preenchem os dois por conta própria.
+        self.titulo_normalizado = normalizar(self.titulo)
+        self.titulo_original_normalizado = normalizar(self.titulo_original)
+        super().save(*args, **kwargs)
+
+    def poster_url(self, largura=342):
+        return posters.url(self.poster_path, largura)
+
+    def poster_srcset(self):
+        return posters.srcset(self.poster_path)
+
+    def backdrop_url(self, largura=780):
+        return posters.url(self.backdrop_path, largura)
+
+    @property
+    def link_imdb(self):
+        return f"https://www.imdb.com/title/{self.imdb_id}" if self.imdb_id else "#"
+
+    @property
+    def diretor(self):
+        for crew in self.creditos.get("crew", []):
+            if crew.get("job") == "Director":
+                return crew.get("name")
+        return None
+
+    def elenco(self, limite=6):
+        return [
+            {"name": m.get("name"), "character": m.get("character")}
+            for m in self.creditos.get("cast", [])[:limite]
+        ]
+
+    @property
+    def trailer_url(self):
+        for v in self.videos.get("results", []):
+            if v.get("type") == "Trailer" and v.get("site") == "YouTube":
+                return f"https://www.youtube.com/watch?v={v.get('key')}"
+        return None
+
+    def como_json(self):
+        """Representação no formato de um resultado de busca do TMDb."""
+        return {
+            "id": self.tmdb_id,
+            "title": self.titulo,
+            "original_title": self.titulo_original,
+            "release_date": self.ano,
+            "poster_path": self.poster_path or None,
+            "overview": self.sinopse,
+            "popularity": self.popularidade,
+            "genres": self.generos,
+        }
+
+
+class TarefaRecomendacao(models.Model):
+    """Geração de recomendações enfileirada para o worker (core.tarefas)."""
+    PENDENTE = "pendente"
+    EXECUTANDO = "executando"
+    CONCLUIDA = "concluida"
+    ERRO = "erro"
+    STATUS = [
+        (PENDENTE, "Pendente"),
+        (EXECUTANDO, "Executando"),
+        (CONCLUIDA, "Concluída"),
+        (ERRO, "Erro"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    persona = models.ForeignKey(Persona, on_delete=models.CASCADE)
+    chave = models.CharField(max_length=64, db_index=True)
+    dados = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS, default=PENDENTE, db_index=True)
+    resultado = models.JSONField(blank=True, null=True)
+    erro = models.TextField(blank=True)
+    tentativas = models.PositiveIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(blank=True, null=True)
+    concluido_em = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            # Uma só tarefa em andamento por chave (ver core.tarefas.enfileirar).
+            models.UniqueConstraint(
+                fields=["chave"],
+                condition=models.Q(status__in=["pendente", "executando"]),
+                name="tarefa_chave_em_andamento",
+            ),
+        ]
 
     def __str__(self):
-        return f"{self.titulo} ({self.nota}/10)"
\ No newline at end of file
+        return f"Tarefa {self.pk} de {self.user.username} ({self.status})"
+
+    @property
+    def em_andamento(self):
+        return self.status in (self.PENDENTE, self.EXECUTANDO)
+
+
+class RespostaLLM(models.Model):
+    """
+    Resposta da IA guardada pelo hash do prompt renderizado e dos parâmetros
+    do modelo (core.cache_llm). Removida quando o histórico do usuário muda.
+    """
+    chave = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True)
+    resposta = models.TextField()
+    criado_em = models.DateTimeField(auto_now_add=True)
+    ultimo_acesso = models.DateTimeField(auto_now_add=True, db_index=True)
+    acessos = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.chave[:12]} ({self.acessos} acessos)"
+
+
+class EstatisticaCacheLLM(models.Model):
+    """Contadores acumulados do cache de respostas da IA (linha única)."""
+    acertos = models.PositiveBigIntegerField(default=0)
+    falhas = models.PositiveBigIntegerField(default=0)
+    remocoes = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.acertos} acertos, {self.falhas} falhas, {self.remocoes} remoções"
+
+
+class ChamadaLLM(models.Model):
+    """
+    Registro de cada pedido de recomendação à IA (core.chamadas_llm): acerto
+    de cache ou chamada de fato, com tokens, latência, custo e erro.
+    """
+    criado_em = models.DateTimeField(auto_now_add=True, db_index=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True)
+    modelo = models.CharField(max_length=100)
+    acerto_cache = models.BooleanField(default=False)
+    tokens_entrada = models.PositiveIntegerField(default=0)
+    tokens_saida = models.PositiveIntegerField(default=0)
+    latencia_ms = models.FloatField(blank=True, null=True)
+    custo_usd = models.FloatField(default=0)
+    erro = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = "chamada à IA"
+        verbose_name_plural = "chamadas à IA"
+
+    def __str__(self):
+        tipo = "cache" if self.acerto_cache else f"{self.tokens_entrada}+{self.tokens_saida} tokens"
+        return f"{self.modelo} em {self.criado_em:%d/%m/%Y %H:%M} ({tipo})"
+
+
+class PerfilGosto(models.Model):
+    """
+    Resumo desnormalizado das notas do usuário, mantido a cada nota nova
+    (``aplicar``) para que o prompt e o painel leiam uma linha em vez de
+    varrer todo o histórico de ``FilmeAssistido``.
+    """
+    LIMITE_LISTAS = 10
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="perfil_gosto")
+    total = models.PositiveIntegerField(default=0)
+    soma_notas = models.PositiveIntegerField(default=0)
+    histograma = models.JSONField(default=dict, blank=True)
+    favoritos = models.JSONField(default=list, blank=True)
+    rejeitados = models.JSONField(default=list, blank=True)
+    generos = models.JSONField(default=dict, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Perfil de {self.user.username} ({self.total} filmes)"
+
+    @property
+    def nota_media(self):
+        return self.soma_notas / self.total if self.total else 0
+
+    def afinidades(self):
+        """Gênero -> nota média centrada em 3 (positivo = gosta)."""
+        return {
+            genero: round(soma / n, 2)
+            for genero, (soma, n) in self.generos.items() if n
+        }
+
+    def _contar_generos(self, generos, nota, sinal):
+        for genero in generos:
+            soma, n = self.generos.get(genero, (0, 0))
+            self.generos[genero] = (soma + sinal * (nota - 3), n + sinal)
+            if self.generos[genero][1] <= 0:
+                del self.generos[genero]
+
+    def aplicar(self, titulo, nota, anterior=None, generos=(), generos_anteriores=None):
+        """
+        Registra a nota de ``titulo``; ``anterior`` é a nota que ele tinha
+        (None se o filme é novo no histórico) e ``generos_anteriores``, os
+        gêneros contados com ela (None: os mesmos de ``generos``). As listas
+        podem ficar abaixo de LIMITE_LISTAS; ver ``core.perfil.completar_listas``.
+        """
+        if anterior is None:
+            self.total += 1
+        else:
+            self.soma_notas -= anterior
+            self.histograma[str(anterior)] = self.histograma.get(str(anterior), 0) - 1
+            self._contar_generos(generos if generos_anteriores is None else generos_anteriores, anterior, -1)
+        self.soma_notas += nota
+        self.histograma[str(nota)] = self.histograma.get(str(nota), 0) + 1
+        self._contar_generos(generos, nota, +1)
+
+        # Notas >= 3 são "gostou", abaixo disso "não gostou" (como no prompt).
+        self.favoritos = [f for f in self.favoritos if f["titulo"] != titulo]
+        self.rejeitados = [f for f in self.rejeitados if f["titulo"] != titulo]
+        if nota >= 3:
+            self.favoritos = sorted(
+                [{"titulo": titulo, "nota": nota}] + self.favoritos, key=lambda f: -f["nota"]
+            )[:self.LIMITE_LISTAS]
+        else:
+            self.rejeitados = sorted(
+                [{"titulo": titulo, "nota": nota}] + self.rejeitados, key=lambda f: f["nota"]
+            )[:self.LIMITE_LISTAS]
@@ -0,0 +1,107 @@
+"""
+Dados do painel do usuário ("Meu Perfil").
+
+- ``pagina_historico``: histórico de filmes paginado por cursor (keyset) em
+  (data_assistido, id), sem OFFSET e sem contar a tabela;
+- ``series_grafico``: séries já agregadas no banco para o gráfico
+  (distribuição das notas, notas por semana/mês e uma amostra de pontos),
+  guardadas no cache até o usuário gravar uma nova nota.
+"""
+import math
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Q, Window
+from django.db.models.functions import Mod, RowNumber, TruncMonth, TruncWeek
+
+from .models import FilmeAssistido
+from .perfil import perfil_de
+
+POR_PAGINA = 20
+MAX_PONTOS = 100
+AGRUPAMENTOS = {"semana": TruncWeek, "mes": TruncMonth}
+TTL_GRAFICO = 24 * 60 * 60
+
+
+def _cursor(filme):
+    return f"{filme.data_assistido.isoformat()}_{filme.id}"
+
+
+def _ler_cursor(cursor):
+    """'2024-05-01T10:00:00+00:00_42' -> (datetime, 42); None se inválido."""
+    try:
+        data, _, ident = cursor.rpartition("_")
+        return datetime.fromisoformat(data), int(ident)
+    except (AttributeError, ValueError):
+        return None
+
+
+def pagina_historico(user, cursor=None, por_pagina=POR_PAGINA):
+    """
+    Uma página do histórico, mais recentes primeiro. Devolve (filmes,
+    próximo_cursor); o cursor é None na última página.
+    """
+    filmes = FilmeAssistido.objects.filter(user=user).order_by("-data_assistido", "-id")
+    posicao = _ler_cursor(cursor) if cursor else None
+    if posicao:
+        data, ident = posicao
+        filmes = filmes.filter(Q(data_assistido__lt=data) | Q(data_assistido=data, id__lt=ident))
+
+    pagina = list(filmes[:por_pagina + 1])
+    if len(pagina) > por_pagina:
+        return pagina[:por_pagina], _cursor(pagina[por_pagina - 1])
+    return pagina, None
+
+
+def _chave_grafico(user_id, agrupar):
+    return f"painel_grafico_{user_id}_{agrupar}"
+
+
+def invalidar_grafico(user_id):
+    cache.delete_many([_chave_grafico(user_id, agrupar) for agrupar in AGRUPAMENTOS])
+
+
+def _amostra(user, total):
+    """No máximo MAX_PONTOS filmes, espaçados por igual ao longo do histórico."""
+    passo = max(1, math.ceil(total / MAX_PONTOS))
+    linhas = (
+        FilmeAssistido.objects.filter(user=user)
+        .annotate(posicao=Window(RowNumber(), order_by=[F("data_assistido").asc(), F("id").asc()]))
+        .alias(resto=Mod(F("posicao") - 1, passo))
+        .filter(resto=0)
+        .order_by("data_assistido", "id")
+        .values_list("titulo", "nota", "data_assistido")
+    )
+    return [
+        {"titulo": titulo, "nota": nota, "data": data.date().isoformat()}
+        for titulo, nota, data in linhas
+    ]
+
+
+def series_grafico(user, agrupar="mes"):
+    """Séries do gráfico do painel, do cache ou calculadas no banco."""
+    agrupar = agrupar if agrupar in AGRUPAMENTOS else "mes"
+    chave = _chave_grafico(user.id, agrupar)
+    series = cache.get(chave)
+    if series is not None:
+        return series
+
+    perfil = perfil_de(user)
+    periodos = (
+        FilmeAssistido.objects.filter(user=user)
+        .annotate(periodo=AGRUPAMENTOS[agrupar]("data_assistido"))
+        .values("periodo")
+        .annotate(filmes=Count("id"), media=Avg("nota"))
+        .order_by("periodo")
+    )
+    series = {
+        "distribuicao": {str(n): perfil.histograma.get(str(n), 0) for n in range(1, 6)},
+        "agrupamento": agrupar,
+        "ao_longo_do_tempo": [
+            {"periodo": p["periodo"].date().isoformat(), "filmes": p["filmes"], "media": round(p["media"], 2)}
+            for p in periodos
+        ],
+        "pontos": _amostra(user, perfil.total),
+    }
+    cache.set(chave, series, timeout=TTL_GRAFICO)
+    return series
@@ -0,0 +1,108 @@
+"""
+Perfil de gosto (``PerfilGosto``) mantido de forma incremental.
+
+``registrar_nota`` grava a nota em ``FilmeAssistido`` e atualiza o perfil na
+mesma transação. O histórico completo só é lido uma vez por usuário, quando
+o perfil ainda não existe (``reconstruir``).
+"""
+from asgiref.sync import sync_to_async
+from django.db import transaction
+
+from .models import FilmeAssistido, FilmeMetadados, PerfilGosto
+
+
+def _generos(tmdb_ids):
+    """Gêneros guardados localmente para os tmdb_ids (sem ir ao TMDb)."""
+    tmdb_ids = [i for i in tmdb_ids if i]
+    if not tmdb_ids:
+        return {}
+    return dict(FilmeMetadados.objects.filter(tmdb_id__in=tmdb_ids).values_list("tmdb_id", "generos"))
+
+
+def reconstruir(user):
+    """Recalcula o perfil do zero a partir de todo o histórico do usuário."""
+    historico = list(
+        FilmeAssistido.objects.filter(user=user)
+        .order_by("data_assistido", "id")
+        .only("titulo", "nota", "tmdb_id", "generos_contados")
+    )
+    generos = _generos(filme.tmdb_id for filme in historico)
+
+    perfil, alterados = PerfilGosto(user=user), []
+    for filme in historico:
+        contados = list(generos.get(filme.tmdb_id) or ())
+        perfil.aplicar(filme.titulo, filme.nota, generos=contados)
+        if filme.generos_contados != contados:
+            filme.generos_contados = contados
+            alterados.append(filme)
+    FilmeAssistido.objects.bulk_update(alterados, ["generos_contados"], batch_size=500)
+
+    campos = ["total", "soma_notas", "histograma", "favoritos", "rejeitados", "generos"]
+    perfil, _ = PerfilGosto.objects.update_or_create(
+        user=user, defaults={campo: getattr(perfil, campo) for campo in campos},
+    )
+    return perfil
+
+
+def completar_listas(perfil):
+    """
+    Repõe, pelo histórico, favoritos ou rejeitados que ficaram abaixo de
+    LIMITE_LISTAS (uma nota trocada tira o filme de uma das listas), na mesma
+    ordem de ``PerfilGosto.aplicar``: nota e, no empate, o mais recente.
+    """
+    limite = perfil.LIMITE_LISTAS
+    historico = FilmeAssistido.objects.filter(user_id=perfil.user_id)
+    if len(perfil.favoritos) < limite:
+        perfil.favoritos = [
+            {"titulo": titulo, "nota": nota}
+            for titulo, nota in historico.filter(nota__gte=3)
+            .order_by("-nota", "-data_assistido", "-id")
+            .values_list("titulo", "nota")[:limite]
+        ]
+    if len(perfil.rejeitados) < limite:
+        perfil.rejeitados = [
+            {"titulo": titulo, "nota": nota}
+            for titulo, nota in historico.filter(nota__lt=3)
+            .order_by("nota", "-data_assistido", "-id")
+            .values_list("titulo", "nota")[:limite]
+        ]
+
+
+def perfil_de(user):
+    """Perfil do usuário; criado a partir do histórico na primeira vez."""
+    return PerfilGosto.objects.filter(user=user).first() or reconstruir(user)
+
+
+async def aperfil_de(user):
+    return await PerfilGosto.objects.filter(user=user).afirst() or await sync_to_async(reconstruir)(user)
+
+
+def registrar_nota(user, titulo, nota, tmdb_id=None, imdb_id=None):
+    """
+    Salva/atualiza o FilmeAssistido e aplica a diferença no perfil, com o
+    perfil travado até o fim da transação. Devolve (filme, criado).
+    """
+    with transaction.atomic():
+        perfil_de(user)
+        perfil = PerfilGosto.objects.select_for_update().get(user=user)
+
+        existente = FilmeAssistido.objects.filter(user=user, imdb_id=imdb_id, titulo=titulo).first()
+        generos = list(_generos([tmdb_id]).get(tmdb_id) or ())
+        filme, criado = FilmeAssistido.objects.update_or_create(
+            user=user,
+            imdb_id=imdb_id,
+            titulo=titulo,
+            defaults={"nota": nota, "tmdb_id": tmdb_id, "generos_contados": generos},
+        )
+
+        perfil.aplicar(
+            titulo,
+            nota,
+            anterior=existente.nota if existente else None,
+            generos=generos,
+            generos_anteriores=existente.generos_contados if existente else None,
+        )
+        if existente:
+            completar_listas(perfil)
+        perfil.save()
+    return filme, criado
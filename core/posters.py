@@ -0,0 +1,210 @@
+"""
+Proxy local dos pôsteres e fundos do TMDb.
+
+Os cards e o modal apontam para ``/imagens/w<largura>/<arquivo>`` (ver
+``url`` e ``srcset``) em vez de ``image.tmdb.org``. Na primeira vez, a
+imagem é baixada do TMDb já na largura pedida (ele oferece todas as de
+``LARGURAS``), uma única vez, e gravada em ``POSTERS_DIR`` com o sha256 do
+conteúdo no nome; daí em diante sai do disco, com ``ETag`` (o hash) e cache
+de um ano no navegador.
+
+A pasta não passa de ``POSTERS_MAX_BYTES``: a cada ``INTERVALO_PODA``
+gravações, ``podar`` apaga as imagens usadas há mais tempo (pelo mtime, que
+é renovado quando a imagem é servida).
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.urls import reverse
+
+from .metricas import medir
+from .singleflight import SingleFlight
+from .tmdb import cliente_tmdb
+
+# Larguras que o TMDb oferece para pôsteres e fundos.
+LARGURAS = (92, 154, 185, 342, 500, 780)
+SRCSET_CARD = (185, 342, 500)
+
+# A cada quantas gravações o processo confere o tamanho da pasta.
+INTERVALO_PODA = 50
+# O mtime de uma imagem servida é renovado no máximo uma vez por este intervalo.
+INTERVALO_USO = 24 * 60 * 60
+
+ARQUIVO = re.compile(r"^[A-Za-z0-9_-]+\.(jpg|jpeg|png)$")
+TIPOS = {"jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png"}
+
+_voos = SingleFlight()
+_gravacoes = 0
+_gravacoes_lock = threading.Lock()
+
+
+class ImagemInvalida(ValueError):
+    """Largura ou nome de arquivo fora do que o proxy aceita."""
+
+
+@dataclass
+class Imagem:
+    caminho: str
+    hash: str
+    tipo: str
+
+
+def url(caminho_tmdb, largura=342):
+    """URL local do ``poster_path``/``backdrop_path`` do TMDb; "" sem imagem."""
+    if not caminho_tmdb:
+        return ""
+    return reverse("imagem_tmdb", args=[f"w{largura}", caminho_tmdb.lstrip("/")])
+
+
+def srcset(caminho_tmdb, larguras=SRCSET_CARD):
+    if not caminho_tmdb:
+        return ""
+    return ", ".join(f"{url(caminho_tmdb, largura)} {largura}w" for largura in larguras)
+
+
+def url_tmdb(tamanho, arquivo):
+    base = getattr(settings, "TMDB_IMAGENS_URL", "https://image.tmdb.org/t/p")
+    return f"{base}/{tamanho}/{arquivo}"
+
+
+def _pasta():
+    return str(getattr(settings, "POSTERS_DIR", os.path.join(tempfile.gettempdir(), "findmyfilm-posters")))
+
+
+def _indice(tamanho, arquivo):
+    return os.path.join(_pasta(), "indice", tamanho, arquivo)
+
+
+def _gravar_atomico(caminho, dados):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho))
+    with os.fdopen(descritor, "wb") as f:
+        f.write(dados)
+    os.replace(temporario, caminho)
+
+
+def _marcar_uso(caminho):
+    """Renova o mtime (a ordem da poda), no máximo uma vez por INTERVALO_USO."""
+    agora = time.time()
+    try:
+        if agora - os.path.getmtime(caminho) > INTERVALO_USO:
+            os.utime(caminho, (agora, agora))
+    except OSError:
+        pass
+
+
+def _local(tamanho, arquivo):
+    """A imagem já guardada para esse tamanho, ou None."""
+    try:
+        with open(_indice(tamanho, arquivo)) as f:
+            nome = f.read().strip()
+    except FileNotFoundError:
+        return None
+    caminho = os.path.join(_pasta(), "arquivos", nome[:2], nome)
+    if not os.path.exists(caminho):
+        return None
+    _marcar_uso(caminho)
+    return Imagem(caminho, nome.split(".")[0], TIPOS[arquivo.rsplit(".", 1)[1]])
+
+
+def _guardar(tamanho, arquivo, dados):
+    global _gravacoes
+    extensao = arquivo.rsplit(".", 1)[1]
+    digest = hashlib.sha256(dados).hexdigest()
+    nome = f"{digest}.{extensao}"
+    caminho = os.path.join(_pasta(), "arquivos", nome[:2], nome)
+    if not os.path.exists(caminho):
+        _gravar_atomico(caminho, dados)
+    _gravar_atomico(_indice(tamanho, arquivo), nome.encode())
+
+    with _gravacoes_lock:
+        _gravacoes += 1
+        podar_agora = _gravacoes % INTERVALO_PODA == 0
+    if podar_agora:
+        podar()
+    return Imagem(caminho, digest, TIPOS[extensao])
+
+
+def _arquivos(pasta):
+    for raiz, _, nomes in os.walk(pasta):
+        for nome in nomes:
+            caminho = os.path.join(raiz, nome)
+            try:
+                estado = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            yield caminho, estado
+
+
+def podar(limite=None):
+    """
+    Apaga as imagens usadas há mais tempo até a pasta ficar em 90% de
+    ``limite`` (POSTERS_MAX_BYTES), e as entradas do índice que apontavam
+    para elas. Devolve quantos bytes foram liberados.
+    """
+    limite = getattr(settings, "POSTERS_MAX_BYTES", 500 * 1024 * 1024) if limite is None else limite
+    imagens = sorted(_arquivos(os.path.join(_pasta(), "arquivos")), key=lambda item: item[1].st_mtime)
+    total = sum(estado.st_size for _, estado in imagens)
+    if total <= limite:
+        return 0
+
+    liberados = 0
+    for caminho, estado in imagens:
+        if total - liberados <= limite * 0.9:
+            break
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            continue
+        liberados += estado.st_size
+
+    apagadas = {os.path.basename(caminho) for caminho, _ in imagens if not os.path.exists(caminho)}
+    for caminho, _ in _arquivos(os.path.join(_pasta(), "indice")):
+        try:
+            with open(caminho) as f:
+                if f.read().strip() in apagadas:
+                    os.remove(caminho)
+        except FileNotFoundError:
+            continue
+    return liberados
+
+
+def _baixar(tamanho, arquivo):
+    """Bytes da imagem no TMDb; None se ela não existe lá."""
+    with medir("tmdb"):
+        r = cliente_tmdb.sessao.get(url_tmdb(tamanho, arquivo), timeout=getattr(settings, "POSTERS_TIMEOUT", 10))
+    if r.status_code == 404:
+        return None
+    r.raise_for_status()
+    return r.content
+
+
+def _gerar(tamanho, arquivo):
+    imagem = _local(tamanho, arquivo)
+    if imagem is not None:
+        return imagem
+    dados = _baixar(tamanho, arquivo)
+    return _guardar(tamanho, arquivo, dados) if dados is not None else None
+
+
+def _obter(tamanho, arquivo):
+    # Vários cards pedindo a mesma imagem fria: um download só.
+    return _local(tamanho, arquivo) or _voos.executar((tamanho, arquivo), _gerar, tamanho, arquivo)
+
+
+def obter(tamanho, arquivo):
+    """
+    ``Imagem`` guardada em disco para ``tamanho`` ("w342") e ``arquivo``
+    ("abc.jpg"), baixada na primeira vez; None se o TMDb não a tem.
+    """
+    if not tamanho.startswith("w") or not tamanho[1:].isdigit() or int(tamanho[1:]) not in LARGURAS:
+        raise ImagemInvalida(tamanho)
+    if not ARQUIVO.match(arquivo):
+        raise ImagemInvalida(arquivo)
+    return _obter(tamanho, arquivo)
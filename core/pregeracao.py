@@ -0,0 +1,96 @@
+"""
+Pré-geração das recomendações dos usuários ativos, fora do horário de pico.
+
+Para cada usuário ativo nos últimos ``PREGERACAO_DIAS`` dias (login, persona
+salva ou nota nova), monta o pedido da persona atual exatamente como o
+``persona_view`` faria (``recommender.preparar``). Se a resposta já está no
+cache (nem persona nem histórico mudaram desde a última vez, já que os dois
+entram na chave), o usuário é pulado. Os que faltam vão para a IA em
+lote (``batch`` com ``max_concurrency``) pelo mesmo caminho de um pedido
+normal (``recommender.chamar_ia``: governador e modelos de reserva),
+respeitando os orçamentos de usuários e de chamadas da rodada; as respostas
+vão para ``core.cache_llm`` e os filmes são enriquecidos (``FilmeMetadados``).
+Os filmes novos não mudam a chave (os candidatos ficam fora dela), então no
+próximo POST da persona IA e TMDb já estão respondidos.
+
+Roda pelo comando ``pregerar_recomendacoes``.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from langchain_core.runnables import RunnableLambda
+
+from . import cache_llm
+from .models import Persona
+from .recommender import chamar_ia, preparar
+from .utils import buscar_filmes_imdb
+
+logger = logging.getLogger(__name__)
+
+
+def fora_de_pico(agora=None):
+    """Se ``agora`` cai na janela PREGERACAO_JANELA (horas locais; pode virar a meia-noite)."""
+    inicio, fim = getattr(settings, "PREGERACAO_JANELA", (2, 6))
+    hora = timezone.localtime(agora).hour
+    return inicio <= hora < fim if inicio <= fim else hora >= inicio or hora < fim
+
+
+def personas_ativas(dias=None):
+    """Personas de usuários com atividade recente, da mais recente para a mais antiga."""
+    dias = getattr(settings, "PREGERACAO_DIAS", 7) if dias is None else dias
+    desde = timezone.now() - timedelta(days=dias)
+    return (
+        Persona.objects.filter(
+            Q(user__last_login__gte=desde)
+            | Q(ultima_atualizacao__gte=desde)
+            | Q(user__filmeassistido__data_assistido__gte=desde)
+        )
+        .exclude(genero_favorito="")
+        .select_related("user")
+        .distinct()
+        .order_by("-ultima_atualizacao")
+    )
+
+
+def pregerar(max_usuarios=None, max_chamadas=None, concorrencia=None, dias=None, enriquecer=True):
+    """
+    Uma rodada de pré-geração. Devolve {"usuarios", "em_cache", "geradas",
+    "adiadas", "erros"}; "adiadas" são as que passaram do orçamento de chamadas.
+    """
+    max_usuarios = getattr(settings, "PREGERACAO_MAX_USUARIOS", 100) if max_usuarios is None else max_usuarios
+    max_chamadas = getattr(settings, "PREGERACAO_MAX_CHAMADAS", 50) if max_chamadas is None else max_chamadas
+    concorrencia = getattr(settings, "PREGERACAO_CONCORRENCIA", 4) if concorrencia is None else concorrencia
+    resumo = {"usuarios": 0, "em_cache": 0, "geradas": 0, "adiadas": 0, "erros": 0}
+
+    pedidos = []
+    for persona in personas_ativas(dias)[:max_usuarios]:
+        resumo["usuarios"] += 1
+        _, _, entrada, chave = preparar(persona.dados(), persona.user)
+        if cache_llm.contem(chave):
+            resumo["em_cache"] += 1
+        elif len(pedidos) < max_chamadas:
+            pedidos.append((persona.user, entrada, chave))
+        else:
+            resumo["adiadas"] += 1
+    if not pedidos:
+        return resumo
+
+    # Cada item do batch espera vaga no governador, é registrado em ChamadaLLM
+    # e já sai guardado no cache da IA.
+    invocar = RunnableLambda(lambda pedido: chamar_ia(pedido[1], pedido[2], user=pedido[0]))
+    respostas = invocar.batch(pedidos, config={"max_concurrency": concorrencia}, return_exceptions=True)
+    for (user, _, _), resposta in zip(pedidos, respostas):
+        if isinstance(resposta, Exception):
+            logger.warning("Pré-geração de %s falhou: %s", user.username, resposta)
+            resumo["erros"] += 1
+            continue
+        resumo["geradas"] += 1
+        if enriquecer:
+            try:
+                buscar_filmes_imdb(resposta)
+            except Exception as e:
+                logger.warning("Enriquecimento da pré-geração de %s falhou: %s", user.username, e)
+    return resumo
@@ -1,48 +1,104 @@
-import os
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from .models import FilmeAssistido, Persona
-from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field
+from . import cache_llm, chamadas_llm, colaborativo, metricas
+from .candidatos import descrever, gerar_candidatos, lista_sem_llm
+from .governador import LLMSobrecarregado, governador
+from .metricas import callback_llm
+from .perfil import aperfil_de, perfil_de
+from .singleflight import SingleFlight
 
+logger = logging.getLogger(__name__)
+
+RESERVAS = metricas.Contador(
+    "findmyfilm_llm_reservas_total", "Chamadas a um modelo de reserva, por motivo.", ("motivo",),
+)
+metricas.METRICAS.append(RESERVAS)
+
+
+class FilmeRecomendado(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    titulo: str
+    ano: int
+    genero: str
+    duracao: int = Field(description="Duração aproximada em minutos")
+    motivo: str = Field(description="Motivo da recomendação em uma frase curta")
+
+
+class ListaRecomendacoes(BaseModel):
+    """Saída estruturada da IA quando RECOMENDACOES_FORMATO é "json"."""
+    model_config = ConfigDict(extra="forbid")
+
+    filmes: list[FilmeRecomendado]
+
+
+FORMATOS = {
+    "html": "Retorne o resultado **em HTML limpo**, sem Markdown.",
+    "json": "Retorne apenas o JSON no esquema pedido, sem texto fora dele. Duração em minutos.",
+}
+
+
+def _formato():
+    return getattr(settings, "RECOMENDACOES_FORMATO", "json")
 
-def gerar_recomendacoes(persona_dados, user=None):
-    """
-    Gera recomendações de filmes personalizadas com base:
-    - Na persona atual
-    - Nos filmes assistidos e notas anteriores
-    - Nos anos desejados
-    - E na IA (via OpenRouter)
-    """
 
+def _formato_resposta():
+    """response_format da API: JSON validado contra ListaRecomendacoes."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "recomendacoes",
+            "strict": True,
+            "schema": ListaRecomendacoes.model_json_schema(),
+        },
+    }
+
+
+def _configuracao():
     api_key = getattr(settings, "OPENROUTER_API_KEY", None)
     base_url = getattr(settings, "OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
 
     if not api_key:
         raise ValueError("A chave OPENROUTER_API_KEY não está configurada no .env ou settings.py")
+    return api_key, base_url
+
 
+def _montar_entrada(persona_dados, perfil=None, candidatos=(), parecidos=()):
+    """
+    Monta as variáveis do prompt a partir da persona, do perfil de gosto do
+    usuário (PerfilGosto) e, se houver, dos candidatos gerados localmente
+    (core.candidatos) e do que usuários parecidos avaliaram bem
+    (core.colaborativo).
+    """
     # Extrai dados da persona
     genero = persona_dados.get("genero_favorito", "qualquer gênero")
     humor = persona_dados.get("humor", "neutro")
     tempo = persona_dados.get("tempo_disponivel", "qualquer duração")
     anos = persona_dados.get("anos", "todos os períodos")
 
-    # Coleta filmes já assistidos
-    filmes_assistidos = []
-    if user:
-        filmes_assistidos = list(
-            FilmeAssistido.objects.filter(user=user).values_list("titulo", "nota")
-        )
-
-    # Divide entre bons e ruins
-    filmes_bons = [f for f, nota in filmes_assistidos if nota >= 3]
-    filmes_ruins = [f for f, nota in filmes_assistidos if nota < 3]
+    # Bons e ruins já separados e ordenados no perfil
+    filmes_bons = [f["titulo"] for f in perfil.favoritos] if perfil else []
+    filmes_ruins = [f["titulo"] for f in perfil.rejeitados] if perfil else []
 
     # Monta resumo do histórico
     historico_texto = ""
-    if filmes_assistidos:
+    if perfil and perfil.total:
         historico_texto = f"""
-        O usuário já assistiu {len(filmes_assistidos)} filmes.
+        O usuário já assistiu {perfil.total} filmes.
         Alguns que ele gostou muito: {', '.join(filmes_bons[:5]) or 'nenhum ainda'}.
         Alguns que ele não gostou: {', '.join(filmes_ruins[:5]) or 'nenhum'}.
         Não recomende filmes já assistidos.
@@ -50,13 +106,110 @@ def gerar_recomendacoes(persona_dados, user=None):
     else:
         historico_texto = "O usuário ainda não assistiu filmes registrados."
 
+    if parecidos:
+        historico_texto += (
+            "\nUsuários com gosto parecido avaliaram bem: "
+            + ", ".join(p["titulo"] for p in parecidos) + "."
+        )
+
+    candidatos_texto = ""
+    if candidatos:
+        candidatos_texto = (
+            "Candidatos pré-selecionados pelo catálogo (escolha os 5 melhores entre eles "
+            "e ordene do mais indicado ao menos indicado):\n" + descrever(candidatos)
+        )
+
+    return {
+        "genero": genero,
+        "humor": humor,
+        "tempo": tempo,
+        "anos": anos,
+        "historico": historico_texto,
+        "candidatos": candidatos_texto,
+    }
+
+
+def _limite_candidatos():
+    return getattr(settings, "RECOMENDACOES_CANDIDATOS", 20)
+
+
+def _candidatos(persona_dados, user, perfil=None):
+    """Candidatos do catálogo local; lista vazia se desligado ou sem metadados."""
+    if not _limite_candidatos():
+        return []
+    return gerar_candidatos(persona_dados, user=user, limite=_limite_candidatos(), perfil=perfil)
+
+
+def _chave(chain, entrada):
+    """
+    Chave do cache da IA para o pedido, sem os candidatos: eles saem de toda a
+    tabela de metadados, que ganha linhas a cada busca ou enriquecimento, e
+    mudariam a chave da mesma persona com o mesmo histórico.
+    """
+    return cache_llm.chave(chain, {**entrada, "candidatos": ""})
+
+
+def _parecidos(user):
+    """Top-K colaborativo pré-calculado do usuário (leitura em mmap, sem banco)."""
+    return colaborativo.recomendados(user.id, limite=5) if user else []
+
+
+def _sem_llm(candidatos, persona_dados, erro, user=None):
+    """
+    Resposta de reserva quando a IA falha: os candidatos, no formato JSON.
+    Sem candidatos e com a IA sobrecarregada, a última resposta guardada do
+    usuário; fora isso, o erro sobe.
+    """
+    if candidatos:
+        logger.warning("IA indisponível (%s); usando os candidatos locais.", erro)
+        return json.dumps(lista_sem_llm(candidatos, persona_dados), ensure_ascii=False)
+    if isinstance(erro, LLMSobrecarregado) and user is not None:
+        anterior = cache_llm.ultima_resposta(user)
+        if anterior is not None:
+            logger.warning("%s; repetindo a última resposta do usuário.", erro)
+            return anterior
+    raise erro
+
+
+def _montar_chains():
+    """Uma chain por item de LLM_MODELOS, na ordem: a principal e as reservas."""
+    api_key, base_url = _configuracao()
+    modelos = getattr(settings, "LLM_MODELOS", None) or [{"modelo": "gpt-4o-mini"}]
+    return [
+        _chain(
+            m.get("api_key") or api_key,
+            m.get("base_url") or base_url,
+            _formato(),
+            getattr(settings, "LLM_TIMEOUT", 30),
+            m["modelo"],
+            getattr(settings, "LLM_TENTATIVAS", 2),
+        )
+        for m in modelos
+    ]
+
+
+def _montar_chain():
+    return _montar_chains()[0]
+
+
+@lru_cache(maxsize=8)
+def _chain(api_key, base_url, formato, timeout, modelo="gpt-4o-mini", tentativas=2):
+    """
+    Chain (prompt | modelo) para a configuração dada, montada uma vez e
+    reaproveitada: o cliente HTTP do ChatOpenAI mantém as conexões abertas.
+    """
+
     # Configura modelo OpenRouter
     llm = ChatOpenAI(
-        model="gpt-4o-mini",
+        model=modelo,
         api_key=api_key,
         base_url=base_url,
         temperature=0.7,
         max_tokens=800,
+        timeout=timeout,
+        max_retries=tentativas,
+        stream_usage=True,
+        callbacks=[callback_llm],
     )
 
     # Prompt contextualizado
@@ -71,6 +224,8 @@ def gerar_recomendacoes(persona_dados, user=None):
     - Histórico de visualização: 
     {historico}
 
+    {candidatos}
+
     Tarefa:
     Recomende **5 filmes** que combinem com o perfil e preferências do usuário,
     evitando qualquer título já assistido. Dê prioridade a filmes parecidos com
@@ -83,18 +238,407 @@ def gerar_recomendacoes(persona_dados, user=None):
     - Ano de lançamento
     - Motivo da recomendação (1 frase curta)
 
-    Retorne o resultado **em HTML limpo**, sem Markdown.
-    """)
-    print(prompt)
+    {formato}
+    """).partial(formato=FORMATOS[formato])
 
-    chain = prompt | llm
+    if formato == "json":
+        llm = llm.bind(response_format=_formato_resposta())
 
-    resposta = chain.invoke({
-        "genero": genero,
-        "humor": humor,
-        "tempo": tempo,
-        "anos": anos,
-        "historico": historico_texto
-    })
-    print(resposta)
+    return prompt | llm
+
+
+# Prompts idênticos em andamento (clique duplo, abas repetidas) dividem uma
+# única chamada à IA; a chave é a mesma do cache de respostas.
+voos_llm = SingleFlight()
+
+
+def _perfil(user):
+    return perfil_de(user) if user else None
+
+
+async def _aperfil(user):
+    return await aperfil_de(user) if user else None
+
+
+def preparar(persona_dados, user=None):
+    """
+    Candidatos, chain, entrada do prompt e chave do cache de um pedido, sem
+    chamar a IA (usado também por core.pregeracao).
+    """
+    perfil = _perfil(user)
+    candidatos = _candidatos(persona_dados, user, perfil)
+    chain = _montar_chain()
+    entrada = _montar_entrada(persona_dados, perfil, candidatos, _parecidos(user))
+    return candidatos, chain, entrada, _chave(chain, entrada)
+
+
+def gerar_recomendacoes(persona_dados, user=None):
+    """
+    Gera recomendações de filmes personalizadas com base:
+    - Na persona atual
+    - Nos filmes assistidos e notas anteriores
+    - Nos anos desejados
+    - E na IA (via OpenRouter)
+
+    A IA só reordena e explica os candidatos do catálogo local quando eles
+    existem, e, se ela falhar ou estourar LLM_TIMEOUT, os próprios candidatos
+    são devolvidos. Respostas para o mesmo prompt vêm do cache persistente
+    (core.cache_llm), e a chamada à IA espera vaga no governador
+    (core.governador). Com reservas em LLM_MODELOS, um modelo lento ou com
+    erro cede a vez ao próximo (``_com_reserva``).
+    """
+    candidatos, chain, entrada, chave = preparar(persona_dados, user)
+    em_cache = cache_llm.obter(chave)
+    if em_cache is not None:
+        chamadas_llm.registrar(chain, user, acerto=True)
+        return em_cache
+
+    try:
+        return chamar_ia(entrada, chave, user)
+    except Exception as e:
+        return _sem_llm(candidatos, persona_dados, e, user)
+
+
+def chamar_ia(entrada, chave, user=None):
+    """
+    Texto da IA para uma entrada já montada (``preparar``), pelo caminho de
+    todo pedido: single-flight, vaga no governador e reservas de LLM_MODELOS.
+    A resposta vai para o cache em ``chave``; um erro sobe.
+    """
+    return voos_llm.executar(chave, _invocar, _montar_chains(), entrada, chave, user)
+
+
+def _limiar_hedge(chain):
+    """
+    Segundos de espera pela chain antes de disparar a reserva: o percentil
+    LLM_HEDGE_PERCENTIL das latências recentes do modelo (ChamadaLLM), nunca
+    abaixo de LLM_HEDGE_MINIMO; LLM_HEDGE_PADRAO enquanto não há histórico.
+    Recalculado a cada minuto.
+    """
+    nome = chamadas_llm.modelo(chain)
+
+    def calcular():
+        ms = chamadas_llm.latencia_recente(nome, percentil=getattr(settings, "LLM_HEDGE_PERCENTIL", 95))
+        if ms is None:
+            return getattr(settings, "LLM_HEDGE_PADRAO", 10)
+        return max(ms / 1000, getattr(settings, "LLM_HEDGE_MINIMO", 1))
+
+    return cache.get_or_set(f"llm:limiar:{nome}", calcular, 60)
+
+
+def _chamar(chain, entrada):
+    """``chain.invoke`` sem levantar: (resposta, erro, início), registrado por quem esperou."""
+    inicio = time.perf_counter()
+    try:
+        return chain.invoke(entrada), None, inicio
+    except Exception as e:
+        return None, e, inicio
+
+
+async def _achamar(chain, entrada):
+    inicio = time.perf_counter()
+    try:
+        return await chain.ainvoke(entrada), None, inicio
+    except Exception as e:
+        return None, e, inicio
+
+
+def _com_reserva(chains, entrada, user=None, ao_terminar=None):
+    """
+    Chama as chains em ordem até uma responder. Com LLM_HEDGE, se a atual
+    passa do seu limiar (``_limiar_hedge``) sem responder, a próxima sai em
+    paralelo e vale a primeira resposta. Um erro passa a vez para a próxima
+    da lista; sem nenhuma sobrando, o último erro sobe.
+
+    Em threads não há como interromper a chamada que perdeu: ela segue até o
+    fim, é registrada em ChamadaLLM quando termina (tokens e custo entram na
+    conta) e só então ``ao_terminar`` é chamado, de modo que quem segura uma
+    vaga do governador a mantém enquanto houver chamada em andamento.
+    """
+    fila = deque(chains)
+    hedge = getattr(settings, "LLM_HEDGE", True)
+    executor = ThreadPoolExecutor(max_workers=len(chains))
+    em_voo = {}
+
+    def disparar(motivo=None):
+        chain = fila.popleft()
+        if motivo:
+            RESERVAS.somar(1, motivo)
+        # Cada thread leva uma cópia do contexto (medição da requisição atual).
+        em_voo[executor.submit(contextvars.copy_context().run, _chamar, chain, entrada)] = chain
+        return chain
+
+    try:
+        atual, erro = disparar(), None
+        while em_voo:
+            espera = _limiar_hedge(atual) if hedge and fila and len(em_voo) == 1 else None
+            prontos, _ = wait(em_voo, timeout=espera, return_when=FIRST_COMPLETED)
+            if not prontos:
+                logger.info("%s sem resposta em %.1fs; chamando a reserva.", chamadas_llm.modelo(atual), espera)
+                atual = disparar("lentidao")
+                continue
+
+            vencedora = None
+            for futuro in prontos:
+                chain = em_voo.pop(futuro)
+                resposta, falha, inicio = futuro.result()
+                chamadas_llm.registrar(chain, user, inicio=inicio, resposta=resposta, erro=falha)
+                if falha is not None:
+                    logger.warning("%s falhou: %s", chamadas_llm.modelo(chain), falha)
+                    erro = falha
+                elif vencedora is None:
+                    vencedora = resposta
+            if vencedora is not None:
+                return vencedora
+            if not em_voo and fila:
+                atual = disparar("falha")
+        raise erro
+    finally:
+        executor.shutdown(wait=False)
+        _registrar_ao_terminar(em_voo, user, ao_terminar)
+
+
+def _registrar_ao_terminar(em_voo, user, ao_terminar):
+    """Registra as chamadas ainda em andamento quando terminarem; ``ao_terminar`` depois da última."""
+    quem_chamou = threading.current_thread()
+    lock = threading.Lock()
+    faltam = [len(em_voo)]
+
+    def terminou(futuro, chain):
+        try:
+            resposta, erro, inicio = futuro.result()
+            chamadas_llm.registrar(chain, user, inicio=inicio, resposta=resposta, erro=erro)
+        except Exception as e:
+            logger.warning("Não foi possível registrar a chamada abandonada: %s", e)
+        finally:
+            # O callback roda na thread da chamada, que não é de nenhuma requisição.
+            if threading.current_thread() is not quem_chamou:
+                connections.close_all()
+            with lock:
+                faltam[0] -= 1
+                ultima = faltam[0] == 0
+            if ultima and ao_terminar is not None:
+                ao_terminar()
+
+    if not em_voo:
+        if ao_terminar is not None:
+            ao_terminar()
+        return
+    for futuro, chain in list(em_voo.items()):
+        futuro.add_done_callback(lambda futuro, chain=chain: terminou(futuro, chain))
+
+
+async def _acom_reserva(chains, entrada, user=None):
+    """
+    Como ``_com_reserva``, com tarefas. A chamada que perde é cancelada; o
+    cancelamento termina antes do retorno e ela é registrada com o erro
+    "cancelada" (a API não informa o uso de um pedido interrompido).
+    """
+    fila = deque(chains)
+    hedge = getattr(settings, "LLM_HEDGE", True)
+    em_voo = {}
+
+    def disparar(motivo=None):
+        chain = fila.popleft()
+        if motivo:
+            RESERVAS.somar(1, motivo)
+        em_voo[asyncio.create_task(_achamar(chain, entrada))] = (chain, time.perf_counter())
+        return chain
+
+    try:
+        atual, erro = disparar(), None
+        while em_voo:
+            espera = await sync_to_async(_limiar_hedge)(atual) if hedge and fila and len(em_voo) == 1 else None
+            prontos, _ = await asyncio.wait(em_voo, timeout=espera, return_when=asyncio.FIRST_COMPLETED)
+            if not prontos:
+                logger.info("%s sem resposta em %.1fs; chamando a reserva.", chamadas_llm.modelo(atual), espera)
+                atual = disparar("lentidao")
+                continue
+
+            vencedora = None
+            for tarefa in prontos:
+                chain, _ = em_voo.pop(tarefa)
+                resposta, falha, inicio = tarefa.result()
+                await chamadas_llm.aregistrar(chain, user, inicio=inicio, resposta=resposta, erro=falha)
+                if falha is not None:
+                    logger.warning("%s falhou: %s", chamadas_llm.modelo(chain), falha)
+                    erro = falha
+                elif vencedora is None:
+                    vencedora = resposta
+            if vencedora is not None:
+                return vencedora
+            if not em_voo and fila:
+                atual = disparar("falha")
+        raise erro
+    finally:
+        for tarefa in em_voo:
+            tarefa.cancel()
+        for tarefa, (chain, inicio) in em_voo.items():
+            resultado = (await asyncio.gather(tarefa, return_exceptions=True))[0]
+            if isinstance(resultado, tuple):  # terminou antes do cancelamento
+                resposta, falha, inicio = resultado
+                await chamadas_llm.aregistrar(chain, user, inicio=inicio, resposta=resposta, erro=falha)
+            else:
+                await chamadas_llm.aregistrar(chain, user, inicio=inicio, erro="cancelada")
+
+
+def _invocar(chains, entrada, chave, user):
+    # Principal e reserva dividem uma única vaga do governador, liberada só
+    # quando a última chamada disparada termina.
+    governador.entrar()
+    resposta = _com_reserva(chains, entrada, user, ao_terminar=governador.liberar)
+    logger.debug("Resposta da IA: %s", resposta.usage_metadata)
+    cache_llm.guardar(chave, resposta.content, user=user)
     return resposta.content
+
+
+async def agerar_recomendacoes(persona_dados, user=None):
+    """Versão assíncrona de ``gerar_recomendacoes`` (ORM assíncrono + ainvoke)."""
+    perfil = await _aperfil(user)
+    candidatos = await sync_to_async(_candidatos)(persona_dados, user, perfil)
+    chain = _montar_chain()
+    entrada = _montar_entrada(persona_dados, perfil, candidatos, _parecidos(user))
+
+    chave = _chave(chain, entrada)
+    em_cache = await cache_llm.aobter(chave)
+    if em_cache is not None:
+        await chamadas_llm.aregistrar(chain, user, acerto=True)
+        return em_cache
+
+    try:
+        return await voos_llm.aexecutar(chave, lambda: _ainvocar(_montar_chains(), entrada, chave, user))
+    except Exception as e:
+        return await sync_to_async(_sem_llm)(candidatos, persona_dados, e, user)
+
+
+async def _ainvocar(chains, entrada, chave, user):
+    async with governador.avaga():
+        resposta = await _acom_reserva(chains, entrada, user)
+    await cache_llm.aguardar(chave, resposta.content, user=user)
+    return resposta.content
+
+
+def _pedacos_com_reserva(chains, entrada, user):
+    """
+    Pedaços da primeira chain de LLM_MODELOS que conseguir responder: um erro
+    antes do primeiro pedaço passa a vez para a próxima; depois dele, sobe.
+    Não há hedge no streaming: o texto já enviado ao navegador não pode ser
+    trocado pelo de outro modelo.
+    """
+    for posicao, chain in enumerate(chains):
+        if posicao:
+            RESERVAS.somar(1, "falha")
+        inicio, total = time.perf_counter(), None
+        try:
+            for pedaco in chain.stream(entrada):
+                # Somar os pedaços junta o usage_metadata, que vem no último.
+                total = pedaco if total is None else total + pedaco
+                yield pedaco
+        except Exception as e:
+            chamadas_llm.registrar(chain, user, inicio=inicio, erro=e)
+            if total is not None or posicao == len(chains) - 1:
+                raise
+            logger.warning("%s falhou: %s", chamadas_llm.modelo(chain), e)
+            continue
+        chamadas_llm.registrar(chain, user, inicio=inicio, resposta=total)
+        return
+
+
+async def _apedacos_com_reserva(chains, entrada, user):
+    for posicao, chain in enumerate(chains):
+        if posicao:
+            RESERVAS.somar(1, "falha")
+        inicio, total = time.perf_counter(), None
+        try:
+            async for pedaco in chain.astream(entrada):
+                total = pedaco if total is None else total + pedaco
+                yield pedaco
+        except Exception as e:
+            await chamadas_llm.aregistrar(chain, user, inicio=inicio, erro=e)
+            if total is not None or posicao == len(chains) - 1:
+                raise
+            logger.warning("%s falhou: %s", chamadas_llm.modelo(chain), e)
+            continue
+        await chamadas_llm.aregistrar(chain, user, inicio=inicio, resposta=total)
+        return
+
+
+def _stream_e_guardar(chains, entrada, chave, user, reserva):
+    try:
+        governador.entrar()
+    except LLMSobrecarregado as e:
+        yield reserva(e)
+        return
+
+    texto, erro = [], None
+    try:
+        for pedaco in _pedacos_com_reserva(chains, entrada, user):
+            texto.append(pedaco.content)
+            yield pedaco.content
+    except Exception as e:
+        # Com texto já enviado não há como trocar a resposta; antes dele, como
+        # em gerar_recomendacoes, a reserva local (ou o erro, sem candidatos).
+        if texto:
+            raise
+        erro = e
+    finally:
+        governador.liberar()
+    if erro is not None:
+        yield reserva(erro)
+        return
+    cache_llm.guardar(chave, "".join(texto), user=user)
+
+
+def gerar_recomendacoes_stream(persona_dados, user=None):
+    """
+    Como ``gerar_recomendacoes``, mas devolve um iterador com os pedaços de
+    texto à medida que o modelo os gera (ou a resposta do cache em um único
+    pedaço). O histórico, os candidatos e o cache são consultados já na
+    chamada. Se todos os modelos falharem antes do primeiro pedaço, vem um
+    pedaço só com a reserva local (``_sem_llm``), como na versão sem stream.
+    """
+    candidatos, chain, entrada, chave = preparar(persona_dados, user)
+    em_cache = cache_llm.obter(chave)
+    if em_cache is not None:
+        chamadas_llm.registrar(chain, user, acerto=True)
+        return iter([em_cache])
+    return _stream_e_guardar(
+        _montar_chains(), entrada, chave, user, lambda e: _sem_llm(candidatos, persona_dados, e, user),
+    )
+
+
+async def agerar_recomendacoes_stream(persona_dados, user=None):
+    """Versão assíncrona de ``gerar_recomendacoes_stream`` (gerador assíncrono)."""
+    perfil = await _aperfil(user)
+    candidatos = await sync_to_async(_candidatos)(persona_dados, user, perfil)
+    chains = _montar_chains()
+    entrada = _montar_entrada(persona_dados, perfil, candidatos, _parecidos(user))
+
+    chave = _chave(chains[0], entrada)
+    em_cache = await cache_llm.aobter(chave)
+    if em_cache is not None:
+        await chamadas_llm.aregistrar(chains[0], user, acerto=True)
+        yield em_cache
+        return
+
+    try:
+        await governador.aentrar()
+    except LLMSobrecarregado as e:
+        yield await sync_to_async(_sem_llm)(candidatos, persona_dados, e, user)
+        return
+
+    texto, erro = [], None
+    try:
+        async for pedaco in _apedacos_com_reserva(chains, entrada, user):
+            texto.append(pedaco.content)
+            yield pedaco.content
+    except Exception as e:
+        if texto:
+            raise
+        erro = e
+    finally:
+        governador.liberar()
+    if erro is not None:
+        yield await sync_to_async(_sem_llm)(candidatos, persona_dados, erro, user)
+        return
+    await cache_llm.aguardar(chave, "".join(texto), user=user)
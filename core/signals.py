@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache_llm
+from .painel import invalidar_grafico
+from .models import FilmeAssistido
+
+
+@receiver(post_save, sender=FilmeAssistido)
+@receiver(post_delete, sender=FilmeAssistido)
+def invalidar_respostas_llm(sender, instance, **kwargs):
+    """O histórico entra no prompt: respostas antigas do usuário não servem mais."""
+    cache_llm.invalidar_usuario(instance.user_id)
+
+
+@receiver(post_save, sender=FilmeAssistido)
+@receiver(post_delete, sender=FilmeAssistido)
+def invalidar_grafico_painel(sender, instance, **kwargs):
+    invalidar_grafico(instance.user_id)
@@ -0,0 +1,75 @@
+"""
+Coalescência de chamadas idênticas simultâneas ("single flight").
+
+Enquanto uma chamada com certa chave está em andamento, quem pedir a mesma
+chave espera por ela e recebe o mesmo resultado (ou a mesma exceção) em vez
+de repetir a chamada externa. Nada é guardado depois que ela termina: isso é
+papel dos caches (core.metadados, core.cache_llm).
+"""
+import asyncio
+import threading
+import weakref
+
+
+class _Voo:
+    __slots__ = ("pronto", "resultado", "erro")
+
+    def __init__(self):
+        self.pronto = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+class SingleFlight:
+    """Um grupo de chamadas coalescidas; use uma instância por tipo de chamada."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._voos = {}
+        # Futures do asyncio pertencem a um event loop; um dicionário por loop.
+        self._avoos = weakref.WeakKeyDictionary()
+        self.execucoes = 0
+        self.compartilhadas = 0
+
+    def executar(self, chave, funcao, *args, **kwargs):
+        """Executa ``funcao(*args, **kwargs)`` ou espera a execução em curso da mesma chave."""
+        with self._lock:
+            voo = self._voos.get(chave)
+            lider = voo is None
+            if lider:
+                voo = self._voos[chave] = _Voo()
+                self.execucoes += 1
+            else:
+                self.compartilhadas += 1
+
+        if not lider:
+            voo.pronto.wait()
+        else:
+            try:
+                voo.resultado = funcao(*args, **kwargs)
+            except BaseException as e:
+                voo.erro = e
+            finally:
+                with self._lock:
+                    del self._voos[chave]
+                voo.pronto.set()
+
+        if voo.erro is not None:
+            raise voo.erro
+        return voo.resultado
+
+    async def aexecutar(self, chave, fabrica):
+        """
+        Versão assíncrona: ``fabrica()`` cria a corrotina só se não houver outra
+        em curso para a chave. Cancelar um dos que esperam não cancela a chamada
+        dos demais.
+        """
+        voos = self._avoos.setdefault(asyncio.get_running_loop(), {})
+        tarefa = voos.get(chave)
+        if tarefa is None:
+            tarefa = voos[chave] = asyncio.ensure_future(fabrica())
+            tarefa.add_done_callback(lambda _: voos.pop(chave, None))
+            self.execucoes += 1
+        else:
+            self.compartilhadas += 1
+        return await asyncio.shield(tarefa)
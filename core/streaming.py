@@ -0,0 +1,151 @@
+"""
+Recomendações em streaming (Server-Sent Events).
+
+Em vez de esperar a resposta completa da IA e o enriquecimento de todos os
+títulos, os geradores daqui emitem:
+
+- ``inicio``: abertura, enviada antes de qualquer chamada à IA;
+- ``token``: cada pedaço de texto gerado pelo modelo;
+- ``filme``: o card de um filme (com o motivo da IA), assim que o item foi
+  lido e enriquecido;
+- ``erro`` / ``fim``: encerramento.
+
+O primeiro card chega com a latência do primeiro título, não da soma de
+todas as chamadas.
+"""
+import asyncio
+import json
+import queue
+import threading
+
+from django.db import connections
+
+from .metadados import aobter_por_titulo, obter_por_titulo, obter_por_titulos
+from .models import Recomendacao
+from .recommender import agerar_recomendacoes_stream, gerar_recomendacoes_stream
+from .utils import ExtratorTitulos, como_recomendacao, ler_recomendacoes, parametros_enriquecimento
+
+_FIM = object()
+
+
+def sse(evento, dados):
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
+def _ler_em_thread(pedacos):
+    """
+    Consome o iterador de pedaços da IA em uma thread e devolve uma fila com
+    os pedaços, para que o enriquecimento no banco não atrase a leitura do
+    modelo. Ao terminar, o iterador grava a resposta no cache da IA, por isso
+    a thread fecha a própria conexão com o banco.
+    """
+    fila = queue.Queue()
+
+    def ler():
+        try:
+            for pedaco in pedacos:
+                fila.put(pedaco)
+        except Exception as e:
+            fila.put(e)
+        finally:
+            connections.close_all()
+            fila.put(_FIM)
+
+    threading.Thread(target=ler, daemon=True).start()
+    return fila
+
+
+def _restantes(extrator, enviados):
+    """
+    Títulos da resposta completa que o extrator não fechou a tempo; os
+    motivos deles entram em ``extrator.motivos``.
+    """
+    restantes = []
+    for item in ler_recomendacoes(extrator.html):
+        extrator.motivos.setdefault(item["titulo"], item.get("motivo", ""))
+        if item["titulo"] not in enviados:
+            restantes.append(item["titulo"])
+    return restantes
+
+
+def eventos_recomendacao(persona, dados, user):
+    """Gerador síncrono de eventos SSE para as recomendações da persona."""
+    blocos = parametros_enriquecimento()["blocos"]
+    enviados, total = [], 0
+
+    yield sse("inicio", {})
+    try:
+        fila = _ler_em_thread(gerar_recomendacoes_stream(dados, user=user))
+    except Exception as e:
+        yield sse("erro", {"mensagem": str(e)})
+        return
+
+    extrator = ExtratorTitulos()
+    while (pedaco := fila.get()) is not _FIM:
+        if isinstance(pedaco, Exception):
+            yield sse("erro", {"mensagem": str(pedaco)})
+            return
+        yield sse("token", pedaco)
+        for titulo in extrator.alimentar(pedaco):
+            enviados.append(titulo)
+            filme = obter_por_titulo(titulo, blocos)
+            if filme:
+                total += 1
+                yield sse("filme", como_recomendacao(filme, extrator.motivos.get(titulo, "")))
+
+    Recomendacao.objects.create(persona=persona, filmes_html=extrator.html)
+
+    restantes = _restantes(extrator, enviados)
+    for titulo, filme in zip(restantes, obter_por_titulos(restantes, **parametros_enriquecimento())):
+        if filme:
+            total += 1
+            yield sse("filme", como_recomendacao(filme, extrator.motivos[titulo]))
+
+    yield sse("fim", {"total": total})
+
+
+async def aeventos_recomendacao(persona, dados, user):
+    """
+    Versão assíncrona de ``eventos_recomendacao``: cada título é enriquecido
+    em uma tarefa própria enquanto o modelo continua gerando.
+    """
+    blocos = parametros_enriquecimento()["blocos"]
+    enviados, pendentes, total = [], [], 0
+    extrator = ExtratorTitulos()
+
+    async def card(titulo):
+        filme = await aobter_por_titulo(titulo, blocos)
+        return filme and como_recomendacao(filme, extrator.motivos.get(titulo, ""))
+
+    def concluidas():
+        for tarefa in [t for t in pendentes if t.done()]:
+            pendentes.remove(tarefa)
+            if not tarefa.cancelled() and not tarefa.exception() and tarefa.result():
+                yield tarefa.result()
+
+    yield sse("inicio", {})
+    try:
+        async for pedaco in agerar_recomendacoes_stream(dados, user=user):
+            yield sse("token", pedaco)
+            for titulo in extrator.alimentar(pedaco):
+                enviados.append(titulo)
+                pendentes.append(asyncio.ensure_future(card(titulo)))
+            for cartao in concluidas():
+                total += 1
+                yield sse("filme", cartao)
+    except Exception as e:
+        for tarefa in pendentes:
+            tarefa.cancel()
+        yield sse("erro", {"mensagem": str(e)})
+        return
+
+    await Recomendacao.objects.acreate(persona=persona, filmes_html=extrator.html)
+
+    pendentes.extend(asyncio.ensure_future(card(t)) for t in _restantes(extrator, enviados))
+    while pendentes:
+        await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+        for cartao in concluidas():
+            total += 1
+            yield sse("filme", cartao)
+
+    yield sse("fim", {"total": total})
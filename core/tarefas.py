@@ -0,0 +1,122 @@
+"""
+Fila de geração de recomendações guardada no banco.
+
+O POST da persona só enfileira uma ``TarefaRecomendacao`` e devolve o id; o
+comando ``worker_recomendacoes`` roda um pool de threads locais que reservam
+tarefas pendentes, chamam a IA e o enriquecimento e gravam o resultado. Não
+precisa de broker externo: a reserva é um UPDATE condicional no próprio banco.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .governador import LLMSobrecarregado
+from .models import Recomendacao, TarefaRecomendacao
+from .recommender import gerar_recomendacoes
+from .utils import buscar_filmes_imdb
+
+logger = logging.getLogger(__name__)
+
+
+def gerar_e_enriquecer(persona, dados, user):
+    """
+    Pipeline completo de uma recomendação: IA (com cache), registro da
+    Recomendacao e enriquecimento no TMDb. Devolve a lista de filmes.
+    """
+    recomendacoes_html = gerar_recomendacoes(dados, user=user)
+    Recomendacao.objects.create(persona=persona, filmes_html=recomendacoes_html)
+
+    return buscar_filmes_imdb(recomendacoes_html)
+
+
+def _chave(user, dados):
+    conteudo = json.dumps({"user": user.id, **dados}, sort_keys=True, default=str)
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+
+def enfileirar(user, persona, dados):
+    """
+    Cria a tarefa, ou devolve a que já está pendente/em execução para o mesmo
+    usuário e os mesmos dados de persona (reenvio do navegador, clique duplo).
+    A restrição ``tarefa_chave_em_andamento`` garante uma só mesmo com
+    requisições simultâneas.
+    """
+    chave = _chave(user, dados)
+    em_andamento = TarefaRecomendacao.objects.filter(
+        chave=chave,
+        status__in=[TarefaRecomendacao.PENDENTE, TarefaRecomendacao.EXECUTANDO],
+    )
+    for _ in range(3):
+        existente = em_andamento.first()
+        if existente:
+            return existente
+        try:
+            with transaction.atomic():
+                return TarefaRecomendacao.objects.create(
+                    user=user, persona=persona, chave=chave, dados=dados,
+                )
+        except IntegrityError:
+            # Outra requisição criou a mesma tarefa entre a consulta e o INSERT.
+            continue
+    return em_andamento.get()
+
+
+def _devolver_abandonadas():
+    """Volta para a fila tarefas cujo worker sumiu no meio da execução."""
+    limite = timezone.now() - timedelta(seconds=getattr(settings, "TAREFAS_TIMEOUT", 300))
+    TarefaRecomendacao.objects.filter(
+        status=TarefaRecomendacao.EXECUTANDO, iniciado_em__lt=limite,
+    ).update(status=TarefaRecomendacao.PENDENTE)
+
+
+def reservar_proxima(worker):
+    """
+    Reserva a tarefa pendente mais antiga para ``worker``. O UPDATE só afeta a
+    linha se ela ainda estiver pendente, então dois workers nunca pegam a
+    mesma tarefa. Devolve None se a fila estiver vazia.
+    """
+    _devolver_abandonadas()
+    pendentes = TarefaRecomendacao.objects.filter(
+        status=TarefaRecomendacao.PENDENTE,
+    ).order_by("criado_em").values_list("id", flat=True)
+
+    for tarefa_id in pendentes[:10]:
+        reservada = TarefaRecomendacao.objects.filter(
+            id=tarefa_id, status=TarefaRecomendacao.PENDENTE,
+        ).update(status=TarefaRecomendacao.EXECUTANDO, iniciado_em=timezone.now(), worker=worker)
+        if reservada:
+            return TarefaRecomendacao.objects.select_related("user", "persona").get(id=tarefa_id)
+    return None
+
+
+def executar(tarefa):
+    """Roda o pipeline da tarefa e grava o resultado (ou o erro)."""
+    tarefa.tentativas += 1
+    try:
+        filmes = gerar_e_enriquecer(tarefa.persona, tarefa.dados, tarefa.user)
+    except LLMSobrecarregado as e:
+        if tarefa.tentativas >= getattr(settings, "TAREFAS_MAX_TENTATIVAS", 5):
+            logger.warning("Tarefa %s desistiu após %s tentativas: %s", tarefa.id, tarefa.tentativas, e)
+            tarefa.status = TarefaRecomendacao.ERRO
+            tarefa.erro = str(e)
+        else:
+            # Sem vaga na IA agora: volta para a fila em vez de falhar.
+            logger.warning("Tarefa %s devolvida à fila: %s", tarefa.id, e)
+            tarefa.status = TarefaRecomendacao.PENDENTE
+            tarefa.save(update_fields=["status", "tentativas"])
+            return tarefa
+    except Exception as e:
+        logger.exception("Tarefa %s falhou", tarefa.id)
+        tarefa.status = TarefaRecomendacao.ERRO
+        tarefa.erro = str(e)
+    else:
+        tarefa.status = TarefaRecomendacao.CONCLUIDA
+        tarefa.resultado = filmes
+    tarefa.concluido_em = timezone.now()
+    tarefa.save(update_fields=["status", "resultado", "erro", "tentativas", "concluido_em"])
+    return tarefa
@@ -1,3 +1,1304 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+
+import requests
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.urls import include, path
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.functional import cached_property
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_openai import ChatOpenAI
+
+from . import cache_camadas, cache_llm, candidatos, chamadas_llm, catalogo, colaborativo, historico, metadados, metricas, posters, pregeracao, recommender, tarefas, views_async
+from .models import ChamadaLLM, FilmeAssistido, FilmeMetadados, PerfilGosto, Persona, RespostaLLM, TarefaRecomendacao
+from .perfil import reconstruir
+from .metadados import sessao_tmdb
+from .benchmarks import carga
+from .benchmarks.upstream import OpenAIFalso
+from .recommender import gerar_recomendacoes, gerar_recomendacoes_stream
+from .governador import GovernadorLLM, LLMSobrecarregado, governador
+from .singleflight import SingleFlight
+from .tmdb import Balde, cliente_tmdb
+from .utils import ExtratorTitulos, ler_recomendacoes
+
+_pasta_cache = tempfile.TemporaryDirectory()
+
+
+def setUpModule():
+    # Um cache só dos testes, em vez do arquivo compartilhado em /tmp.
+    local = {"LOCATION": os.path.join(_pasta_cache.name, "cache.sqlite3")}
+    override_settings(CACHES={"default": {**settings.CACHES["default"], **local}}).enable()
+
+
+class RespostaFalsa:
+    def __init__(self, dados, status_code=200, headers=None):
+        self._dados = dados
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def json(self):
+        return self._dados
+
+    def raise_for_status(self):
+        pass
+
+
+def tmdb_falso(url, params=None, timeout=None):
+    """Simula a API do TMDb: 8 resultados de busca e detalhes para qualquer id."""
+    if url.endswith("/search/movie"):
+        return RespostaFalsa({"results": [
+            {"id": i, "title": f"Filme {i}", "release_date": "2001-01-01", "poster_path": f"/p{i}.jpg"}
+            for i in range(1, 11)
+        ]})
+    tmdb_id = int(url.rsplit("/", 1)[1])
+    return RespostaFalsa({
+        "id": tmdb_id,
+        "title": f"Filme {tmdb_id}",
+        "release_date": "2001-01-01",
+        "external_ids": {"imdb_id": f"tt{tmdb_id:07d}"},
+    })
+
+
+@override_settings(CATALOGO_PATH="")
+class BuscarFilmeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("ana", password="senha")
+        self.client.force_login(self.user)
+        FilmeAssistido.objects.create(user=self.user, titulo="Filme 1", tmdb_id=1, nota=5)
+        FilmeAssistido.objects.create(user=self.user, titulo="Outro", imdb_id="tt0000002", nota=4)
+        FilmeAssistido.objects.create(user=self.user, titulo="Filme 3", nota=2)
+
+    def buscar(self):
+        return self.client.get("/buscar_filme/", {"q": "filme"}).json()["results"]
+
+    @mock.patch.object(sessao_tmdb, "get", side_effect=tmdb_falso)
+    def test_notas_casam_por_tmdb_imdb_ou_titulo(self, get):
+        resultados = self.buscar()
+
+        self.assertEqual(len(resultados), 8)
+        self.assertEqual([r["user_rating"] for r in resultados[:4]], [5, 4, 2, None])
+        self.assertEqual(resultados[1]["imdb_id"], "tt0000002")
+
+    @mock.patch.object(sessao_tmdb, "get", side_effect=tmdb_falso)
+    def test_orcamento_fixo_de_consultas(self, get):
+        # sessão + usuário + metadados + upsert dos metadados + notas
+        with self.assertNumQueries(5):
+            self.buscar()
+        self.assertEqual(get.call_count, 1 + 8)
+
+        # Com os metadados já guardados e a busca no cache, nada de TMDb nem de upsert.
+        get.reset_mock()
+        with self.assertNumQueries(4):
+            self.buscar()
+        get.assert_not_called()
+
+
+@override_settings(TMDB_METADADOS_TTL={"basico": 100, "creditos": 10}, TMDB_METADADOS_STALE=0)
+class MetadadosTests(TestCase):
+    def guardar(self, idades):
+        """Amélie (tmdb_id 1) com cada bloco atualizado há ``idades[bloco]`` segundos."""
+        registro = FilmeMetadados(tmdb_id=1, titulo="Amélie", titulo_original="Le Fabuleux Destin d'Amélie Poulain")
+        registro.atualizado_em = {bloco: time.time() - idade for bloco, idade in idades.items()}
+        registro.save()
+
+    def test_ttl_por_bloco(self):
+        self.guardar({"basico": 50, "detalhes": 50, "creditos": 50})
+        with mock.patch.object(sessao_tmdb, "get", side_effect=tmdb_falso) as get:
+            self.assertEqual(metadados.obter_filme(1).titulo, "Amélie")
+            get.assert_not_called()
+            # Os créditos vencem em 10 s: só quem pede esse bloco vai ao TMDb.
+            atualizado = metadados.obter_filme(1, ("creditos",))
+
+        get.assert_called_once()
+        self.assertEqual(atualizado.titulo, "Filme 1")
+        self.assertEqual(FilmeMetadados.objects.get(tmdb_id=1).titulo_normalizado, "filme 1")
+
+    @override_settings(TMDB_METADADOS_STALE=1000)
+    def test_vencido_na_janela_sai_do_banco_e_revalida_em_segundo_plano(self):
+        self.guardar({"basico": 500, "detalhes": 50})
+        with mock.patch.object(sessao_tmdb, "get", side_effect=tmdb_falso) as get, \
+                mock.patch.object(metadados, "_atualizar_em_segundo_plano") as revalidar:
+            registro = metadados.obter_filme(1)
+        get.assert_not_called()
+        self.assertEqual(registro.titulo, "Amélie")
+        revalidar.assert_called_once_with(1, ["basico"])
+
+    @override_settings(TMDB_METADADOS_STALE=1000)
+    def test_vencido_alem_da_janela_vai_ao_tmdb_na_hora(self):
+        self.guardar({"basico": 2000, "detalhes": 50})
+        with mock.patch.object(sessao_tmdb, "get", side_effect=tmdb_falso) as get:
+            self.assertEqual(metadados.obter_filme(1).titulo, "Filme 1")
+        get.assert_called_once()
+
+    def test_titulo_com_acento_sem_diferenciar_caixa(self):
+        self.guardar({"basico": 0})
+        self.assertEqual(
+            metadados.ids_por_titulo(["AMÉLIE", "amelie", "le fabuleux destin d'amélie poulain", "Outro"]),
+            [1, 1, 1, None],
+        )
+
+
+class ExecutarEmParaleloTests(SimpleTestCase):
+    def test_prazo_devolve_resultados_parciais(self):
+        liberar = threading.Event()
+        self.addCleanup(liberar.set)
+
+        def buscar(item):
+            if item == "lento":
+                liberar.wait(5)
+            elif item == "falha":
+                raise requests.ConnectionError("sem rede")
+            return item.upper()
+
+        inicio = time.monotonic()
+        resultados = metadados.executar_em_paralelo(buscar, ["a", "lento", "falha", "b"], prazo=0.2)
+        decorrido = time.monotonic() - inicio
+
+        self.assertEqual(resultados, ["A", None, None, "B"])
+        self.assertGreaterEqual(decorrido, 0.2)
+        self.assertLess(decorrido, 1)
+
+    def test_prazo_na_versao_assincrona(self):
+        async def buscar(item):
+            if item == "lento":
+                await asyncio.sleep(5)
+            return item.upper()
+
+        inicio = time.monotonic()
+        resultados = async_to_sync(metadados.aexecutar_em_paralelo)(buscar, ["a", "lento", "b"], prazo=0.2)
+        decorrido = time.monotonic() - inicio
+
+        self.assertEqual(resultados, ["A", None, "B"])
+        self.assertLess(decorrido, 1)
+
+
+@override_settings(OPENROUTER_API_KEY="teste", LLM_CACHE_MAX_ENTRADAS=2)
+@mock.patch.object(ChatOpenAI, "invoke", side_effect=lambda *a, **k: AIMessage(content="<h2>Matrix</h2>"))
+class CacheLLMTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("bia", password="senha")
+        self.dados = {"genero_favorito": "ação", "humor": "feliz", "tempo_disponivel": "curto", "anos": "todos"}
+
+    def test_mesmo_prompt_usa_o_cache(self, invoke):
+        gerar_recomendacoes(self.dados, user=self.user)
+        self.assertEqual(gerar_recomendacoes(self.dados, user=self.user), "<h2>Matrix</h2>")
+
+        self.assertEqual(invoke.call_count, 1)
+        self.assertEqual(cache_llm.estatisticas()["acertos"], 1)
+        self.assertEqual(cache_llm.estatisticas()["falhas"], 1)
+
+    def test_chave_inclui_todo_o_prompt(self, invoke):
+        gerar_recomendacoes(self.dados, user=self.user)
+        gerar_recomendacoes({**self.dados, "anos": "antigos"}, user=self.user)
+        gerar_recomendacoes({**self.dados, "tempo_disponivel": "longo"}, user=self.user)
+
+        self.assertEqual(invoke.call_count, 3)
+
+    def test_lru_remove_a_menos_usada(self, invoke):
+        gerar_recomendacoes(self.dados, user=self.user)
+        gerar_recomendacoes({**self.dados, "anos": "antigos"}, user=self.user)
+        gerar_recomendacoes(self.dados, user=self.user)  # acerto: vira a mais recente
+        gerar_recomendacoes({**self.dados, "anos": "atuais"}, user=self.user)
+
+        self.assertEqual(RespostaLLM.objects.count(), 2)
+        self.assertEqual(cache_llm.estatisticas()["remocoes"], 1)
+        gerar_recomendacoes(self.dados, user=self.user)
+        self.assertEqual(invoke.call_count, 3)
+
+    def test_historico_novo_invalida(self, invoke):
+        gerar_recomendacoes(self.dados, user=self.user)
+        FilmeAssistido.objects.create(user=self.user, titulo="Matrix", nota=5)
+
+        self.assertFalse(RespostaLLM.objects.filter(user=self.user).exists())
+
+
+RESPOSTA_JSON = (
+    '{"filmes":[{"titulo":"Matrix","ano":1999,"genero":"Ficção","duracao":136,"motivo":"Ação com ideias."},'
+    '{"titulo":"O \\"Poderoso\\" Chefão","ano":1972,"genero":"Drama","duracao":175,"motivo":"Clássico."}]}'
+)
+
+
+class LerRecomendacoesTests(TestCase):
+    def test_json_no_esquema(self):
+        itens = ler_recomendacoes(RESPOSTA_JSON)
+
+        self.assertEqual([i["titulo"] for i in itens], ["Matrix", 'O "Poderoso" Chefão'])
+        self.assertEqual(itens[0]["motivo"], "Ação com ideias.")
+
+    def test_html_continua_aceito(self):
+        self.assertEqual(ler_recomendacoes("<h2>Matrix</h2><h2>Alien</h2>"), [{"titulo": "Matrix"}, {"titulo": "Alien"}])
+
+    def test_extrator_de_json_em_pedacos(self):
+        extrator = ExtratorTitulos()
+        novos = [extrator.alimentar(RESPOSTA_JSON[i:i + 7]) for i in range(0, len(RESPOSTA_JSON), 7)]
+
+        self.assertEqual([t for lote in novos for t in lote], ["Matrix", 'O "Poderoso" Chefão'])
+
+
+def ler_sse(eventos):
+    """(evento, dados) de cada mensagem SSE, conferindo o formato."""
+    lidos = []
+    for mensagem in eventos:
+        evento, dados, vazio = mensagem.split("\n", 2)
+        assert evento.startswith("event: ") and dados.startswith("data: ") and vazio == "\n", mensagem
+        lidos.append((evento[len("event: "):], json.loads(dados[len("data: "):])))
+    return lidos
+
+
+class StreamingTests(TestCase):
+    def setUp(self):
+        self.persona = Persona.objects.create(user=User.objects.create_user("ana", password="x"))
+        self.pedacos = [RESPOSTA_JSON[i:i + 7] for i in range(0, len(RESPOSTA_JSON), 7)]
+
+    @staticmethod
+    def filme(titulo, blocos=None):
+        return FilmeMetadados(tmdb_id=len(titulo), titulo=titulo)
+
+    def conferir(self, eventos):
+        nomes = [evento for evento, _ in eventos]
+        self.assertEqual(nomes[0], "inicio")
+        self.assertEqual(nomes[-1], "fim")
+        self.assertEqual(eventos[-1][1], {"total": 2})
+        self.assertEqual("".join(d for e, d in eventos if e == "token"), RESPOSTA_JSON)
+
+        cards = [d for e, d in eventos if e == "filme"]
+        self.assertEqual([(c["titulo"], c["motivo"]) for c in cards], [("Matrix", "Ação com ideias."), ('O "Poderoso" Chefão', "Clássico.")])
+        # Cada card sai logo depois do token que fecha o seu item, antes do fim da resposta.
+        self.assertLess(nomes.index("filme"), len(nomes) - 3)
+
+    def test_eventos_em_ordem_com_motivo(self):
+        from . import streaming
+
+        with mock.patch.object(streaming, "gerar_recomendacoes_stream", return_value=iter(self.pedacos)), \
+                mock.patch.object(streaming, "obter_por_titulo", side_effect=self.filme):
+            eventos = ler_sse(streaming.eventos_recomendacao(self.persona, {}, self.persona.user))
+
+        self.conferir(eventos)
+
+    def test_eventos_assincronos_em_ordem_com_motivo(self):
+        from . import streaming
+
+        async def gerar(*args, **kwargs):
+            for pedaco in self.pedacos:
+                await asyncio.sleep(0)  # a rede devolve o controle ao loop
+                yield pedaco
+
+        async def coletar():
+            return [e async for e in streaming.aeventos_recomendacao(self.persona, {}, self.persona.user)]
+
+        async def aobter(titulo, blocos=None):
+            return self.filme(titulo)
+
+        with mock.patch.object(streaming, "agerar_recomendacoes_stream", side_effect=gerar), \
+                mock.patch.object(streaming, "aobter_por_titulo", side_effect=aobter):
+            eventos = ler_sse(async_to_sync(coletar)())
+
+        self.conferir(eventos)
+
+
+DUMP = [
+    {"id": 238, "title": "O Poderoso Chefão", "original_title": "The Godfather", "release_date": "1972-03-14", "popularity": 90.0, "imdb_id": "tt0068646"},
+    {"id": 240, "title": "O Poderoso Chefão: Parte II", "original_title": "The Godfather Part II", "release_date": "1974-12-20", "popularity": 60.0},
+    {"id": 603, "title": "Matrix", "original_title": "The Matrix", "release_date": "1999-03-30", "popularity": 80.0},
+    {"id": 604, "title": "Matrix Reloaded", "original_title": "The Matrix Reloaded", "release_date": "2003-05-15", "popularity": 95.0},
+]
+
+
+class CatalogoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.caminho = os.path.join(pasta.name, "catalogo.sqlite3")
+        catalogo.importar((json.dumps(f) for f in DUMP), destino=self.caminho)
+        self.enterContext(override_settings(CATALOGO_PATH=self.caminho))
+
+    def titulos(self, termo):
+        return [f["title"] for f in catalogo.buscar(termo)]
+
+    def test_prefixo_sem_acento_por_popularidade(self):
+        self.assertEqual(self.titulos("matr"), ["Matrix Reloaded", "Matrix"])
+        self.assertEqual(self.titulos("poderoso chefao"), ["O Poderoso Chefão", "O Poderoso Chefão: Parte II"])
+        self.assertEqual(self.titulos("godfather part"), ["O Poderoso Chefão: Parte II"])
+        self.assertEqual(self.titulos("inexistente"), [])
+
+    @mock.patch.object(sessao_tmdb, "get", side_effect=tmdb_falso)
+    def test_buscar_filme_usa_o_catalogo(self, get):
+        resultados = self.client.get("/buscar_filme/", {"q": "chef"}).json()["results"]
+
+        self.assertEqual([r["tmdb_id"] for r in resultados], [238, 240])
+        self.assertEqual(resultados[0]["imdb_id"], "tt0068646")
+        get.assert_not_called()
+
+    @mock.patch.object(sessao_tmdb, "get", side_effect=tmdb_falso)
+    def test_falta_no_catalogo_vai_ao_tmdb(self, get):
+        resultados = self.client.get("/buscar_filme/", {"q": "filme"}).json()["results"]
+
+        self.assertEqual(len(resultados), 8)
+        self.assertTrue(get.called)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_chamadas_simultaneas_compartilham_o_resultado(self):
+        voos, liberar, chamadas = SingleFlight(), threading.Event(), []
+
+        def lenta(termo):
+            chamadas.append(termo)
+            liberar.wait(2)
+            return termo.upper()
+
+        resultados = []
+        threads = [
+            threading.Thread(target=lambda: resultados.append(voos.executar("matrix", lenta, "matrix")))
+            for _ in range(5)
+        ]
+        for t in threads:
+            t.start()
+        while voos.execucoes + voos.compartilhadas < 5:
+            pass
+        liberar.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(chamadas, ["matrix"])
+        self.assertEqual(resultados, ["MATRIX"] * 5)
+        self.assertEqual(voos.execucoes, 1)
+
+    def test_erro_chega_a_todos_e_nao_fica_guardado(self):
+        voos = SingleFlight()
+        with self.assertRaises(ZeroDivisionError):
+            voos.executar("x", lambda: 1 / 0)
+        self.assertEqual(voos.executar("x", lambda: 1), 1)
+
+    def test_versao_assincrona(self):
+        voos, chamadas = SingleFlight(), []
+
+        async def buscar():
+            chamadas.append(1)
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        async def varias():
+            return await asyncio.gather(*(voos.aexecutar("k", buscar) for _ in range(10)))
+
+        self.assertEqual(asyncio.run(varias()), ["ok"] * 10)
+        self.assertEqual(len(chamadas), 1)
+
+
+def filme(tmdb_id, titulo, ano, generos, duracao, popularidade=10):
+    return FilmeMetadados.objects.create(
+        tmdb_id=tmdb_id, titulo=titulo, ano=str(ano), generos=generos, duracao=duracao, popularidade=popularidade,
+    )
+
+
+class CandidatosTests(TestCase):
+    def setUp(self):
+        candidatos._versao = None
+        self.user = User.objects.create_user("caio", password="senha")
+        filme(1, "Alien", 1979, ["Terror", "Ficção científica"], 117)
+        filme(2, "Aliens", 1986, ["Ação", "Ficção científica"], 137)
+        filme(3, "Matrix", 1999, ["Ação", "Ficção científica"], 136)
+        filme(4, "Amélie", 2001, ["Comédia", "Romance"], 122, popularidade=500)
+        filme(5, "Toy Story", 1995, ["Animação", "Comédia"], 81)
+        filme(6, "Duna", 2021, ["Ficção científica"], 155)
+        self.dados = {"genero_favorito": "ficção científica", "tempo_disponivel": "longo", "anos": "todos"}
+
+    def titulos(self, dados):
+        return [c["titulo"] for c in candidatos.gerar_candidatos(dados, user=self.user)]
+
+    def test_gosto_e_filtros(self):
+        FilmeAssistido.objects.create(user=self.user, titulo="Matrix", tmdb_id=3, nota=5)
+        FilmeAssistido.objects.create(user=self.user, titulo="Amélie", tmdb_id=4, nota=1)
+
+        titulos = self.titulos(self.dados)
+        self.assertEqual(titulos[0], "Aliens")
+        self.assertNotIn("Matrix", titulos)
+        self.assertNotIn("Toy Story", titulos)  # curto demais
+        self.assertEqual(self.titulos({**self.dados, "anos": "atuais"}), ["Duna"])
+
+    @override_settings(OPENROUTER_API_KEY="teste")
+    @mock.patch.object(ChatOpenAI, "invoke", side_effect=TimeoutError("lenta"))
+    def test_ia_fora_do_ar_usa_os_candidatos(self, invoke):
+        lista = ler_recomendacoes(gerar_recomendacoes(self.dados, user=self.user))
+
+        self.assertEqual(len(lista), 4)
+        self.assertTrue(all(f["titulo"] in {"Alien", "Aliens", "Matrix", "Duna", "Amélie"} for f in lista))
+        self.assertIn("ficção científica", lista[0]["motivo"])
+
+    @override_settings(OPENROUTER_API_KEY="teste", RECOMENDACOES_CANDIDATOS=3)
+    @mock.patch.object(ChatOpenAI, "invoke", side_effect=lambda *a, **k: AIMessage(content=RESPOSTA_JSON))
+    def test_filme_novo_no_catalogo_nao_muda_a_chave_do_cache(self, invoke):
+        antes = recommender.preparar(self.dados, self.user)
+        gerar_recomendacoes(self.dados, user=self.user)
+
+        # Uma busca qualquer guarda um filme que entra no topo dos candidatos.
+        filme(7, "Interestelar", 2014, ["Ficção científica"], 169, popularidade=5000)
+        depois = recommender.preparar(self.dados, self.user)
+        self.assertIn("Interestelar", [c["titulo"] for c in depois[0]])
+        self.assertNotIn("Interestelar", [c["titulo"] for c in antes[0]])
+
+        self.assertEqual(depois[3], antes[3])
+        self.assertEqual(gerar_recomendacoes(self.dados, user=self.user), RESPOSTA_JSON)
+        self.assertEqual(invoke.call_count, 1)
+
+
+class ColaborativoTests(TestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.enterContext(override_settings(COLABORATIVO_DIR=os.path.join(pasta.name, "modelo")))
+
+        notas = {"Matrix": 5, "Alien": 5, "Aliens": 5, "Amélie": 1, "Toy Story": 2}
+        for nome in ("a", "b", "c"):
+            user = User.objects.create_user(nome)
+            for i, (titulo, nota) in enumerate(notas.items(), start=1):
+                FilmeAssistido.objects.create(user=user, titulo=titulo, tmdb_id=i, nota=nota)
+        self.novo = User.objects.create_user("novo")
+        FilmeAssistido.objects.create(user=self.novo, titulo="Matrix", tmdb_id=1, nota=5)
+        FilmeAssistido.objects.create(user=self.novo, titulo="Alien", tmdb_id=2, nota=5)
+
+    def test_treino_e_top_k(self):
+        call_command("treinar_colaborativo", "--fatores", "4", "--iteracoes", "15", stdout=mock.MagicMock())
+
+        recomendados = colaborativo.recomendados(self.novo.id, nota_minima=0)
+        self.assertEqual([r["titulo"] for r in recomendados], ["Aliens", "Toy Story", "Amélie"])
+        self.assertEqual(recomendados[0]["tmdb_id"], 3)
+        self.assertEqual([r["titulo"] for r in colaborativo.recomendados(self.novo.id)], ["Aliens"])
+
+    def test_sem_modelo(self):
+        self.assertEqual(colaborativo.recomendados(self.novo.id), [])
+
+
+class PerfilGostoTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("duda", password="senha")
+        self.client.force_login(self.user)
+        filme(1, "Alien", 1979, ["Terror", "Ficção científica"], 117)
+        filme(2, "Amélie", 2001, ["Comédia", "Romance"], 122)
+
+    def marcar(self, titulo, nota, tmdb_id=None):
+        return self.client.post(
+            "/marcar_assistido/", json.dumps({"titulo": titulo, "nota": nota, "tmdb_id": tmdb_id}),
+            content_type="application/json",
+        )
+
+    def test_atualizacao_incremental_igual_ao_recalculo(self):
+        self.marcar("Alien", 5, 1)
+        self.marcar("Amélie", 4, 2)
+        self.marcar("Matrix", 1)
+        self.marcar("Amélie", 2, 2)  # nota alterada
+
+        perfil = PerfilGosto.objects.get(user=self.user)
+        self.assertEqual((perfil.total, perfil.soma_notas), (3, 8))
+        self.assertEqual(perfil.histograma, {"1": 1, "2": 1, "4": 0, "5": 1})
+        self.assertEqual([f["titulo"] for f in perfil.favoritos], ["Alien"])
+        self.assertEqual([f["titulo"] for f in perfil.rejeitados], ["Matrix", "Amélie"])
+        self.assertEqual(perfil.afinidades(), {"Terror": 2, "Ficção científica": 2, "Comédia": -1, "Romance": -1})
+
+        recalculado = reconstruir(self.user)
+        self.assertEqual(recalculado.soma_notas, perfil.soma_notas)
+        self.assertEqual(recalculado.afinidades(), perfil.afinidades())
+
+    @mock.patch.object(PerfilGosto, "LIMITE_LISTAS", 2)
+    def test_favorito_que_vira_rejeitado_repoe_a_lista(self):
+        self.marcar("Alien", 5, 1)
+        self.marcar("Amélie", 4, 2)
+        self.marcar("Matrix", 3)
+        # Os gêneros do Alien mudam no TMDb depois da primeira nota.
+        FilmeMetadados.objects.filter(tmdb_id=1).update(generos=["Drama"])
+        self.marcar("Alien", 1, 1)
+
+        perfil = PerfilGosto.objects.get(user=self.user)
+        self.assertEqual([f["titulo"] for f in perfil.favoritos], ["Amélie", "Matrix"])
+        self.assertEqual([f["titulo"] for f in perfil.rejeitados], ["Alien"])
+        # Saem os gêneros contados na primeira nota, entram os atuais.
+        self.assertEqual(perfil.afinidades(), {"Comédia": 1, "Romance": 1, "Drama": -2})
+
+    def test_painel_le_o_perfil(self):
+        self.marcar("Alien", 5, 1)
+        resposta = self.client.get("/meu-perfil/")
+
+        self.assertEqual(resposta.context["total_filmes"], 1)
+        self.assertEqual(resposta.context["generos_preferidos"][0], ("Terror", 2.0))
+
+
+class PainelTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("edu", password="senha")
+        self.client.force_login(self.user)
+        for i in range(25):
+            FilmeAssistido.objects.create(user=self.user, titulo=f"Filme {i}", nota=i % 5 + 1)
+
+    def test_historico_paginado_por_cursor(self):
+        primeira = self.client.get("/meu-perfil/")
+        cursor = primeira.context["proximo_cursor"]
+        segunda = self.client.get("/meu-perfil/", {"antes": cursor})
+
+        titulos = [f.titulo for f in primeira.context["filmes"]] + [f.titulo for f in segunda.context["filmes"]]
+        self.assertEqual(len(primeira.context["filmes"]), 20)
+        self.assertEqual(titulos, [f"Filme {i}" for i in reversed(range(25))])
+        self.assertIsNone(segunda.context["proximo_cursor"])
+
+    def test_grafico_em_cache_ate_nova_nota(self):
+        series = self.client.get("/meu-perfil/grafico/").json()
+        self.assertEqual(series["distribuicao"], {str(n): 5 for n in range(1, 6)})
+        self.assertEqual(sum(p["filmes"] for p in series["ao_longo_do_tempo"]), 25)
+        self.assertEqual(len(series["pontos"]), 25)
+
+        with self.assertNumQueries(2):  # só sessão e usuário: as séries vêm do cache
+            self.client.get("/meu-perfil/grafico/")
+
+        self.client.post(
+            "/marcar_assistido/", json.dumps({"titulo": "Novo", "nota": 5}), content_type="application/json",
+        )
+        series = self.client.get("/meu-perfil/grafico/").json()
+        self.assertEqual(series["distribuicao"]["5"], 6)
+
+
+LETTERBOXD = """Date,Name,Year,Letterboxd URI,Rating
+2023-01-10,Alien,1979,https://boxd.it/a,4.5
+2023-02-11,Amélie,2001,https://boxd.it/b,2
+2023-03-12,Sem nota,2001,https://boxd.it/c,
+2023-04-13,Alien,1979,https://boxd.it/a,5
+"""
+
+
+class HistoricoTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("fabi", password="senha")
+        self.client.force_login(self.user)
+        filme(1, "Alien", 1979, ["Terror"], 117)
+
+    def test_importa_csv_em_lotes_com_upsert(self):
+        FilmeAssistido.objects.create(user=self.user, titulo="Amélie", nota=5)
+        with mock.patch("core.metadados.tmdb_get", side_effect=tmdb_falso) as tmdb:
+            resumo = historico.importar(self.user, io.StringIO(LETTERBOXD), lote=2, buscar_tmdb=False)
+        tmdb.assert_not_called()
+
+        self.assertEqual(resumo, {"lidos": 4, "gravados": 3, "ignorados": 1, "sem_id": 1})
+        alien = FilmeAssistido.objects.get(user=self.user, titulo="Alien")
+        self.assertEqual((alien.nota, alien.tmdb_id, alien.data_assistido.date().isoformat()), (5, 1, "2023-04-13"))
+        self.assertEqual(FilmeAssistido.objects.get(user=self.user, titulo="Amélie").nota, 2)
+        self.assertEqual(PerfilGosto.objects.get(user=self.user).total, 2)
+
+    def test_so_os_primeiros_lotes_buscam_no_tmdb(self):
+        linhas = "\n".join(json.dumps({"titulo": f"Desconhecido {i}", "nota": 4}) for i in range(5))
+        with mock.patch.object(historico, "obter_por_titulos", return_value=[None, None]) as tmdb:
+            resumo = historico.importar(self.user, io.StringIO(linhas), lote=2, lotes_tmdb=1)
+
+        tmdb.assert_called_once()
+        self.assertEqual(tmdb.call_args.args[0], ["Desconhecido 0", "Desconhecido 1"])
+        self.assertEqual((resumo["gravados"], resumo["sem_id"]), (5, 5))
+
+    def test_endpoint_importa_jsonl_e_exporta_em_streaming(self):
+        linhas = "\n".join(json.dumps({"titulo": f"Filme {i}", "nota": 8, "imdb_id": f"tt{i:07d}"}) for i in range(5))
+        arquivo = io.BytesIO(linhas.encode())
+        arquivo.name = "historico.jsonl"
+        with mock.patch("core.metadados.tmdb_get", side_effect=tmdb_falso):
+            resposta = self.client.post("/meu-perfil/importar/", {"arquivo": arquivo}).json()
+        self.assertEqual((resposta["gravados"], resposta["sem_id"]), (5, 0))
+
+        exportado = self.client.get("/meu-perfil/exportar/")
+        self.assertTrue(exportado.streaming)
+        linhas = b"".join(exportado.streaming_content).decode().splitlines()
+        self.assertEqual(linhas[0], "titulo,nota,data,imdb_id,tmdb_id")
+        self.assertEqual(len(linhas), 6)
+        self.assertTrue(linhas[1].startswith("Filme 0,4,"))
+
+
+def geracao_com_uso(*args, **kwargs):
+    mensagem = AIMessage(
+        content="<h2>Matrix</h2>",
+        usage_metadata={"input_tokens": 120, "output_tokens": 30, "total_tokens": 150},
+    )
+    return ChatResult(
+        generations=[ChatGeneration(message=mensagem)],
+        llm_output={"token_usage": {"prompt_tokens": 120, "completion_tokens": 30}},
+    )
+
+
+@override_settings(CATALOGO_PATH="", OPENROUTER_API_KEY="teste", METRICAS_TOKEN="segredo")
+class MetricasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("gabi", password="senha")
+        self.client.force_login(self.user)
+
+    @mock.patch.object(sessao_tmdb, "get", side_effect=tmdb_falso)
+    def test_server_timing_e_metrics(self, get):
+        resposta = self.client.get("/buscar_filme/", {"q": "filme"})
+
+        fases = {parte.split(";")[0]: parte for parte in resposta["Server-Timing"].split(", ")}
+        self.assertIn('desc="9x"', fases["tmdb"])
+        self.assertIn("sql", fases)
+        self.assertIn("total", fases)
+
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        texto = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer segredo").content.decode()
+        self.assertIn('findmyfilm_requisicao_segundos_count{view="buscar_filme",metodo="GET",status="200"}', texto)
+        self.assertIn('findmyfilm_fase_segundos_bucket{fase="tmdb",le="+Inf"}', texto)
+
+    @mock.patch.object(ChatOpenAI, "_generate", side_effect=geracao_com_uso)
+    def test_chamada_a_ia_mede_tempo_e_tokens(self, generate):
+        dados = {"genero_favorito": "ação", "humor": "feliz", "tempo_disponivel": "curto", "anos": "todos"}
+        medicao = metricas.Medicao()
+        token = metricas._atual.set(medicao)
+        try:
+            gerar_recomendacoes(dados, user=self.user)
+        finally:
+            metricas._atual.reset(token)
+
+        self.assertEqual(medicao.fases["llm"][0], 1)
+        self.assertEqual(medicao.tokens, {"entrada": 120, "saida": 30})
+        self.assertIn('llm;dur=', medicao.server_timing())
+        self.assertIn("120+30 tokens", medicao.server_timing())
+
+
+class BenchmarkTests(TestCase):
+    def test_percentis_e_server_timing(self):
+        valores = list(range(1, 101))
+        self.assertEqual([carga.percentil(valores, p) for p in (50, 95, 99)], [50, 95, 99])
+        self.assertEqual(
+            carga.ler_server_timing('sql;dur=3.5;desc="4x", tmdb;dur=10.0;desc="1x", total;dur=20.1'),
+            {"sql": (4, 3.5), "tmdb": (1, 10.0), "total": (1, 20.1)},
+        )
+
+    def test_ia_falsa_compativel_com_o_cliente(self):
+        user = User.objects.create_user("hugo", password="senha")
+        dados = {"genero_favorito": "drama", "humor": "feliz", "tempo_disponivel": "curto", "anos": "todos"}
+        with OpenAIFalso(latencia=0) as ia, override_settings(
+            OPENROUTER_API_KEY="teste", OPENROUTER_BASE_URL=f"{ia.url}/v1",
+        ):
+            resposta = gerar_recomendacoes(dados, user=user)
+            pedacos = list(gerar_recomendacoes_stream({**dados, "anos": "antigos"}, user=user))
+
+        self.assertEqual([f["titulo"] for f in ler_recomendacoes(resposta)][:2], ["Filme 1", "Filme 2"])
+        self.assertEqual("".join(pedacos), resposta)
+        self.assertEqual(ia.chamadas, 2)
+        self.assertTrue(ia.pedidos[1]["stream"])
+
+
+@override_settings(TMDB_ESPERA_BASE=0, TMDB_TENTATIVAS=3)
+class TMDbClientTests(SimpleTestCase):
+    def test_repete_429_e_5xx(self):
+        respostas = [RespostaFalsa({}, 429), RespostaFalsa({}, 503), RespostaFalsa({"ok": 1})]
+        with mock.patch.object(cliente_tmdb.sessao, "get", side_effect=respostas) as get:
+            resposta = cliente_tmdb.get(cliente_tmdb.url("/movie/1"))
+
+        self.assertEqual(resposta.json(), {"ok": 1})
+        self.assertEqual(get.call_count, 3)
+        self.assertIn("api_key", get.call_args.kwargs["params"])
+
+    def test_retry_after_alem_do_prazo_devolve_a_resposta(self):
+        lenta = RespostaFalsa({}, 429, headers={"Retry-After": "30"})
+        with mock.patch.object(cliente_tmdb.sessao, "get", return_value=lenta) as get:
+            inicio = time.monotonic()
+            resposta = cliente_tmdb.get(cliente_tmdb.url("/movie/1"), prazo=1)
+
+        self.assertEqual(resposta.status_code, 429)
+        self.assertEqual(get.call_count, 1)
+        self.assertLess(time.monotonic() - inicio, 1)
+
+    def test_balde_espaca_depois_da_rajada(self):
+        balde = Balde(taxa=10, capacidade=2)
+        esperas = [balde.reservar() for _ in range(4)]
+
+        self.assertEqual(esperas[:2], [0.0, 0.0])
+        self.assertAlmostEqual(esperas[2], 0.1, places=2)
+        self.assertAlmostEqual(esperas[3], 0.2, places=2)
+
+
+class TarefasTests(TestCase):
+    DADOS = {"genero_favorito": "drama", "humor": "feliz", "tempo_disponivel": "curto", "anos": "todos"}
+
+    def setUp(self):
+        self.user = User.objects.create_user("teo", password="senha")
+        self.persona = Persona.objects.create(user=self.user, nome="Teo", **self.DADOS)
+
+    def test_uma_tarefa_em_andamento_por_chave(self):
+        tarefa = tarefas.enfileirar(self.user, self.persona, self.DADOS)
+        self.assertEqual(tarefas.enfileirar(self.user, self.persona, self.DADOS), tarefa)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TarefaRecomendacao.objects.create(user=self.user, persona=self.persona, chave=tarefa.chave, dados={})
+
+        TarefaRecomendacao.objects.filter(id=tarefa.id).update(status=TarefaRecomendacao.CONCLUIDA)
+        self.assertNotEqual(tarefas.enfileirar(self.user, self.persona, self.DADOS), tarefa)
+
+    def test_insert_concorrente_devolve_a_tarefa_existente(self):
+        # A outra requisição cria a tarefa entre a consulta e o INSERT desta.
+        outra = TarefaRecomendacao.objects.create(
+            user=self.user, persona=self.persona, chave=tarefas._chave(self.user, self.DADOS), dados=self.DADOS,
+        )
+        with mock.patch("django.db.models.query.QuerySet.first", side_effect=[None, outra]):
+            self.assertEqual(tarefas.enfileirar(self.user, self.persona, self.DADOS), outra)
+        self.assertEqual(TarefaRecomendacao.objects.count(), 1)
+
+    @override_settings(TAREFAS_MAX_TENTATIVAS=2)
+    def test_sem_vaga_desiste_depois_do_maximo_de_tentativas(self):
+        tarefa = tarefas.enfileirar(self.user, self.persona, self.DADOS)
+        with mock.patch.object(tarefas, "gerar_e_enriquecer", side_effect=LLMSobrecarregado("fila_cheia")):
+            tarefa = tarefas.executar(tarefas.reservar_proxima("teste"))
+            self.assertEqual((tarefa.status, tarefa.tentativas), (TarefaRecomendacao.PENDENTE, 1))
+            tarefa = tarefas.executar(tarefas.reservar_proxima("teste"))
+
+        tarefa.refresh_from_db()
+        self.assertEqual((tarefa.status, tarefa.tentativas), (TarefaRecomendacao.ERRO, 2))
+        self.assertIn("sobrecarregada", tarefa.erro)
+        self.assertIsNone(tarefas.reservar_proxima("teste"))
+
+
+@override_settings(LLM_MAX_CONCORRENTES=1, LLM_FILA_MAXIMA=1, LLM_PRAZO_FILA=5)
+class GovernadorTests(TestCase):
+    def setUp(self):
+        self.governador = GovernadorLLM()
+
+    def test_fila_limitada_e_vaga_passada_adiante(self):
+        self.governador.entrar()
+        entrou = threading.Event()
+
+        def esperar():
+            self.governador.entrar()
+            entrou.set()
+
+        thread = threading.Thread(target=esperar)
+        thread.start()
+        while not self.governador.na_fila:
+            time.sleep(0.001)
+
+        with self.assertRaises(LLMSobrecarregado) as erro:
+            self.governador.entrar()
+        self.assertEqual(erro.exception.motivo, "fila_cheia")
+
+        self.governador.liberar()
+        thread.join()
+        self.assertTrue(entrou.is_set())
+        self.assertEqual((self.governador.ativos, self.governador.na_fila), (1, 0))
+
+    def test_prazo_de_espera(self):
+        self.governador.entrar()
+        with self.assertRaises(LLMSobrecarregado) as erro:
+            self.governador.entrar(prazo=0.01)
+        self.assertEqual(erro.exception.motivo, "prazo")
+        self.assertEqual(self.governador.na_fila, 0)
+
+    def test_corrotina_recebe_a_vaga_de_uma_thread(self):
+        self.governador.entrar()
+
+        async def esperar():
+            tarefa = asyncio.ensure_future(self.governador.aentrar())
+            await asyncio.sleep(0.01)
+            threading.Thread(target=self.governador.liberar).start()
+            await tarefa
+            self.governador.liberar()
+
+        asyncio.run(esperar())
+        self.assertEqual((self.governador.ativos, self.governador.na_fila), (0, 0))
+
+    @override_settings(OPENROUTER_API_KEY="teste", RECOMENDACOES_CANDIDATOS=0, LLM_FILA_MAXIMA=0)
+    def test_sem_vaga_usa_resposta_guardada_ou_503(self):
+        user = User.objects.create_user("iris", password="senha")
+        self.client.force_login(user)
+        dados = {"nome": "Iris", "genero_favorito": "drama", "humor": "feliz",
+                 "tempo_disponivel": "curto", "anos": "todos"}
+
+        with mock.patch.object(governador, "ativos", 1):
+            resposta = self.client.post("/persona/", dados)
+            self.assertEqual(resposta.status_code, 503)
+            self.assertEqual(resposta["Retry-After"], "10")
+
+            RespostaLLM.objects.create(chave="antiga", user=user, resposta=RESPOSTA_JSON)
+            self.assertEqual(gerar_recomendacoes(dados, user=user), RESPOSTA_JSON)
+
+
+class _OutroProcesso(cache_camadas.CacheDuasCamadas):
+    """O mesmo arquivo L2, mas com L1 próprio, como um segundo worker."""
+
+    @cached_property
+    def _estado(self):
+        return cache_camadas._Processo()
+
+
+class CacheDuasCamadasTests(SimpleTestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        caminho = os.path.join(pasta.name, "cache.sqlite3")
+        parametros = {"OPTIONS": {"SINCRONIA": 0, "L1_MAX_ENTRADAS": 2}}
+        self.a = _OutroProcesso(caminho, parametros)
+        self.b = _OutroProcesso(caminho, parametros)
+
+    def test_valor_de_um_processo_e_acerto_no_outro(self):
+        self.a.set("filme", {"titulo": "Matrix"})
+
+        self.assertEqual(self.b.get("filme"), {"titulo": "Matrix"})
+        self.assertEqual(self.b.get("filme"), {"titulo": "Matrix"})
+        self.assertIsNone(self.b.get("outro"))
+        self.assertEqual(
+            {k: v for k, v in self.b.estatisticas().items() if k.startswith(("acertos", "falhas"))},
+            {"acertos_l1": 1, "acertos_l2": 1, "falhas": 1},
+        )
+
+    def test_escrita_e_remocao_invalidam_o_l1_dos_outros(self):
+        self.a.set("filme", "Matrix")
+        self.assertEqual(self.b.get("filme"), "Matrix")
+
+        self.a.set("filme", "Alien")
+        self.assertEqual(self.b.get("filme"), "Alien")
+
+        self.a.delete("filme")
+        self.assertIsNone(self.b.get("filme"))
+
+        self.b.set("filme", "Up")
+        self.a.clear()
+        self.assertIsNone(self.b.get("filme"))
+
+    def test_add_expiracao_e_lru(self):
+        self.assertTrue(self.a.add("chave", 1))
+        self.assertFalse(self.b.add("chave", 2))
+        self.a.set("curta", "x", timeout=0.05)
+        time.sleep(0.06)
+        self.assertIsNone(self.b.get("curta"))
+        self.assertTrue(self.b.add("curta", "y"))
+
+        for chave in ("c1", "c2", "c3"):
+            self.a.set(chave, chave)
+        self.assertEqual(self.a.estatisticas()["entradas_l1"], 2)
+        self.assertEqual(self.a.get("c1"), "c1")  # saiu do L1, ainda está no L2
+
+
+class PostersTests(TestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.enterContext(override_settings(POSTERS_DIR=pasta.name))
+        self.get = self.enterContext(mock.patch.object(
+            cliente_tmdb.sessao, "get", return_value=mock.Mock(status_code=200, content=b"jpeg"),
+        ))
+
+    def test_baixa_uma_vez_e_serve_do_disco_com_etag(self):
+        url = posters.url("/abc.jpg", 185)
+        self.assertEqual(url, "/imagens/w185/abc.jpg")
+
+        resposta = self.client.get(url)
+        self.assertEqual(b"".join(resposta.streaming_content), b"jpeg")
+        self.assertEqual(resposta["Content-Type"], "image/jpeg")
+        self.assertIn("immutable", resposta["Cache-Control"])
+        self.get.assert_called_once_with("https://image.tmdb.org/t/p/w185/abc.jpg", timeout=10)
+
+        revalidacao = self.client.get(url, HTTP_IF_NONE_MATCH=resposta["ETag"])
+        self.assertEqual(revalidacao.status_code, 304)
+        self.assertEqual(self.get.call_count, 1)
+
+    def test_if_none_match_compara_etags_exatas(self):
+        etag = self.client.get("/imagens/w185/abc.jpg")["ETag"]
+
+        def status(valor):
+            return self.client.get("/imagens/w185/abc.jpg", HTTP_IF_NONE_MATCH=valor).status_code
+
+        self.assertEqual(status(f'"outra", W/{etag}'), 304)
+        self.assertEqual(status("*"), 304)
+        # Um pedaço do hash, ou o hash dentro de outra etag, não casa.
+        self.assertEqual(status(f'"x{etag[1:]}'), 200)
+        self.assertEqual(status(etag[:-2] + '"'), 200)
+
+    def test_cada_largura_vem_pronta_do_tmdb(self):
+        self.client.get("/imagens/w92/abc.jpg")
+        self.client.get("/imagens/w500/abc.jpg")
+        self.assertEqual(
+            [c.args[0] for c in self.get.call_args_list],
+            ["https://image.tmdb.org/t/p/w92/abc.jpg", "https://image.tmdb.org/t/p/w500/abc.jpg"],
+        )
+
+    def test_poda_apaga_as_usadas_ha_mais_tempo(self):
+        for i, largura in enumerate((92, 154, 185)):
+            self.get.return_value = mock.Mock(status_code=200, content=bytes([i]) * 100)
+            imagem = posters.obter(f"w{largura}", "abc.jpg")
+            os.utime(imagem.caminho, (1000 + i, 1000 + i))
+
+        self.assertEqual(posters.podar(limite=250), 100)
+        self.assertIsNone(posters._local("w92", "abc.jpg"))
+        self.assertFalse(os.path.exists(posters._indice("w92", "abc.jpg")))
+        self.assertIsNotNone(posters._local("w185", "abc.jpg"))
+        self.assertEqual(posters.podar(limite=250), 0)
+
+    def test_largura_ou_arquivo_invalidos(self):
+        self.assertEqual(self.client.get("/imagens/w999/abc.jpg").status_code, 404)
+        self.assertEqual(self.client.get("/imagens/w185/abc.exe").status_code, 404)
+        self.get.assert_not_called()
+
+    def test_falha_no_tmdb_redireciona(self):
+        self.get.side_effect = requests.ConnectionError("fora do ar")
+        resposta = self.client.get("/imagens/w342/abc.jpg")
+        self.assertRedirects(resposta, "https://image.tmdb.org/t/p/w342/abc.jpg", fetch_redirect_response=False)
+
+    def test_srcset_nos_resultados(self):
+        filme = FilmeMetadados(tmdb_id=1, titulo="Matrix", poster_path="/m.jpg")
+        self.assertEqual(
+            filme.poster_srcset(),
+            "/imagens/w185/m.jpg 185w, /imagens/w342/m.jpg 342w, /imagens/w500/m.jpg 500w",
+        )
+        self.assertEqual(FilmeMetadados(tmdb_id=2, titulo="Sem pôster").poster_url(), "")
+
+
+@override_settings(CATALOGO_PATH="")
+@mock.patch.object(sessao_tmdb, "get", side_effect=tmdb_falso)
+class CacheHTTPTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("hugo", password="senha")
+        self.client.force_login(self.user)
+
+    def test_detalhes_com_etag_gzip_e_304(self, get):
+        resposta = self.client.get("/movie_details/", {"tmdb_id": 7}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(resposta["Content-Encoding"], "gzip")
+        self.assertIn("public", resposta["Cache-Control"])
+        self.assertIn("max-age=3600", resposta["Cache-Control"])
+        self.assertIn("Accept-Encoding", resposta["Vary"])
+        self.assertEqual(json.loads(gzip.decompress(resposta.content))["titulo"], "Filme 7")
+
+        get.reset_mock()
+        repetida = self.client.get(
+            "/movie_details/", {"tmdb_id": 7}, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=resposta["ETag"],
+        )
+        self.assertEqual(repetida.status_code, 304)
+        self.assertEqual(repetida.content, b"")
+        get.assert_not_called()
+
+    def test_busca_privada_e_revalidada_por_usuario(self, get):
+        primeira = self.client.get("/buscar_filme/", {"q": "filme"})
+        self.assertIn("private", primeira["Cache-Control"])
+        self.assertIn("no-cache", primeira["Cache-Control"])
+        self.assertIn("Cookie", primeira["Vary"])
+
+        repetida = self.client.get("/buscar_filme/", {"q": "filme"}, HTTP_IF_NONE_MATCH=primeira["ETag"])
+        self.assertEqual(repetida.status_code, 304)
+
+        # A nota nova muda o conteúdo, e com ele o ETag.
+        FilmeAssistido.objects.create(user=self.user, titulo="Filme 1", tmdb_id=1, nota=5)
+        depois = self.client.get("/buscar_filme/", {"q": "filme"}, HTTP_IF_NONE_MATCH=primeira["ETag"])
+        self.assertEqual(depois.status_code, 200)
+        self.assertEqual(depois.json()["results"][0]["user_rating"], 5)
+
+    def test_view_assincrona_tambem_responde_304(self, get):
+        etag = self.client.get("/movie_details/", {"tmdb_id": 7})["ETag"]  # grava os metadados
+
+        detalhes = async_to_sync(views_async.movie_details)
+        requisicao = RequestFactory().get("/movie_details/", {"tmdb_id": 7}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(detalhes(requisicao).status_code, 304)
+
+
+class UrlsComAssincronas:
+    """URLconf do projeto mais as views de core/views_async.py sob /assincrono/."""
+    urlpatterns = [
+        path("assincrono/buscar_filme/", views_async.buscar_filme),
+        path("assincrono/movie_details/", views_async.movie_details),
+        path("", include("core.urls")),
+    ]
+
+
+async def atmdb_falso(url, params=None, timeout=None, prazo=None):
+    return tmdb_falso(url, params)
+
+
+@override_settings(CATALOGO_PATH="", ROOT_URLCONF=UrlsComAssincronas)
+@mock.patch.object(cliente_tmdb, "aget", side_effect=atmdb_falso)
+@mock.patch.object(sessao_tmdb, "get", side_effect=tmdb_falso)
+class ViewsAssincronasTests(TestCase):
+    """As views assíncronas respondem exatamente como as síncronas."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("iris", password="senha")
+        FilmeAssistido.objects.create(user=self.user, titulo="Filme 1", tmdb_id=1, nota=5)
+        FilmeAssistido.objects.create(user=self.user, titulo="Filme 3", nota=2)
+
+    async def comparar(self, caminho, params):
+        """Cada versão parte do zero: sem cache de busca e sem metadados guardados."""
+        respostas = []
+        for prefixo in ("/assincrono", ""):
+            await cache.aclear()
+            await FilmeMetadados.objects.all().adelete()
+            resposta = await self.async_client.get(prefixo + caminho, params, headers={"Accept-Encoding": "gzip"})
+            corpo = resposta.content
+            if resposta.get("Content-Encoding") == "gzip":
+                corpo = gzip.decompress(corpo)
+            respostas.append((resposta, json.loads(corpo)))
+
+        (assincrona, dados), (sincrona, esperados) = respostas
+        self.assertEqual(assincrona.status_code, sincrona.status_code)
+        for cabecalho in ("Content-Type", "Content-Encoding", "Cache-Control", "Vary", "ETag"):
+            self.assertEqual(assincrona.get(cabecalho), sincrona.get(cabecalho), cabecalho)
+        self.assertEqual(dados, esperados)
+        return dados
+
+    async def test_busca_igual_a_sincrona(self, get, aget):
+        await self.async_client.aforce_login(self.user)
+
+        resultados = (await self.comparar("/buscar_filme/", {"q": "filme"}))["results"]
+
+        self.assertEqual(len(resultados), 8)
+        self.assertEqual([r["user_rating"] for r in resultados[:3]], [5, None, 2])
+        self.assertEqual(aget.call_count, get.call_count)
+
+    async def test_busca_curta_igual_a_sincrona(self, get, aget):
+        self.assertEqual(await self.comparar("/buscar_filme/", {"q": "f"}), {"results": []})
+
+    async def test_detalhes_iguais_aos_sincronos(self, get, aget):
+        self.assertEqual((await self.comparar("/movie_details/", {"tmdb_id": 7}))["titulo"], "Filme 7")
+        self.assertTrue(aget.called)
+        self.assertEqual(aget.call_count, get.call_count)
+
+    async def test_erros_de_detalhes_iguais_aos_sincronos(self, get, aget):
+        for params in ({}, {"tmdb_id": "abc"}):
+            await self.comparar("/movie_details/", params)
+
+
+@override_settings(OPENROUTER_API_KEY="teste", RECOMENDACOES_CANDIDATOS=0, CATALOGO_PATH="")
+@mock.patch.object(sessao_tmdb, "get", side_effect=tmdb_falso)
+@mock.patch.object(ChatOpenAI, "invoke", side_effect=lambda *a, **k: AIMessage(content=RESPOSTA_JSON))
+class PreGeracaoTests(TestCase):
+    DADOS = {"nome": "Ivo", "genero_favorito": "drama", "humor": "feliz", "tempo_disponivel": "curto", "anos": "antigos"}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("ivo", password="senha")
+        self.client.force_login(self.user)  # last_login de agora: usuário ativo
+        Persona.objects.create(user=self.user, **self.DADOS)
+
+    def test_persona_view_usa_a_resposta_pregerada(self, invoke, get):
+        invoke.reset_mock()
+        resumo = pregeracao.pregerar()
+        self.assertEqual(resumo, {"usuarios": 1, "em_cache": 0, "geradas": 1, "adiadas": 0, "erros": 0})
+        self.assertEqual(invoke.call_count, 1)
+
+        get.reset_mock()
+        resposta = self.client.post("/persona/", self.DADOS)
+        self.assertEqual([f["titulo"] for f in resposta.context["recomendacoes"]], ["Filme 1", "Filme 1"])
+        self.assertEqual(invoke.call_count, 1)
+        get.assert_not_called()
+
+        # Nada mudou: a rodada seguinte não chama a IA.
+        self.assertEqual(pregeracao.pregerar()["em_cache"], 1)
+        self.assertEqual(invoke.call_count, 1)
+
+        # Nota nova muda o prompt: o usuário volta a ser pré-gerado.
+        FilmeAssistido.objects.create(user=self.user, titulo="Alien", nota=5)
+        self.assertEqual(pregeracao.pregerar()["geradas"], 1)
+
+    @override_settings(RECOMENDACOES_CANDIDATOS=20)
+    def test_com_candidatos_o_enriquecimento_nao_muda_a_chave(self, invoke, get):
+        candidatos._versao = None
+        Persona.objects.filter(user=self.user).update(anos="recentes")
+        filme(50, "Drama Local", 2005, ["Drama"], 80)
+        invoke.reset_mock()
+
+        with mock.patch.object(governador, "entrar", wraps=governador.entrar) as entrar:
+            self.assertEqual(pregeracao.pregerar()["geradas"], 1)
+        entrar.assert_called_once()
+        # O enriquecimento guardou filmes que agora estão entre os candidatos.
+        self.assertIn("Filme 1", [c["titulo"] for c in recommender.preparar({**self.DADOS, "anos": "recentes"}, self.user)[0]])
+
+        self.client.post("/persona/", {**self.DADOS, "anos": "recentes"})
+        self.assertEqual(invoke.call_count, 1)
+
+    def test_orcamento_e_inativos(self, invoke, get):
+        outro = User.objects.create_user("jade", password="senha")
+        Persona.objects.create(user=outro, **self.DADOS)
+        inativo = User.objects.create_user("kim", password="senha", last_login=timezone.now() - timedelta(days=30))
+        persona = Persona.objects.create(user=inativo, **self.DADOS)
+        Persona.objects.filter(pk=persona.pk).update(ultima_atualizacao=timezone.now() - timedelta(days=30))
+
+        resumo = pregeracao.pregerar(max_chamadas=1, enriquecer=False)
+        self.assertEqual(resumo, {"usuarios": 2, "em_cache": 0, "geradas": 1, "adiadas": 1, "erros": 0})
+
+    def test_janela_fora_de_pico(self, invoke, get):
+        noite = timezone.make_aware(datetime(2026, 1, 1, 23))
+        with override_settings(PREGERACAO_JANELA=(22, 6)):
+            self.assertTrue(pregeracao.fora_de_pico(noite))
+        with override_settings(PREGERACAO_JANELA=(2, 6)):
+            self.assertFalse(pregeracao.fora_de_pico(noite))
+
+
+@override_settings(OPENROUTER_API_KEY="teste", RECOMENDACOES_CANDIDATOS=0)
+class ChamadaLLMTests(TestCase):
+    DADOS = {"genero_favorito": "drama", "humor": "feliz", "tempo_disponivel": "curto", "anos": "todos"}
+
+    def setUp(self):
+        self.user = User.objects.create_user("lia", password="senha")
+
+    @mock.patch.object(ChatOpenAI, "_generate", side_effect=geracao_com_uso)
+    def test_chamada_e_acerto_registrados(self, generate):
+        gerar_recomendacoes(self.DADOS, user=self.user)
+        gerar_recomendacoes(self.DADOS, user=self.user)
+
+        chamada, acerto = ChamadaLLM.objects.order_by("id")
+        self.assertEqual((chamada.modelo, chamada.acerto_cache), ("gpt-4o-mini", False))
+        self.assertEqual((chamada.tokens_entrada, chamada.tokens_saida), (120, 30))
+        self.assertAlmostEqual(chamada.custo_usd, (120 * 0.15 + 30 * 0.60) / 1_000_000)
+        self.assertIsNotNone(chamada.latencia_ms)
+        self.assertTrue(acerto.acerto_cache)
+        self.assertEqual((acerto.tokens_entrada, acerto.latencia_ms), (0, None))
+
+    @mock.patch.object(ChatOpenAI, "_generate", side_effect=ValueError("quota"))
+    def test_erro_registrado(self, generate):
+        with self.assertRaises(ValueError):
+            gerar_recomendacoes(self.DADOS, user=self.user)
+        self.assertEqual(ChamadaLLM.objects.get().erro, "quota")
+
+    def test_resumo_diario_no_admin(self):
+        for ms in range(1, 21):
+            ChamadaLLM.objects.create(modelo="gpt-4o-mini", latencia_ms=ms * 100, custo_usd=0.001)
+        ChamadaLLM.objects.create(modelo="gpt-4o-mini", acerto_cache=True)
+
+        [dia] = chamadas_llm.resumo_diario()
+        self.assertEqual((dia["pedidos"], dia["acertos"], dia["p95_ms"]), (21, 1, 1900))
+        self.assertAlmostEqual(dia["custo_usd"], 0.02)
+
+        self.client.force_login(User.objects.create_superuser("admin", password="senha"))
+        resposta = self.client.get("/admin/core/chamadallm/")
+        self.assertContains(resposta, "Por dia")
+        self.assertContains(resposta, "1900 ms")
+
+
+@override_settings(OPENROUTER_API_KEY="teste", RECOMENDACOES_CANDIDATOS=0, LLM_TENTATIVAS=0, LLM_HEDGE_PADRAO=0.2)
+# TransactionTestCase: a chamada abandonada é registrada na thread dela.
+class ReservaLLMTests(TransactionTestCase):
+    DADOS = {"genero_favorito": "drama", "humor": "feliz", "tempo_disponivel": "curto", "anos": "todos"}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("rui", password="senha")
+
+    def modelos(self, principal, reserva):
+        return override_settings(LLM_MODELOS=[
+            {"modelo": "gpt-4o-mini", "base_url": f"{principal.url}/v1"},
+            {"modelo": "reserva", "base_url": f"{reserva.url}/v1"},
+        ])
+
+    def esperar_governador(self, prazo=5):
+        limite = time.monotonic() + prazo
+        while governador.ativos and time.monotonic() < limite:
+            time.sleep(0.02)
+
+    def test_reserva_rapida_vence_principal_lento(self):
+        with OpenAIFalso(latencia=1.5) as lento, OpenAIFalso(latencia=0, filmes=3) as rapido, self.modelos(lento, rapido):
+            inicio = time.perf_counter()
+            resposta = gerar_recomendacoes(self.DADOS, user=self.user)
+            duracao = time.perf_counter() - inicio
+            # A chamada lenta ainda roda e continua ocupando a vaga.
+            self.assertEqual(governador.ativos, 1)
+            # A resposta fica no cache com a chave do pedido (a do modelo principal).
+            self.assertEqual(gerar_recomendacoes(self.DADOS, user=self.user), resposta)
+            self.esperar_governador()
+
+        self.assertLess(duracao, 1.2)
+        self.assertEqual(len(ler_recomendacoes(resposta)), 3)
+        self.assertEqual((lento.chamadas, rapido.chamadas), (1, 1))
+        self.assertEqual(governador.ativos, 0)
+        # As duas chamadas foram cobradas e as duas estão no registro.
+        chamadas = ChamadaLLM.objects.filter(acerto_cache=False).order_by("id")
+        self.assertEqual([c.modelo for c in chamadas], ["reserva", "gpt-4o-mini"])
+        self.assertTrue(all(c.tokens_saida > 0 and c.erro == "" for c in chamadas))
+
+    def test_principal_dentro_do_limiar_dispensa_a_reserva(self):
+        with OpenAIFalso(latencia=0) as principal, OpenAIFalso(latencia=0, filmes=3) as reserva, self.modelos(principal, reserva):
+            resposta = gerar_recomendacoes(self.DADOS, user=self.user)
+
+        self.assertEqual(len(ler_recomendacoes(resposta)), 5)
+        self.assertEqual(reserva.chamadas, 0)
+
+    @override_settings(LLM_HEDGE=False)
+    def test_falhas_passam_pela_lista_em_ordem(self):
+        with OpenAIFalso(latencia=0, taxa_falhas=1) as quebrado, OpenAIFalso(latencia=0, filmes=3) as reserva, self.modelos(quebrado, reserva):
+            resposta = gerar_recomendacoes(self.DADOS, user=self.user)
+
+        self.assertEqual(len(ler_recomendacoes(resposta)), 3)
+        erro, certo = ChamadaLLM.objects.order_by("id")
+        self.assertEqual((erro.modelo, certo.modelo), ("gpt-4o-mini", "reserva"))
+        self.assertNotEqual(erro.erro, "")
+        self.assertEqual(certo.erro, "")
+
+    def test_todas_falhando_sobe_o_ultimo_erro(self):
+        with OpenAIFalso(latencia=0, taxa_falhas=1) as a, OpenAIFalso(latencia=0, taxa_falhas=1) as b, self.modelos(a, b):
+            with self.assertRaises(Exception):
+                gerar_recomendacoes(self.DADOS, user=self.user)
+
+        self.assertEqual((a.chamadas, b.chamadas), (1, 1))
+        self.assertEqual(ChamadaLLM.objects.exclude(erro="").count(), 2)
+
+    def test_assincrono_cancela_a_chamada_perdedora(self):
+        with OpenAIFalso(latencia=1.5) as lento, OpenAIFalso(latencia=0, filmes=3) as rapido, self.modelos(lento, rapido):
+            chains = recommender._montar_chains()
+            entrada = recommender._montar_entrada(self.DADOS)
+            inicio = time.perf_counter()
+            resposta = async_to_sync(recommender._acom_reserva)(chains, entrada, self.user)
+            duracao = time.perf_counter() - inicio
+
+        self.assertLess(duracao, 1.2)
+        self.assertEqual(len(ler_recomendacoes(resposta.content)), 3)
+        self.assertEqual(
+            list(ChamadaLLM.objects.order_by("id").values_list("modelo", "erro")),
+            [("reserva", ""), ("gpt-4o-mini", "cancelada")],
+        )
+
+    @override_settings(LLM_HEDGE=False)
+    def test_streaming_passa_para_a_reserva_antes_do_primeiro_pedaco(self):
+        with OpenAIFalso(latencia=0, taxa_falhas=1) as quebrado, OpenAIFalso(latencia=0, filmes=3) as reserva, self.modelos(quebrado, reserva):
+            texto = "".join(gerar_recomendacoes_stream(self.DADOS, user=self.user))
+
+        self.assertEqual(len(ler_recomendacoes(texto)), 3)
+        self.assertEqual(
+            list(ChamadaLLM.objects.order_by("id").values_list("modelo", flat=True)), ["gpt-4o-mini", "reserva"],
+        )
+        self.assertEqual(governador.ativos, 0)
+
+    @override_settings(LLM_HEDGE=False, RECOMENDACOES_CANDIDATOS=5)
+    def test_streaming_com_todos_falhando_usa_os_candidatos(self):
+        candidatos._versao = None
+        filme(1, "Alien", 1979, ["Drama", "Terror"], 85)
+        filme(2, "Amélie", 2001, ["Comédia"], 80)
+
+        async def coletar():
+            return [p async for p in recommender.agerar_recomendacoes_stream(self.DADOS, user=self.user)]
+
+        with OpenAIFalso(latencia=0, taxa_falhas=1) as a, OpenAIFalso(latencia=0, taxa_falhas=1) as b, self.modelos(a, b):
+            pedacos = list(gerar_recomendacoes_stream(self.DADOS, user=self.user))
+            apedacos = async_to_sync(coletar)()
+
+        for resposta in (pedacos, apedacos):
+            [texto] = resposta
+            self.assertEqual([f["titulo"] for f in ler_recomendacoes(texto)], ["Alien", "Amélie"])
+        self.assertEqual((a.chamadas, b.chamadas), (2, 2))
+        self.assertEqual(governador.ativos, 0)
+        self.assertFalse(RespostaLLM.objects.exists())
+
+    def test_limiar_pelo_percentil_das_latencias_recentes(self):
+        chain = recommender._montar_chain()
+        self.assertEqual(recommender._limiar_hedge(chain), 0.2)
+
+        cache.clear()
+        for ms in range(1, 21):
+            ChamadaLLM.objects.create(modelo="gpt-4o-mini", latencia_ms=ms * 100)
+        ChamadaLLM.objects.create(modelo="gpt-4o-mini", latencia_ms=60000, erro="timeout")
+        self.assertEqual(recommender._limiar_hedge(chain), 1.9)
+        with override_settings(LLM_HEDGE_MINIMO=5):
+            cache.clear()
+            self.assertEqual(recommender._limiar_hedge(chain), 5)
 
-# Create your tests here.
@@ -0,0 +1,8 @@
+"""Normalização de textos comparados entre o catálogo, os metadados e o histórico."""
+import unicodedata
+
+
+def normalizar(texto):
+    """Sem acentos, minúsculo e sem espaços nas pontas: "Amélie " -> "amelie"."""
+    texto = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode()
+    return texto.lower().strip()
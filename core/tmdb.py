@@ -0,0 +1,189 @@
+"""
+Cliente HTTP único do TMDb.
+
+Toda chamada ao TMDb (``core.metadados``, ``buscar_filme``, o modal de
+detalhes, o enriquecimento das recomendações) passa por ``cliente_tmdb``:
+
+- conexões reaproveitadas: uma ``requests.Session`` com pool compartilhada
+  entre threads e um ``httpx.AsyncClient`` por event loop;
+- ``api_key`` e URL base vindas das settings em cada chamada;
+- ritmo: um balde de fichas (``TMDB_TAXA`` por segundo, rajadas de até
+  ``TMDB_RAJADA``) segura as chamadas antes de estourarem o limite do TMDb;
+- novas tentativas em 429/5xx e erros de conexão, com espera exponencial
+  sorteada (ou o ``Retry-After`` do TMDb), até ``TMDB_TENTATIVAS``;
+- prazo por chamada: esperas e tentativas nunca passam de ``prazo``
+  segundos no total (padrão: o ``timeout`` vezes o número de tentativas);
+- GETs idênticos simultâneos coalescidos (``SingleFlight``) e o tempo de
+  cada um medido na fase ``tmdb`` (``core.metricas``).
+
+Cache de respostas, se um dia for preciso, entra em ``_executar``/``_aexecutar``.
+"""
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .metricas import medir
+from .singleflight import SingleFlight
+
+REPETIR = {429, 500, 502, 503, 504}
+
+
+class PrazoTMDbEsgotado(TimeoutError):
+    """O prazo da chamada acabou antes de o TMDb responder."""
+
+
+class Balde:
+    """
+    Balde de fichas para espaçar as chamadas. ``reservar`` sempre consome uma
+    ficha (o saldo pode ficar negativo) e devolve quanto esperar por ela, de
+    modo que quem chegou antes sai antes.
+    """
+
+    def __init__(self, taxa, capacidade):
+        self.taxa = float(taxa)
+        self.capacidade = float(capacidade)
+        self._fichas = float(capacidade)
+        self._atualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self):
+        if self.taxa <= 0:
+            return 0.0
+        with self._lock:
+            agora = time.monotonic()
+            self._fichas = min(self.capacidade, self._fichas + (agora - self._atualizado) * self.taxa)
+            self._atualizado = agora
+            self._fichas -= 1
+            return 0.0 if self._fichas >= 0 else -self._fichas / self.taxa
+
+    def devolver(self):
+        """Devolve a ficha de uma chamada que desistiu antes de sair."""
+        with self._lock:
+            self._fichas = min(self.capacidade, self._fichas + 1)
+
+
+class TMDbClient:
+    def __init__(self):
+        self.voos = SingleFlight()
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_maxsize=getattr(settings, "TMDB_POOL_CONEXOES", 20))
+        for prefixo in ("https://", "http://"):
+            self.sessao.mount(prefixo, adaptador)
+        self.balde = Balde(getattr(settings, "TMDB_TAXA", 40), getattr(settings, "TMDB_RAJADA", 40))
+        # Um httpx.AsyncClient não pode ser compartilhado entre event loops.
+        self._clientes_async = weakref.WeakKeyDictionary()
+
+    def url(self, caminho):
+        return f"{getattr(settings, 'TMDB_URL', 'https://api.themoviedb.org/3')}{caminho}"
+
+    def cliente_async(self):
+        """O httpx.AsyncClient do event loop atual, criado na primeira chamada."""
+        loop = asyncio.get_running_loop()
+        cliente = self._clientes_async.get(loop)
+        if cliente is None:
+            limite = getattr(settings, "TMDB_POOL_CONEXOES", 20)
+            cliente = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=None, max_keepalive_connections=limite),
+            )
+            self._clientes_async[loop] = cliente
+        return cliente
+
+    def _parametros(self, params):
+        params = dict(params or {})
+        params.setdefault("api_key", getattr(settings, "TMDB_API_KEY", None))
+        return params
+
+    def _tentativas(self):
+        return max(1, getattr(settings, "TMDB_TENTATIVAS", 3))
+
+    def _espera(self, tentativa, resposta=None):
+        """Retry-After do TMDb, se houver; senão exponencial com sorteio (full jitter)."""
+        depois = resposta.headers.get("Retry-After") if resposta is not None else None
+        if depois and depois.replace(".", "", 1).isdigit():
+            return float(depois)
+        base = getattr(settings, "TMDB_ESPERA_BASE", 0.25)
+        return random.uniform(0, base * 2 ** tentativa)
+
+    @staticmethod
+    def _chave(url, params):
+        return (url, tuple(sorted(params.items())))
+
+    def _vez(self, limite):
+        """Espera pela ficha do balde; desiste se ela só viria depois do prazo."""
+        espera = self.balde.reservar()
+        if time.monotonic() + espera > limite:
+            self.balde.devolver()
+            raise PrazoTMDbEsgotado("TMDb: prazo esgotado esperando a vez")
+        return espera
+
+    def get(self, url, params=None, timeout=6, prazo=None):
+        """GET no TMDb com ritmo, novas tentativas e prazo total."""
+        params = self._parametros(params)
+        with medir("tmdb"):
+            return self.voos.executar(self._chave(url, params), self._executar, url, params, timeout, prazo)
+
+    def _executar(self, url, params, timeout, prazo):
+        tentativas = self._tentativas()
+        limite = time.monotonic() + (prazo if prazo is not None else timeout * tentativas)
+        for tentativa in range(tentativas):
+            time.sleep(self._vez(limite))
+            restante = limite - time.monotonic()
+            ultima = tentativa == tentativas - 1
+            try:
+                resposta = self.sessao.get(url, params=params, timeout=min(timeout, max(restante, 0.001)))
+            except (requests.ConnectionError, requests.Timeout):
+                if ultima:
+                    raise
+                resposta = None
+            if resposta is not None and (resposta.status_code not in REPETIR or ultima):
+                return resposta
+
+            espera = self._espera(tentativa, resposta)
+            if time.monotonic() + espera >= limite:
+                if resposta is not None:
+                    return resposta
+                raise PrazoTMDbEsgotado("TMDb: prazo esgotado entre tentativas")
+            time.sleep(espera)
+
+    async def aget(self, url, params=None, timeout=6, prazo=None):
+        """Versão assíncrona de ``get`` (httpx)."""
+        params = self._parametros(params)
+        with medir("tmdb"):
+            return await self.voos.aexecutar(
+                self._chave(url, params), lambda: self._aexecutar(url, params, timeout, prazo),
+            )
+
+    async def _aexecutar(self, url, params, timeout, prazo):
+        tentativas = self._tentativas()
+        limite = time.monotonic() + (prazo if prazo is not None else timeout * tentativas)
+        for tentativa in range(tentativas):
+            await asyncio.sleep(self._vez(limite))
+            restante = limite - time.monotonic()
+            ultima = tentativa == tentativas - 1
+            try:
+                resposta = await self.cliente_async().get(
+                    url, params=params, timeout=min(timeout, max(restante, 0.001)),
+                )
+            except httpx.TransportError:
+                if ultima:
+                    raise
+                resposta = None
+            if resposta is not None and (resposta.status_code not in REPETIR or ultima):
+                return resposta
+
+            espera = self._espera(tentativa, resposta)
+            if time.monotonic() + espera >= limite:
+                if resposta is not None:
+                    return resposta
+                raise PrazoTMDbEsgotado("TMDb: prazo esgotado entre tentativas")
+            await asyncio.sleep(espera)
+
+
+cliente_tmdb = TMDbClient()
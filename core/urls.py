@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import views, views_async
+
+# Sob ASGI, as views limitadas por E/S podem rodar na versão assíncrona.
+io_views = views_async if settings.USAR_VIEWS_ASSINCRONAS else views
 
 urlpatterns = [
     path('', views.index, name='index'),
@@ -11,15 +15,23 @@ urlpatterns = [
     path('register/', views.register, name='register'),
 
     # Persona e recomendacoes
-    path('persona/', views.persona_view, name='persona'),
+    path('persona/', io_views.persona_view, name='persona'),
+    path('persona/stream/', io_views.persona_stream, name='persona_stream'),
+    path('tarefas/<int:tarefa_id>/', views.tarefa_status, name='tarefa_status'),
+    path('cache-llm/estatisticas/', views.cache_llm_estatisticas, name='cache_llm_estatisticas'),
+    path('metrics', views.metricas_prometheus, name='metricas'),
     path('recomendacoes/<str:titulo>/assistido/', views.marcar_assistido, name='marcar_assistido'),
 
     # Painel do usuario
     path('meu-perfil/', views.dashboard_view, name='dashboard'),
+    path('meu-perfil/grafico/', views.dashboard_grafico, name='dashboard_grafico'),
+    path('meu-perfil/importar/', views.importar_historico, name='importar_historico'),
+    path('meu-perfil/exportar/', views.exportar_historico, name='exportar_historico'),
 
     # Busca da Index
-    path('buscar_filme/', views.buscar_filme, name='buscar_filme'),
+    path('buscar_filme/', io_views.buscar_filme, name='buscar_filme'),
     path('marcar-assistido/<str:titulo>/', views.marcar_assistido, name='marcar_assistido'), 
     path('marcar_assistido/', views.marcar_assistido_api, name='marcar_assistido_api'),
-    path('movie_details/', views.movie_details, name='movie_details'),
+    path('movie_details/', io_views.movie_details, name='movie_details'),
+    path('imagens/<str:tamanho>/<str:arquivo>', views.imagem_tmdb, name='imagem_tmdb'),
 ]
@@ -1,18 +1,32 @@
-import os
+import json
+import logging
 import re
-import requests
+
 from bs4 import BeautifulSoup
+from django.conf import settings
+from pydantic import ValidationError
 
-TMDB_API_KEY = os.getenv("TMDB_API_KEY")
+from .metadados import aobter_por_titulos, obter_por_titulos
+from .recommender import ListaRecomendacoes
 
-def buscar_filmes_imdb(html_text):
-    """
-    Extrai títulos do HTML da IA (seja em <h2> ou dentro de <li>) 
-    e busca dados reais no TMDb.
-    Retorna lista de filmes com título, ano, poster, sinopse e link IMDb.
-    """
+logger = logging.getLogger(__name__)
+
+
+def como_recomendacao(filme, motivo=""):
+    return {
+        "titulo": filme.titulo,
+        "ano": filme.ano,
+        "poster": filme.poster_url(),
+        "poster_srcset": filme.poster_srcset(),
+        "link": filme.link_imdb,
+        "sinopse": filme.sinopse or "Sem sinopse disponível.",
+        "motivo": motivo,
+        "json": filme.como_json(),
+    }
+
+
+def _titulos_do_html(html_text):
     soup = BeautifulSoup(html_text, "html.parser")
-    filmes = []
 
     #1️ Tenta pegar <h2> (formato anterior)
     titulos = [t.get_text(strip=True) for t in soup.find_all("h2")]
@@ -28,50 +42,127 @@ def buscar_filmes_imdb(html_text):
                     titulos.append(titulo)
 
     #3️ Remove duplicatas
-    titulos = list(dict.fromkeys(titulos))
+    return list(dict.fromkeys(titulos))
+
+
+def ler_recomendacoes(texto):
+    """
+    Itens recomendados pela IA ({titulo, ano, genero, duracao, motivo}).
+    Resposta em JSON é validada contra ListaRecomendacoes; respostas em HTML
+    (formato antigo ou cache) caem no parser de títulos e trazem só o título.
+    """
+    if texto.lstrip().startswith("{"):
+        try:
+            lista = ListaRecomendacoes.model_validate_json(texto)
+        except ValidationError as e:
+            logger.warning("JSON da IA fora do esquema: %s", e)
+        else:
+            itens = {f.titulo: f.model_dump() for f in lista.filmes}
+            return list(itens.values())
+
+    return [{"titulo": titulo} for titulo in _titulos_do_html(texto)]
+
+
+def extrair_titulos(texto):
+    """Extrai os títulos da resposta da IA (JSON, <h2> ou <li>)."""
+    titulos = [item["titulo"] for item in ler_recomendacoes(texto)]
 
     if not titulos:
-        print("⚠️ Nenhum título encontrado no HTML da IA.")
-        print(html_text[:500]) 
+        logger.warning("Nenhum título encontrado na resposta da IA: %.500s", texto)
 
-    print(f"Títulos extraídos da IA: {titulos}")
+    logger.debug("Títulos extraídos da IA: %s", titulos)
+    return titulos
 
-    for titulo in titulos:
-        try:
-            print(f"Buscando no TMDb: {titulo}")
-            r = requests.get(
-                "https://api.themoviedb.org/3/search/movie",
-                params={"api_key": TMDB_API_KEY, "query": titulo, "language": "pt-BR"}
-            )
-            data = r.json()
-
-            if not data.get("results"):
-                print(f"❌ Não encontrado: {titulo}")
-                continue
-
-            filme = data["results"][0]
-
-            detalhes = requests.get(
-                f"https://api.themoviedb.org/3/movie/{filme['id']}",
-                params={"api_key": TMDB_API_KEY, "append_to_response": "external_ids", "language": "pt-BR"}
-            ).json()
-
-            imdb_id = detalhes.get("external_ids", {}).get("imdb_id")
-            link_imdb = f"https://www.imdb.com/title/{imdb_id}" if imdb_id else "#"
-
-            filmes.append({
-                "titulo": filme["title"],
-                "ano": filme.get("release_date", "")[:4],
-                "poster": f"https://image.tmdb.org/t/p/w500{filme.get('poster_path', '')}" if filme.get("poster_path") else "",
-                "link": link_imdb,
-                "sinopse": filme.get("overview", "Sem sinopse disponível."),
-                "json": filme,
-            })
-
-            print(f"✅ Encontrado: {filme['title']}")
-
-        except Exception as e:
-            print(f"⚠️ Erro ao buscar {titulo}: {e}")
-
-    print(f"Total de filmes encontrados: {len(filmes)}")
+
+class ExtratorTitulos:
+    """
+    Extrai títulos à medida que a resposta da IA chega em pedaços (streaming).
+    Cada chamada a ``alimentar`` devolve apenas os títulos novos: no JSON,
+    assim que o objeto do filme fecha (com o "motivo", guardado em
+    ``motivos``); no HTML, quando o <h2> ou <li> que os contém é fechado.
+    """
+
+    _FECHAMENTO = re.compile(r"</(?:h2|li)\s*>", re.IGNORECASE)
+    _LISTA_JSON = re.compile(r'"filmes"\s*:\s*\[')
+
+    def __init__(self):
+        self.html = ""
+        self.titulos = []
+        self.motivos = {}
+        self._fechamentos = 0
+        self._posicao_json = None
+
+    def _titulos_json(self):
+        """Títulos dos objetos da lista "filmes" já completos, desde a última leitura."""
+        if self._posicao_json is None:
+            lista = self._LISTA_JSON.search(self.html)
+            if not lista:
+                return []
+            self._posicao_json = lista.end()
+
+        titulos, decodificador = [], json.JSONDecoder()
+        while True:
+            posicao = self._posicao_json
+            while posicao < len(self.html) and self.html[posicao] in " \t\r\n,":
+                posicao += 1
+            try:
+                item, posicao = decodificador.raw_decode(self.html, posicao)
+            except ValueError:  # objeto ainda incompleto (ou fim da lista)
+                return titulos
+            self._posicao_json = posicao
+            if isinstance(item, dict) and item.get("titulo"):
+                self.motivos[item["titulo"]] = item.get("motivo", "")
+                titulos.append(item["titulo"])
+
+    def alimentar(self, pedaco):
+        self.html += pedaco
+        if self.html.lstrip().startswith("{"):
+            encontrados = self._titulos_json()
+        else:
+            fechamentos = len(self._FECHAMENTO.findall(self.html))
+            if fechamentos == self._fechamentos:
+                return []
+            self._fechamentos = fechamentos
+            encontrados = _titulos_do_html(self.html)
+
+        novos = [t for t in dict.fromkeys(encontrados) if t not in self.titulos]
+        self.titulos.extend(novos)
+        return novos
+
+
+def parametros_enriquecimento():
+    return {
+        "blocos": ("basico", "external_ids"),
+        "concorrencia": getattr(settings, "TMDB_ENRIQUECIMENTO_CONCORRENCIA", 5),
+        "prazo": getattr(settings, "TMDB_ENRIQUECIMENTO_PRAZO", 8),
+    }
+
+
+def _montar_recomendacoes(itens, resultados):
+    filmes = []
+    for item, filme in zip(itens, resultados):
+        if not filme:
+            logger.info("Filme não encontrado no TMDb: %s", item["titulo"])
+            continue
+        filmes.append(como_recomendacao(filme, item.get("motivo", "")))
+
+    logger.debug("Filmes encontrados: %d de %d", len(filmes), len(itens))
     return filmes
+
+
+def buscar_filmes_imdb(texto):
+    """
+    Lê os itens da resposta da IA e busca dados reais no TMDb (via
+    core.metadados), todos os títulos em paralelo.
+    Retorna lista de filmes com título, ano, poster, sinopse, motivo e link IMDb.
+    """
+    itens = ler_recomendacoes(texto)
+    resultados = obter_por_titulos([i["titulo"] for i in itens], **parametros_enriquecimento())
+    return _montar_recomendacoes(itens, resultados)
+
+
+async def abuscar_filmes_imdb(texto):
+    """Versão assíncrona de ``buscar_filmes_imdb``."""
+    itens = ler_recomendacoes(texto)
+    resultados = await aobter_por_titulos([i["titulo"] for i in itens], **parametros_enriquecimento())
+    return _montar_recomendacoes(itens, resultados)
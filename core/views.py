@@ -1,27 +1,36 @@
+import io
 import json
-import os
+import logging
 
-import requests
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.views import LoginView
-from django.core.cache import cache
-from django.db.models import Avg, Count
-from django.http import JsonResponse
+from django.conf import settings
+from django.db.models import Count, Q
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import conditional_page, require_POST
 
+from . import cache_llm, catalogo, historico, metricas, posters
 from .forms import PersonaForm
-from .models import FilmeAssistido, Persona, Post, Recomendacao
-from .recommender import gerar_recomendacoes
-from .utils import buscar_filmes_imdb
-
+from .governador import LLMSobrecarregado
+from .metadados import BLOCOS, buscar_tmdb, obter_filme, obter_filmes
+from .models import FilmeAssistido, FilmeMetadados, Persona, Post, Recomendacao, TarefaRecomendacao
+from .painel import pagina_historico, series_grafico
+from .perfil import perfil_de, registrar_nota
+from .streaming import eventos_recomendacao
+from .tarefas import enfileirar, gerar_e_enriquecer
+from .utils import ler_recomendacoes
 
+logger = logging.getLogger(__name__)
 
-TMDB_API_KEY = os.getenv("TMDB_API_KEY")
 
 class CustomLoginView(LoginView):
     template_name = 'login.html'
@@ -68,16 +77,14 @@ def persona_view(request):
             form.save()
             dados = form.cleaned_data
 
-            cache_key = f"recomendacoes_{user.id}_{dados['genero_favorito']}_{dados['humor']}"
-            recomendacoes_html = cache.get(cache_key)
-            if not recomendacoes_html:
-                recomendacoes_html = gerar_recomendacoes(dados, user=request.user)
-                cache.set(cache_key, recomendacoes_html, timeout=3600)  
-
-            Recomendacao.objects.create(persona=persona, filmes_html=recomendacoes_html)
+            if getattr(settings, "RECOMENDACOES_EM_SEGUNDO_PLANO", False):
+                tarefa = enfileirar(user, persona, dados)
+                return _resposta_tarefa(request, tarefa)
 
-            filmes_enriquecidos = buscar_filmes_imdb(recomendacoes_html)
-            
+            try:
+                filmes_enriquecidos = gerar_e_enriquecer(persona, dados, user)
+            except LLMSobrecarregado:
+                return _ia_sobrecarregada(request, form)
 
             return render(request, 'recomendacoes.html', {
                 'recomendacoes': filmes_enriquecidos,
@@ -87,6 +94,73 @@ def persona_view(request):
 
     return render(request, 'persona_form.html', {'form': form})
 
+
+def _ia_sobrecarregada(request, form):
+    """503 com o formulário preenchido quando não há vaga nem resposta de reserva."""
+    messages.error(request, 'Muitos pedidos de recomendação agora. Tente de novo em alguns segundos.')
+    resposta = render(request, 'persona_form.html', {'form': form}, status=503)
+    resposta['Retry-After'] = '10'
+    return resposta
+
+
+def _resposta_tarefa(request, tarefa):
+    """Resposta imediata do POST enfileirado: JSON para fetch, página de espera para o navegador."""
+    if "application/json" in request.headers.get("Accept", ""):
+        return JsonResponse({"tarefa_id": tarefa.id, "status": tarefa.status}, status=202)
+    return render(request, 'recomendacoes_aguardando.html', {'tarefa': tarefa})
+
+
+@login_required
+def tarefa_status(request, tarefa_id):
+    """Situação de uma TarefaRecomendacao do usuário; inclui os filmes quando concluída."""
+    tarefa = get_object_or_404(TarefaRecomendacao, id=tarefa_id, user=request.user)
+    return JsonResponse({
+        "tarefa_id": tarefa.id,
+        "status": tarefa.status,
+        "recomendacoes": tarefa.resultado or [],
+        "erro": tarefa.erro,
+    })
+
+
+@staff_member_required
+def cache_llm_estatisticas(request):
+    """Acertos, falhas e remoções do cache de respostas da IA."""
+    return JsonResponse(cache_llm.estatisticas())
+
+def metricas_prometheus(request):
+    """Histogramas de latência e contadores no formato texto do Prometheus."""
+    token = getattr(settings, "METRICAS_TOKEN", "")
+    autorizado = request.user.is_staff or (
+        token and request.headers.get("Authorization") == f"Bearer {token}"
+    )
+    if not autorizado:
+        return HttpResponse(status=403)
+    return HttpResponse(metricas.exportar(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@login_required
+@require_POST
+def persona_stream(request):
+    """
+    Mesma entrada do formulário de persona_view, mas responde em streaming
+    (text/event-stream): tokens da IA e cards de filme assim que ficam prontos.
+    """
+    persona, _ = Persona.objects.get_or_create(user=request.user)
+    form = PersonaForm(request.POST, instance=persona)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+    form.save()
+
+    return _resposta_sse(eventos_recomendacao(persona, form.cleaned_data, request.user))
+
+
+def _resposta_sse(eventos):
+    response = StreamingHttpResponse(eventos, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Impede que proxies (nginx) segurem o stream em buffer.
+    response["X-Accel-Buffering"] = "no"
+    return response
+
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 import json
@@ -125,79 +199,180 @@ def dashboard_view(request):
 
     persona = Persona.objects.filter(user=user).first()
 
-    recomendacoes = Recomendacao.objects.filter(persona__user=user).order_by('-data_criacao')[:5]
+    recomendacoes = list(Recomendacao.objects.filter(persona__user=user).order_by('-data_criacao')[:5])
+    for r in recomendacoes:
+        # Respostas em JSON (formato estruturado) viram lista; HTML antigo vai como está.
+        r.itens = ler_recomendacoes(r.filmes_html) if r.filmes_html.lstrip().startswith("{") else None
 
-    filmes = FilmeAssistido.objects.filter(user=user).order_by('-data_assistido')
+    # Histórico paginado por cursor; o gráfico vem de dashboard_grafico.
+    filmes, proximo_cursor = pagina_historico(user, request.GET.get('antes'))
 
-    total_filmes = filmes.count()
-    nota_media = filmes.aggregate(media=Avg('nota'))['media'] or 0
-
-    grafico_labels = [f.titulo for f in filmes]
-    grafico_dados = [f.nota for f in filmes]
+    perfil = perfil_de(user)
 
     context = {
         'persona': persona,
         'recomendacoes': recomendacoes,
         'filmes': filmes,
-        'total_filmes': total_filmes,
-        'nota_media': round(nota_media, 1),
-        'grafico_labels': grafico_labels,
-        'grafico_dados': grafico_dados,
+        'proximo_cursor': proximo_cursor,
+        'pagina_anterior': bool(request.GET.get('antes')),
+        'perfil': perfil,
+        'generos_preferidos': sorted(perfil.afinidades().items(), key=lambda g: -g[1])[:5],
+        'total_filmes': perfil.total,
+        'nota_media': round(perfil.nota_media, 1),
     }
 
     return render(request, 'dashboard.html', context)
 
+
+@login_required
+def dashboard_grafico(request):
+    """Séries agregadas do gráfico do painel (?agrupar=semana|mes)."""
+    return JsonResponse(series_grafico(request.user, request.GET.get('agrupar', 'mes')))
+
+
+@login_required
+@require_POST
+def importar_historico(request):
+    """
+    Recebe um arquivo (campo ``arquivo``: CSV do Letterboxd/IMDb ou JSONL) e
+    importa o histórico em lotes; só os primeiros HISTORICO_LOTES_TMDB lotes
+    buscam no TMDb (até 10 s cada). Responde com o resumo da importação.
+    """
+    arquivo = request.FILES.get('arquivo')
+    if not arquivo:
+        return JsonResponse({"success": False, "error": "Envie o arquivo no campo 'arquivo'."}, status=400)
+
+    texto = io.TextIOWrapper(arquivo.file, encoding='utf-8-sig', newline='')
+    try:
+        resumo = historico.importar(
+            request.user, texto, formato=request.POST.get('formato') or None, prazo_lote=10,
+            lotes_tmdb=getattr(settings, 'HISTORICO_LOTES_TMDB', 2),
+        )
+    except (UnicodeDecodeError, ValueError) as e:
+        return JsonResponse({"success": False, "error": f"Arquivo inválido: {e}"}, status=400)
+    return JsonResponse({"success": True, **resumo})
+
+
+@login_required
+def exportar_historico(request):
+    """Histórico completo em CSV (padrão) ou JSONL, gerado em streaming."""
+    if request.GET.get('formato') == 'jsonl':
+        linhas, tipo, extensao = historico.exportar_jsonl(request.user), 'application/x-ndjson', 'jsonl'
+    else:
+        linhas, tipo, extensao = historico.exportar_csv(request.user), 'text/csv; charset=utf-8', 'csv'
+    resposta = StreamingHttpResponse(linhas, content_type=tipo)
+    resposta['Content-Disposition'] = f'attachment; filename="historico.{extensao}"'
+    return resposta
+
+
+def _consulta_notas(user, resultados):
+    tmdb_ids = [r["tmdb_id"] for r in resultados if r["tmdb_id"]]
+    imdb_ids = [r["imdb_id"] for r in resultados if r["imdb_id"]]
+    titulos = [r["titulo"] for r in resultados if r["titulo"]]
+    return FilmeAssistido.objects.filter(user=user).filter(
+        Q(tmdb_id__in=tmdb_ids) | Q(imdb_id__in=imdb_ids) | Q(titulo__in=titulos)
+    ).values_list("tmdb_id", "imdb_id", "titulo", "nota")
+
+
+def _aplicar_notas(resultados, assistidos):
+    """
+    Preenche user_rating em cada resultado a partir das linhas
+    (tmdb_id, imdb_id, titulo, nota), casando por tmdb_id, depois imdb_id,
+    depois título.
+    """
+    por_tmdb, por_imdb, por_titulo = {}, {}, {}
+    for tmdb_id, imdb_id, titulo, nota in assistidos:
+        if tmdb_id:
+            por_tmdb[tmdb_id] = nota
+        if imdb_id:
+            por_imdb[imdb_id] = nota
+        por_titulo[titulo] = nota
+
+    for resultado in resultados:
+        for chave, indice in (("tmdb_id", por_tmdb), ("imdb_id", por_imdb), ("titulo", por_titulo)):
+            if resultado[chave] in indice:
+                resultado["user_rating"] = indice[resultado[chave]]
+                break
+
+
+def _parametros_lote():
+    return {
+        "concorrencia": getattr(settings, "TMDB_ENRIQUECIMENTO_CONCORRENCIA", 5),
+        "prazo": getattr(settings, "TMDB_ENRIQUECIMENTO_PRAZO", 8),
+    }
+
+
+def _resultados_busca(resultados, metadados):
+    filmes = []
+    for f in resultados:
+        ano = f.get("release_date", "")[:4] if f.get("release_date") else "N/A"
+        tmdb_id = f.get("id")
+        imdb_id = f.get("imdb_id") or (metadados[tmdb_id].imdb_id if tmdb_id in metadados else None)
+
+        filmes.append({
+            "titulo": f.get("title"),
+            "ano": ano,
+            "poster": posters.url(f.get("poster_path")),
+            "poster_srcset": posters.srcset(f.get("poster_path")),
+            "tmdb_id": tmdb_id,
+            "imdb_id": imdb_id,
+            "link": f"https://www.imdb.com/title/{imdb_id}" if imdb_id else "#",
+            "user_rating": None,
+        })
+    return filmes
+
+
+# buscar_filme e movie_details passam por gzip_page e conditional_page: ETag
+# tirado do conteúdo e 304 quando o navegador já tem a mesma resposta.
+def _cache_busca(resposta):
+    """A busca traz user_rating: só o navegador do usuário guarda, revalidando sempre pelo ETag."""
+    patch_cache_control(resposta, private=True, no_cache=True)
+    patch_vary_headers(resposta, ["Cookie"])
+    return resposta
+
+
+def _cache_detalhes(resposta):
+    """Detalhes são iguais para todos: cache público por DETALHES_MAX_AGE segundos."""
+    patch_cache_control(resposta, public=True, max_age=getattr(settings, "DETALHES_MAX_AGE", 3600))
+    return resposta
+
+
+def _consulta_metadados_locais(resultados):
+    """Metadados já guardados dos resultados do catálogo que vieram sem imdb_id."""
+    sem_imdb = [f["id"] for f in resultados if not f.get("imdb_id")]
+    return FilmeMetadados.objects.filter(tmdb_id__in=sem_imdb) if sem_imdb else FilmeMetadados.objects.none()
+
+
+@gzip_page
+@conditional_page
 def buscar_filme(request):
-    """Consulta TMDb e retorna resultados JSON incluindo user_rating (se logado)."""
+    """
+    Busca no catálogo local (core.catalogo) e, se ele não achar nada, no TMDb.
+    Retorna resultados JSON incluindo user_rating (se logado).
+    """
     termo = request.GET.get("q", "")
     if not termo or len(termo) < 2:
         return JsonResponse({"results": []})
 
     try:
-        r = requests.get(
-            "https://api.themoviedb.org/3/search/movie",
-            params={
-                "api_key": TMDB_API_KEY,
-                "query": termo,
-                "language": "pt-BR",
-                "include_adult": "false"
-            },
-            timeout=5
-        )
-        data = r.json()
-        filmes = []
-
-        for f in data.get("results", [])[:8]:
-            poster = f"https://image.tmdb.org/t/p/w500{f.get('poster_path')}" if f.get("poster_path") else ""
-            ano = f.get("release_date", "")[:4] if f.get("release_date") else "N/A"
-            tmdb_id = f.get("id")
-            detalhes = requests.get(
-                f"https://api.themoviedb.org/3/movie/{tmdb_id}",
-                params={"api_key": TMDB_API_KEY, "append_to_response": "external_ids"},
-                timeout=5
-            ).json()
-            imdb_id = detalhes.get("external_ids", {}).get("imdb_id")
-
-            
-            user_rating = None
-            if request.user.is_authenticated:
-                fa = FilmeAssistido.objects.filter(user=request.user, imdb_id=imdb_id).first()
-                if not fa:
-                    fa = FilmeAssistido.objects.filter(user=request.user, titulo=f.get("title")).first()
-                if fa:
-                    user_rating = fa.nota  
-
-            filmes.append({
-                "titulo": f.get("title"),
-                "ano": ano,
-                "poster": poster,
-                "tmdb_id": tmdb_id,
-                "imdb_id": imdb_id,
-                "link": f"https://www.imdb.com/title/{imdb_id}" if imdb_id else "#",
-                "user_rating": user_rating 
-            })
+        resultados = catalogo.buscar(termo, limite=8)
+        if resultados:
+            # Sem ir ao TMDb: imdb_id do dump ou dos metadados já guardados.
+            metadados = {f.tmdb_id: f for f in _consulta_metadados_locais(resultados)}
+        else:
+            resultados = buscar_tmdb(termo, timeout=5)[:8]
 
-        return JsonResponse({"results": filmes})
+            # external_ids de todos os resultados de uma vez (banco local + TMDb em paralelo)
+            metadados = obter_filmes(
+                [f["id"] for f in resultados], blocos=("external_ids",), **_parametros_lote()
+            )
+        filmes = _resultados_busca(resultados, metadados)
+
+        # notas do usuário para todos os resultados em uma consulta
+        if request.user.is_authenticated and filmes:
+            _aplicar_notas(filmes, _consulta_notas(request.user, filmes))
+
+        return _cache_busca(JsonResponse({"results": filmes}))
 
     except Exception as e:
         return JsonResponse({"error": str(e), "results": []})
@@ -213,72 +388,97 @@ def marcar_assistido_api(request):
         data = json.loads(request.body or "{}")
         titulo = (data.get("titulo") or "").strip()
         nota = int(data.get("nota") or 0)
-        tmdb_id = data.get("tmdb_id")
+        tmdb_id = str(data.get("tmdb_id") or "")
+        tmdb_id = int(tmdb_id) if tmdb_id.isdigit() else None
         imdb_id = data.get("imdb_id")
 
         if not titulo or not (1 <= nota <= 5):
             return JsonResponse({"success": False, "error": "Dados inválidos."}, status=400)
 
-        obj, created = FilmeAssistido.objects.update_or_create(
-            user=request.user,
-            imdb_id=imdb_id if imdb_id else None,
-            titulo=titulo,
-            defaults={"nota": nota}
+        obj, created = registrar_nota(
+            request.user, titulo, nota, tmdb_id=tmdb_id, imdb_id=imdb_id if imdb_id else None,
         )
         return JsonResponse({"success": True, "created": created})
     except Exception as e:
         return JsonResponse({"success": False, "error": str(e)}, status=500)
     
 
+def _validar_tmdb_id(request):
+    """Devolve (tmdb_id, None) ou (None, JsonResponse de erro)."""
+    tmdb_id = request.GET.get("tmdb_id")
+    if not tmdb_id:
+        return None, JsonResponse({"error": "tmdb_id required"}, status=400)
+    try:
+        return int(tmdb_id), None
+    except ValueError:
+        return None, JsonResponse({"error": "tmdb_id inválido"}, status=400)
+
+
+def _detalhes_json(filme):
+    return {
+        "titulo": filme.titulo,
+        "original_title": filme.titulo_original,
+        "ano": filme.ano,
+        "runtime": filme.duracao,
+        "genres": filme.generos,
+        "sinopse": filme.sinopse,
+        "poster": filme.poster_url(),
+        "poster_srcset": filme.poster_srcset(),
+        "backdrop": filme.backdrop_url(),
+        "imdb_id": filme.imdb_id,
+        "vote_average": filme.nota_media,
+        "vote_count": filme.total_votos,
+        "cast": filme.elenco(),
+        "director": filme.diretor,
+        "tmdb_id": filme.tmdb_id,
+        "trailer": filme.trailer_url,
+    }
+
+
+@gzip_page
+@conditional_page
 def movie_details(request):
     """
-    Retorna JSON com detalhes do filme via TMDb (overview, cast, diretor, runtime, genres, imdb_id, trailer).
+    Retorna JSON com detalhes do filme via TMDb (overview, cast, diretor, runtime, genres, imdb_id, trailer),
+    lidos do armazenamento local de metadados (core.metadados).
     Exige query param: tmdb_id
     """
-    tmdb_id = request.GET.get("tmdb_id")
-    if not tmdb_id:
-        return JsonResponse({"error": "tmdb_id required"}, status=400)
+    tmdb_id, erro = _validar_tmdb_id(request)
+    if erro:
+        return erro
 
     try:
-        detalhes = requests.get(
-            f"https://api.themoviedb.org/3/movie/{tmdb_id}",
-            params={"api_key": TMDB_API_KEY, "append_to_response": "external_ids,credits,videos", "language": "pt-BR"},
-            timeout=6
-        ).json()
-
-        cast = []
-        director = None
-        for member in detalhes.get("credits", {}).get("cast", [])[:6]:
-            cast.append({"name": member.get("name"), "character": member.get("character")})
-
-        for crew in detalhes.get("credits", {}).get("crew", []):
-            if crew.get("job") == "Director":
-                director = crew.get("name")
-                break
+        filme = obter_filme(tmdb_id, blocos=tuple(BLOCOS))
+        if not filme:
+            return JsonResponse({"error": "Filme não encontrado"}, status=404)
 
-        trailer_url = None
-        for v in detalhes.get("videos", {}).get("results", []):
-            if v.get("type") == "Trailer" and v.get("site") == "YouTube":
-                trailer_url = f"https://www.youtube.com/watch?v={v.get('key')}"
-                break
+        return _cache_detalhes(JsonResponse(_detalhes_json(filme)))
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
 
-        response = {
-            "titulo": detalhes.get("title"),
-            "original_title": detalhes.get("original_title"),
-            "ano": detalhes.get("release_date", "")[:4],
-            "runtime": detalhes.get("runtime"), 
-            "genres": [g.get("name") for g in detalhes.get("genres", [])],
-            "sinopse": detalhes.get("overview"),
-            "poster": f"https://image.tmdb.org/t/p/w500{detalhes.get('poster_path')}" if detalhes.get('poster_path') else "",
-            "backdrop": f"https://image.tmdb.org/t/p/w780{detalhes.get('backdrop_path')}" if detalhes.get('backdrop_path') else "",
-            "imdb_id": detalhes.get("external_ids", {}).get("imdb_id"),
-            "vote_average": detalhes.get("vote_average"),
-            "vote_count": detalhes.get("vote_count"),
-            "cast": cast,
-            "director": director,
-            "tmdb_id": tmdb_id,
-            "trailer": trailer_url, 
-        }
-        return JsonResponse(response)
+
+def imagem_tmdb(request, tamanho, arquivo):
+    """
+    Pôster ou fundo do TMDb na largura pedida, servido do disco (core.posters).
+    O conteúdo de uma URL nunca muda: cache longo e ETag com o hash.
+    """
+    try:
+        imagem = posters.obter(tamanho, arquivo)
+    except posters.ImagemInvalida:
+        raise Http404("Imagem inválida")
     except Exception as e:
-        return JsonResponse({"error": str(e)}, status=500)
\ No newline at end of file
+        logger.warning("Proxy de imagens: falha ao baixar %s/%s: %s", tamanho, arquivo, e)
+        return redirect(posters.url_tmdb(tamanho, arquivo))
+    if imagem is None:
+        raise Http404("Imagem não encontrada")
+
+    etag = f'"{imagem.hash}"'
+    # If-None-Match usa comparação fraca: W/"x" também casa com "x".
+    pedidas = parse_etags(request.headers.get("If-None-Match", ""))
+    if "*" in pedidas or etag in (e.removeprefix("W/") for e in pedidas):
+        resposta = HttpResponse(status=304)
+    else:
+        resposta = FileResponse(open(imagem.caminho, "rb"), content_type=imagem.tipo)
+    resposta["ETag"] = etag
+    resposta["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resposta
@@ -0,0 +1,140 @@
+"""
+Versões assíncronas das views limitadas por E/S (TMDb e OpenRouter).
+
+Usam httpx e o ORM assíncrono, de modo que um único worker ASGI atende
+centenas de chamadas externas em andamento. São ligadas em core/urls.py
+quando ``USAR_VIEWS_ASSINCRONAS`` está ativo; as respostas são idênticas às
+das views síncronas de core/views.py.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import conditional_page, require_POST
+
+from . import catalogo
+from .forms import PersonaForm
+from .governador import LLMSobrecarregado
+from .metadados import BLOCOS, abuscar_tmdb, aobter_filme, aobter_filmes
+from .models import Persona, Recomendacao
+from .recommender import agerar_recomendacoes
+from .streaming import aeventos_recomendacao
+from .tarefas import enfileirar
+from .utils import abuscar_filmes_imdb
+from .views import (
+    _aplicar_notas,
+    _cache_busca,
+    _cache_detalhes,
+    _consulta_metadados_locais,
+    _consulta_notas,
+    _detalhes_json,
+    _ia_sobrecarregada,
+    _parametros_lote,
+    _resposta_sse,
+    _resposta_tarefa,
+    _resultados_busca,
+    _validar_tmdb_id,
+)
+
+
+@gzip_page
+@conditional_page
+async def buscar_filme(request):
+    """Catálogo local primeiro, TMDb na falta (ver views.buscar_filme)."""
+    termo = request.GET.get("q", "")
+    if not termo or len(termo) < 2:
+        return JsonResponse({"results": []})
+
+    try:
+        # A consulta ao FTS leva poucos milissegundos; não vale uma thread.
+        resultados = catalogo.buscar(termo, limite=8)
+        if resultados:
+            metadados = {f.tmdb_id: f async for f in _consulta_metadados_locais(resultados)}
+        else:
+            resultados = (await abuscar_tmdb(termo, timeout=5))[:8]
+
+            metadados = await aobter_filmes(
+                [f["id"] for f in resultados], blocos=("external_ids",), **_parametros_lote()
+            )
+        filmes = _resultados_busca(resultados, metadados)
+
+        user = await request.auser()
+        if user.is_authenticated and filmes:
+            assistidos = [linha async for linha in _consulta_notas(user, filmes)]
+            _aplicar_notas(filmes, assistidos)
+
+        return _cache_busca(JsonResponse({"results": filmes}))
+
+    except Exception as e:
+        return JsonResponse({"error": str(e), "results": []})
+
+
+@gzip_page
+@conditional_page
+async def movie_details(request):
+    """Detalhes do filme para o modal da index (ver views.movie_details)."""
+    tmdb_id, erro = _validar_tmdb_id(request)
+    if erro:
+        return erro
+
+    try:
+        filme = await aobter_filme(tmdb_id, blocos=tuple(BLOCOS))
+        if not filme:
+            return JsonResponse({"error": "Filme não encontrado"}, status=404)
+
+        return _cache_detalhes(JsonResponse(_detalhes_json(filme)))
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@login_required
+async def persona_view(request):
+    user = await request.auser()
+    # O template acessa request.user; já resolvido, evita consulta síncrona.
+    request.user = user
+    persona, _ = await Persona.objects.aget_or_create(user=user)
+
+    if request.method == 'POST':
+        form = PersonaForm(request.POST, instance=persona)
+        if form.is_valid():
+            persona = form.save(commit=False)
+            await persona.asave()
+            dados = form.cleaned_data
+
+            if getattr(settings, "RECOMENDACOES_EM_SEGUNDO_PLANO", False):
+                tarefa = await sync_to_async(enfileirar)(user, persona, dados)
+                return _resposta_tarefa(request, tarefa)
+
+            try:
+                recomendacoes_html = await agerar_recomendacoes(dados, user=user)
+            except LLMSobrecarregado:
+                return _ia_sobrecarregada(request, form)
+
+            await Recomendacao.objects.acreate(persona=persona, filmes_html=recomendacoes_html)
+
+            filmes_enriquecidos = await abuscar_filmes_imdb(recomendacoes_html)
+
+            return render(request, 'recomendacoes.html', {
+                'recomendacoes': filmes_enriquecidos,
+            })
+    else:
+        form = PersonaForm(instance=persona)
+
+    return render(request, 'persona_form.html', {'form': form})
+
+
+@login_required
+@require_POST
+async def persona_stream(request):
+    """Versão assíncrona de views.persona_stream."""
+    user = await request.auser()
+    persona, _ = await Persona.objects.aget_or_create(user=user)
+    form = PersonaForm(request.POST, instance=persona)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+    persona = form.save(commit=False)
+    await persona.asave()
+
+    return _resposta_sse(aeventos_recomendacao(persona, form.cleaned_data, user))
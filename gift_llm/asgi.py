@@ -3,6 +3,11 @@ ASGI config for gift_llm project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Set USAR_VIEWS_ASSINCRONAS=1 to serve the I/O-bound views from
+core/views_async.py, e.g.:
+
+    USAR_VIEWS_ASSINCRONAS=1 uvicorn gift_llm.asgi:application --workers 2
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
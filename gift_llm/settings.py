@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 
 
@@ -19,6 +20,89 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+TMDB_API_KEY = os.getenv("TMDB_API_KEY")
+TMDB_URL = "https://api.themoviedb.org/3"
+
+# Com o servidor ASGI (gift_llm.asgi), usa as versões assíncronas das views
+# que dependem do TMDb e do OpenRouter (core/views_async.py).
+USAR_VIEWS_ASSINCRONAS = os.getenv("USAR_VIEWS_ASSINCRONAS") == "1"
+
+# Com a fila ativa, o POST da persona só enfileira a geração e devolve o id da
+# tarefa; quem gera é o comando `manage.py worker_recomendacoes`. Tarefas em
+# execução há mais de TAREFAS_TIMEOUT segundos voltam para a fila. Sem vaga na
+# IA, a tarefa volta para a fila até TAREFAS_MAX_TENTATIVAS vezes e depois falha.
+RECOMENDACOES_EM_SEGUNDO_PLANO = os.getenv("RECOMENDACOES_EM_SEGUNDO_PLANO") == "1"
+TAREFAS_TIMEOUT = 300
+TAREFAS_MAX_TENTATIVAS = 5
+
+# Respostas da IA guardadas no banco pelo hash do prompt (core.cache_llm).
+# Acima deste número de entradas, as menos usadas recentemente são removidas.
+LLM_CACHE_MAX_ENTRADAS = 1000
+
+# "json": a IA responde com a lista estruturada (core.recommender.ListaRecomendacoes)
+# validada por esquema; "html": formato antigo, lido com BeautifulSoup.
+RECOMENDACOES_FORMATO = os.getenv("RECOMENDACOES_FORMATO", "json")
+
+# Preço por milhão de tokens (US$), para o custo estimado de cada ChamadaLLM
+# (core.chamadas_llm); modelos fora da lista ficam com custo 0.
+LLM_PRECOS = {
+    "gpt-4o-mini": {"entrada": 0.15, "saida": 0.60},
+}
+
+# Quantos candidatos do catálogo local (core.candidatos) vão no prompt para a IA
+# reordenar; 0 desliga. Se a IA falhar ou passar de LLM_TIMEOUT segundos, os
+# candidatos viram a resposta.
+RECOMENDACOES_CANDIDATOS = 20
+LLM_TIMEOUT = 30
+
+# Modelos da IA em ordem (core.recommender): o primeiro é o principal e os
+# seguintes, as reservas. "base_url" e "api_key" são opcionais (padrão:
+# OpenRouter). Se o modelo atual não responde em LLM_HEDGE_PERCENTIL das suas
+# latências recentes (no mínimo LLM_HEDGE_MINIMO s; LLM_HEDGE_PADRAO s sem
+# histórico), a próxima reserva é chamada junto e vale a primeira resposta;
+# se ele falha, a próxima assume. LLM_HEDGE = False deixa só a troca por falha.
+# Com reservas, LLM_TENTATIVAS baixo passa a vez mais cedo.
+LLM_MODELOS = [{"modelo": "gpt-4o-mini"}] + [
+    {"modelo": nome} for nome in os.getenv("LLM_MODELOS_RESERVA", "").split(",") if nome
+]
+LLM_TENTATIVAS = int(os.getenv("LLM_TENTATIVAS", 2))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1") == "1"
+LLM_HEDGE_PERCENTIL = 95
+LLM_HEDGE_MINIMO = 1
+LLM_HEDGE_PADRAO = 10
+
+# Metadados do TMDb guardados no banco (core.metadados): TTL por bloco de
+# campos, em segundos, e janela extra em que o dado vencido ainda é servido
+# enquanto é revalidado em segundo plano.
+TMDB_METADADOS_TTL = {
+    "basico": 7 * 24 * 3600,
+    "detalhes": 7 * 24 * 3600,
+    "creditos": 30 * 24 * 3600,
+    "external_ids": 90 * 24 * 3600,
+    "videos": 7 * 24 * 3600,
+}
+TMDB_METADADOS_STALE = 30 * 24 * 3600
+
+# Enriquecimento das recomendações no TMDb: quantos títulos são resolvidos ao
+# mesmo tempo, prazo total em segundos e tamanho do pool de conexões HTTP.
+TMDB_ENRIQUECIMENTO_CONCORRENCIA = 5
+TMDB_ENRIQUECIMENTO_PRAZO = 8
+TMDB_POOL_CONEXOES = 20
+
+# Ritmo das chamadas ao TMDb (core.tmdb): até TMDB_TAXA por segundo, com
+# rajadas de TMDB_RAJADA, abaixo do limite de ~50/s por IP. Respostas 429/5xx
+# e erros de conexão são repetidos até TMDB_TENTATIVAS vezes no total.
+TMDB_TAXA = 40
+TMDB_RAJADA = 40
+TMDB_TENTATIVAS = 3
+TMDB_ESPERA_BASE = 0.25
+
+# Resultados da busca de títulos no TMDb, guardados no cache compartilhado.
+TMDB_BUSCA_TTL = 6 * 3600
+
+# Por quanto tempo o navegador reaproveita /movie_details/ sem perguntar ao
+# servidor; depois disso revalida pelo ETag (304 se nada mudou).
+DETALHES_MAX_AGE = 3600
 
 
 
@@ -52,6 +136,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primeiro da lista: mede a requisição inteira (Server-Timing e /metrics).
+    "core.metricas.MetricasMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -78,10 +164,18 @@ TEMPLATES = [
     },
 ]
 
+# Cache em duas camadas (core.cache_camadas): LRU em memória por processo na
+# frente de um SQLite em WAL dividido por todos os workers da máquina.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-movie-cache'
+        'BACKEND': 'core.cache_camadas.CacheDuasCamadas',
+        'LOCATION': os.getenv("CACHE_PATH", os.path.join(tempfile.gettempdir(), "findmyfilm-cache.sqlite3")),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'L1_MAX_ENTRADAS': 500,
+            'L1_TTL': 30,
+            'SINCRONIA': 0.5,
+        },
     }
 }
 
@@ -98,6 +192,60 @@ DATABASES = {
     }
 }
 
+# Governador das chamadas à IA (core.governador): no máximo LLM_MAX_CONCORRENTES
+# ao mesmo tempo; até LLM_FILA_MAXIMA pedidos esperam vaga por LLM_PRAZO_FILA
+# segundos, e os demais recebem a resposta degradada na hora.
+LLM_MAX_CONCORRENTES = int(os.getenv("LLM_MAX_CONCORRENTES", 4))
+LLM_FILA_MAXIMA = int(os.getenv("LLM_FILA_MAXIMA", 16))
+LLM_PRAZO_FILA = 10
+
+# Pré-geração das recomendações (`manage.py pregerar_recomendacoes`): usuários
+# ativos nos últimos PREGERACAO_DIAS dias, entre as horas PREGERACAO_JANELA
+# (hora local, fim exclusivo), com orçamento de usuários e de chamadas à IA
+# por rodada.
+PREGERACAO_DIAS = 7
+PREGERACAO_JANELA = (2, 6)
+PREGERACAO_MAX_USUARIOS = 100
+PREGERACAO_MAX_CHAMADAS = 50
+PREGERACAO_CONCORRENCIA = 4
+
+# Upload do histórico (core.historico): só os primeiros HISTORICO_LOTES_TMDB
+# lotes de 500 linhas buscam no TMDb os títulos desconhecidos (até 10 s por
+# lote); arquivos maiores vão completos pelo comando `importar_historico`.
+HISTORICO_LOTES_TMDB = 2
+
+# Catálogo local de busca (SQLite FTS5), criado por `manage.py importar_catalogo`.
+# Sem o arquivo, buscar_filme consulta o TMDb como antes.
+CATALOGO_PATH = os.getenv("CATALOGO_PATH", BASE_DIR / "catalogo.sqlite3")
+
+# Proxy de pôsteres (core.posters): imagens do TMDb, baixadas na largura pedida
+# e guardadas em disco, servidas em /imagens/. Acima de POSTERS_MAX_BYTES, as
+# usadas há mais tempo são apagadas.
+POSTERS_DIR = os.getenv("POSTERS_DIR", BASE_DIR / "media" / "posters")
+POSTERS_MAX_BYTES = int(os.getenv("POSTERS_MAX_BYTES", 500 * 1024 * 1024))
+TMDB_IMAGENS_URL = "https://image.tmdb.org/t/p"
+
+# Top-K da filtragem colaborativa, gravado por `manage.py treinar_colaborativo`.
+COLABORATIVO_DIR = os.getenv("COLABORATIVO_DIR", BASE_DIR / "modelos" / "colaborativo")
+
+# /metrics (formato do Prometheus) aceita staff logado ou este token em
+# "Authorization: Bearer <token>", para o coletor.
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN", "")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "simples": {"format": "%(asctime)s %(levelname)s %(name)s: %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "simples"},
+    },
+    "loggers": {
+        "core": {"handlers": ["console"], "level": os.getenv("LOG_LEVEL", "INFO")},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
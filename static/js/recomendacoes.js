@@ -0,0 +1,28 @@
+// Cards de recomendação montados no navegador (streaming e fila de tarefas).
+// Mesmo markup de templates/recomendacoes.html.
+
+function escapar(texto) {
+  const div = document.createElement('div');
+  div.textContent = texto || '';
+  return div.innerHTML;
+}
+
+function cardFilme(filme) {
+  return `
+    <div class="col">
+      <div class="card h-100 shadow-sm">
+        <img src="${escapar(filme.poster)}" ${filme.poster_srcset ? `srcset="${escapar(filme.poster_srcset)}"
+             sizes="(min-width: 992px) 33vw, (min-width: 768px) 50vw, 100vw"` : ''}
+             loading="lazy" class="card-img-top" alt="${escapar(filme.titulo)}">
+        <div class="card-body d-flex flex-column">
+          <h5 class="card-title">${escapar(filme.titulo)} (${escapar(filme.ano)})</h5>
+          <p class="card-text flex-grow-1">${escapar(filme.sinopse)}</p>
+          ${filme.motivo ? `<p class="card-text small text-muted fst-italic">${escapar(filme.motivo)}</p>` : ''}
+          <div class="mt-2">
+            <a href="${escapar(filme.link)}" target="_blank" class="btn btn-outline-primary btn-sm">Ver no IMDb</a>
+            <a href="/marcar-assistido/${encodeURIComponent(filme.titulo)}/" class="btn btn-outline-success btn-sm">Marcar como assistido</a>
+          </div>
+        </div>
+      </div>
+    </div>`;
+}